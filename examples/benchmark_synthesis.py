@@ -0,0 +1,149 @@
+"""Compare the throughput and peak memory use of synthesizing in double and
+single precision.
+
+Each precision is benchmarked in a separate process, so that the peak resident
+set size reported for one is not inflated by the other.  Without a MIDI file,
+random multi-instrument pieces are generated, one without pitch bends (the
+common case) and one with them.
+"""
+
+from __future__ import print_function
+import argparse
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+import pretty_midi
+
+
+def random_midi(n_instruments, n_notes, duration, n_bends=0, seed=0):
+    '''
+    Generate a random piece of music.
+
+    Parameters
+    ----------
+    n_instruments : int
+        Number of instruments
+    n_notes : int
+        Number of notes per instrument
+    duration : float
+        Length of the piece, in seconds
+    n_bends : int
+        Number of pitch bends per instrument
+    seed : int
+        Seed for the random number generator
+
+    Returns
+    -------
+    midi_object : pretty_midi.PrettyMIDI
+        The generated piece
+    '''
+    rng = np.random.RandomState(seed)
+    midi_object = pretty_midi.PrettyMIDI()
+    for program in range(n_instruments):
+        instrument = pretty_midi.Instrument(program)
+        starts = np.sort(rng.uniform(0, duration - 1, n_notes))
+        for start in starts:
+            instrument.notes.append(pretty_midi.Note(
+                rng.randint(40, 120), rng.randint(36, 96), start,
+                start + rng.uniform(.05, 1.)))
+        for time in np.sort(rng.uniform(0, duration, n_bends)):
+            instrument.pitch_bends.append(pretty_midi.PitchBend(
+                rng.randint(-8192, 8192), time))
+        midi_object.instruments.append(instrument)
+    return midi_object
+
+
+def peak_rss():
+    '''
+    Peak resident set size of the current process, in megabytes.
+    '''
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return maxrss/(1024.**2 if sys.platform == 'darwin' else 1024.)
+
+
+def run(parameters):
+    '''
+    Synthesize once with the requested settings and print the elapsed time,
+    the number of samples and the peak resident set size.
+    '''
+    if parameters['midi_file'] is None:
+        midi_object = random_midi(parameters['instruments'],
+                                  parameters['notes'],
+                                  parameters['duration'],
+                                  parameters['bends'])
+    else:
+        midi_object = pretty_midi.PrettyMIDI(parameters['midi_file'])
+    dtype = np.dtype(parameters['dtype'])
+    start = time.time()
+    if parameters['method'] == 'fluidsynth':
+        synthesized = midi_object.fluidsynth(fs=parameters['fs'],
+                                             dtype=dtype)
+    else:
+        synthesized = midi_object.synthesize(
+            fs=parameters['fs'], wavetable_size=parameters['wavetable_size'],
+            dtype=dtype)
+    elapsed = time.time() - start
+    print(elapsed, synthesized.shape[0], peak_rss())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark synthesis in double and single precision.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('midi_file', action='store', nargs='?', default=None,
+                        help='Path to the MIDI file to synthesize')
+    parser.add_argument('--method', default='synthesize', action='store',
+                        choices=['synthesize', 'fluidsynth'],
+                        help='Synthesis method to benchmark')
+    parser.add_argument('--fs', default=44100, type=int, action='store',
+                        help='Output sampling rate to use')
+    parser.add_argument('--wavetable-size', default=None, type=int,
+                        action='store', dest='wavetable_size',
+                        help='Wavetable size to use with synthesize')
+    parser.add_argument('--instruments', default=8, type=int,
+                        action='store',
+                        help='Number of instruments in the random piece')
+    parser.add_argument('--notes', default=2000, type=int, action='store',
+                        help='Number of notes per instrument in the random '
+                        'piece')
+    parser.add_argument('--duration', default=300., type=float,
+                        action='store',
+                        help='Length in seconds of the random piece')
+    parser.add_argument('--bends', default=500, type=int, action='store',
+                        help='Number of pitch bends per instrument in the '
+                        'random piece with pitch bends')
+    parser.add_argument('--dtype', default=None, action='store',
+                        help=argparse.SUPPRESS)
+
+    # Parse command line arguments
+    parameters = vars(parser.parse_args(sys.argv[1:]))
+    if parameters['dtype'] is not None:
+        # Benchmark a single precision in this process
+        run(parameters)
+        sys.exit(0)
+    if parameters['midi_file'] is None:
+        cases = [('Random piece without pitch bends', 0),
+                 ('Random piece with pitch bends', parameters['bends'])]
+    else:
+        cases = [(parameters['midi_file'], 0)]
+    for name, n_bends in cases:
+        print(name)
+        results = {}
+        for dtype in ['float64', 'float32']:
+            print("  Synthesizing in {} ...".format(dtype))
+            output = subprocess.check_output(
+                [sys.executable, __file__] + sys.argv[1:] +
+                ['--dtype', dtype, '--bends', str(n_bends)])
+            elapsed, n_samples, rss = [
+                float(value) for value in output.decode().split()[-3:]]
+            results[dtype] = (elapsed, n_samples, rss)
+            print("    {:.2f} s, {:.2f} Msamples/s, peak RSS {:.1f} "
+                  "MB".format(elapsed, n_samples/elapsed/1e6, rss))
+        speedup = results['float64'][0]/results['float32'][0]
+        saving = 1 - results['float32'][2]/results['float64'][2]
+        print("  float32 is {:.2f}x as fast and uses {:.0%} less "
+              "memory".format(speedup, saving))
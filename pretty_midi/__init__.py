@@ -116,6 +116,62 @@ Further examples can be found in the source tree's `examples directory
    :members:
    :undoc-members:
 
+``pretty_midi.NoteIndex``
+=========================
+
+.. autoclass:: NoteIndex
+   :members:
+   :undoc-members:
+
+``pretty_midi.EventList``
+=========================
+
+.. autoclass:: EventList
+   :members:
+   :undoc-members:
+
+``pretty_midi.EventTokenizer``
+==============================
+
+.. autoclass:: EventTokenizer
+   :members:
+   :undoc-members:
+
+``pretty_midi.NoteTableWriter``
+===============================
+
+.. autoclass:: NoteTableWriter
+   :members:
+   :undoc-members:
+
+``pretty_midi.NoteTable``
+=========================
+
+.. autoclass:: NoteTable
+   :members:
+   :undoc-members:
+
+``pretty_midi.PianoRollStore``
+==============================
+
+.. autoclass:: PianoRollStore
+   :members:
+   :undoc-members:
+
+``pretty_midi.PrettyMIDIBuilder``
+=================================
+
+.. autoclass:: PrettyMIDIBuilder
+   :members:
+   :undoc-members:
+
+``pretty_midi.FluidSynthRenderer``
+==================================
+
+.. autoclass:: FluidSynthRenderer
+   :members:
+   :undoc-members:
+
 Utility functions
 =================
 .. autofunction:: key_number_to_key_name
@@ -134,10 +190,18 @@ Utility functions
 .. autofunction:: program_to_instrument_class
 .. autofunction:: pitch_bend_to_semitones
 .. autofunction:: semitones_to_pitch_bend
+.. autofunction:: estimate_tempi_batch
+.. autofunction:: build_piano_roll_store
+.. autofunction:: render_corpus
 """
 from .pretty_midi import *
 from .instrument import *
 from .containers import *
+from .note_index import *
+from .tokenizer import *
+from .corpus import *
+from .builder import *
+from .rendering import *
 from .utilities import *
 from .constants import *
 
@@ -0,0 +1,175 @@
+"""The PrettyMIDIBuilder class builds a ``PrettyMIDI`` object incrementally
+from a stream of MIDI messages, e.g. from a live input port.
+
+"""
+import numpy as np
+
+from .pretty_midi import PrettyMIDI, _InstrumentLoader
+from .containers import KeySignature, TimeSignature, Lyric
+from .utilities import key_name_to_key_number
+
+
+class PrettyMIDIBuilder(object):
+    """Builds a ``PrettyMIDI`` object from MIDI messages which are added one
+    at a time or in batches, so that it is always up to date with the
+    messages added so far.
+
+    Notes are paired and sorted into instruments in the same way as when
+    loading a MIDI file, treating all messages as being on a single track.
+    Tempo changes extend the tempo map as they arrive.
+
+    Parameters
+    ----------
+    resolution : int
+        Resolution of the MIDI data, in ticks per quarter note.  Used to
+        interpret message times given in ticks.
+    initial_tempo : float
+        Tempo to use until the first tempo change message.
+    retention : float
+        If not ``None``, only keep notes which ended, and pitch bends,
+        control changes and lyrics which occurred, at most this many seconds
+        before the latest message, so that memory use stays bounded when
+        building from an endless stream.  Tempo changes before then are
+        merged into a single tempo which reaches the last of them at the same
+        time.  Time and key signature changes are always kept.
+
+    Examples
+    --------
+    Keep a ``PrettyMIDI`` object of the last 30 seconds played on a MIDI
+    input port up to date:
+
+    >>> builder = PrettyMIDIBuilder(retention=30.)
+    >>> start = time.time()
+    >>> with mido.open_input() as port:
+    ...     for message in port:
+    ...         builder.add(message, time.time() - start)
+
+    """
+
+    def __init__(self, resolution=220, initial_tempo=120., retention=None):
+        self._midi_data = PrettyMIDI(resolution=resolution,
+                                     initial_tempo=initial_tempo)
+        self.retention = retention
+        self._loader = _InstrumentLoader(self._midi_data.instruments)
+        # Tick and time of the latest message
+        self._tick = 0
+        self._time = 0.
+        # Time of the start of the latest tempo
+        self._tempo_start_time = 0.
+
+    @property
+    def midi_data(self):
+        """The ``PrettyMIDI`` object holding the messages added so far.  It
+        is the same object for the lifetime of the builder, and is updated in
+        place as messages are added.
+
+        """
+        # Its tick-to-time mapping is never extended, as times past its end
+        # are computed from the tempo changes
+        return self._midi_data
+
+    def _tick_to_time(self, tick):
+        """Converts a tick to a time in seconds using the tempo map."""
+        tempo_start_tick, tick_scale = self._midi_data._tick_scales[-1]
+        return self._tempo_start_time + (tick - tempo_start_tick)*tick_scale
+
+    def _time_to_tick(self, time):
+        """Converts a time in seconds to the nearest tick using the tempo
+        map."""
+        tempo_start_tick, tick_scale = self._midi_data._tick_scales[-1]
+        return tempo_start_tick + int(round(
+            (time - self._tempo_start_time)/tick_scale))
+
+    def add(self, message, time=None):
+        """Adds a single message.
+
+        Parameters
+        ----------
+        message : mido.Message or mido.MetaMessage
+            The message.
+        time : float
+            Absolute time of the message, in seconds.  Default ``None``,
+            which uses ``message.time`` as the number of ticks since the
+            previous message, as in the tracks of a ``mido.MidiFile``.
+
+        """
+        if time is None:
+            tick = self._tick + message.time
+            time = self._tick_to_time(tick)
+        else:
+            if time < self._time:
+                raise ValueError('Messages must be added in time order, but '
+                                 'a message at {} was added after one at '
+                                 '{}.'.format(time, self._time))
+            tick = self._time_to_tick(time)
+        self._tick, self._time = tick, time
+        midi_data = self._midi_data
+        # Handle tempo changes as when loading a MIDI file
+        if message.type == 'set_tempo':
+            tick_scale = 60.0/((6e7/message.tempo)*midi_data.resolution)
+            if tick == 0:
+                midi_data._tick_scales = [(0, tick_scale)]
+            elif tick_scale != midi_data._tick_scales[-1][1]:
+                self._tempo_start_time = self._tick_to_time(tick)
+                midi_data._tick_scales.append((tick, tick_scale))
+        elif message.type == 'key_signature':
+            midi_data.key_signature_changes.append(KeySignature(
+                key_name_to_key_number(message.key), time))
+        elif message.type == 'time_signature':
+            midi_data.time_signature_changes.append(TimeSignature(
+                message.numerator, message.denominator, time))
+        elif message.type == 'lyrics':
+            midi_data.lyrics.append(Lyric(message.text, time))
+        else:
+            self._loader.add(message, 0, tick, time)
+        if self.retention is not None:
+            self._discard_before(time - self.retention)
+
+    def extend(self, messages, times=None):
+        """Adds several messages.
+
+        Parameters
+        ----------
+        messages : iterable of mido.Message or mido.MetaMessage
+            The messages.
+        times : iterable of float
+            Absolute time of each message, in seconds.  Default ``None``,
+            which uses the ``time`` attribute of each message as the number
+            of ticks since the previous message.
+
+        """
+        if times is None:
+            for message in messages:
+                self.add(message)
+        else:
+            for message, time in zip(messages, times):
+                self.add(message, time)
+
+    def _discard_before(self, time):
+        """Discards notes which ended, and pitch bends, control changes and
+        lyrics which occurred, before ``time``.  These are added in time
+        order, so only the start of each list needs to be checked.
+
+        """
+        def discard(events, get_time):
+            n = 0
+            while n < len(events) and get_time(events[n]) < time:
+                n += 1
+            if n > 0:
+                del events[:n]
+
+        # Stragglers hold events for instruments which have no notes yet
+        for instrument in (list(self._midi_data.instruments) +
+                           list(self._loader.stragglers.values())):
+            discard(instrument.notes, lambda note: note.end)
+            discard(instrument.pitch_bends, lambda bend: bend.time)
+            discard(instrument.control_changes, lambda cc: cc.time)
+        discard(self._midi_data.lyrics, lambda lyric: lyric.time)
+        # Merge the tempo changes before time into one, from tick 0 to the
+        # last of them, so that the tempo map is bounded too
+        tick_scales = self._midi_data._tick_scales
+        change_times = self._midi_data._get_tick_scale_times()
+        n = np.searchsorted(change_times, time, side='right') - 1
+        if n >= 2:
+            tick_scales[:n] = [(0, change_times[n]/tick_scales[n][0])]
+            self._midi_data._reset_tick_to_time()
@@ -3,10 +3,388 @@
 """
 from __future__ import print_function
 
+import collections
+import copy
+import functools
+import itertools
+
+import numpy as np
+
 from .utilities import key_number_to_key_name
 
+# Source of version stamps.  Stamps are unique and increasing, so a cached
+# result which records the stamps it was computed from is stale as soon as
+# any of them differs.
+_version_stamps = itertools.count(1)
+
+# Types of attribute values which deep copies of tracked objects can share
+_IMMUTABLE_TYPES = frozenset([type(None), bool, int, float, str, bytes,
+                              type(u''), np.bool_, np.int32, np.int64,
+                              np.float32, np.float64])
+
+
+class _Tracked(object):
+    """Base class for objects whose attributes analysis results are cached
+    on.  Reassigning an attribute of an existing object (e.g. ``note.pitch +=
+    5``) records a new version stamp on the :class:`pretty_midi.EventList`
+    which holds it, which invalidates the results cached on the object which
+    owns that list.  Objects held by more than one ``EventList`` record the
+    stamp in ``_Tracked.last_edit`` instead, which invalidates all cached
+    results.
+
+    """
+    #: Version stamp of the most recent in-place edit of a tracked object
+    #: held by more than one EventList
+    last_edit = 0
+
+    def __setattr__(self, name, value):
+        # Setting attributes for the first time (i.e. in __init__) is not an
+        # edit of existing data, and private attributes only hold internal
+        # state (such as caches) which is derived from the public data
+        if name in self.__dict__ and name[0] != '_':
+            owner = self.__dict__.get('_owner')
+            if owner is _SHARED:
+                _Tracked.last_edit = next(_version_stamps)
+            elif owner is not None:
+                owner.version = next(_version_stamps)
+            # Results cached on the object itself depend on its attributes
+            self.__dict__.pop('_cache', None)
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Copies are not held by the original's EventList; the EventList
+        # holding a copy (if any) adopts it as it is filled
+        state.pop('_owner', None)
+        return state
+
+    def __deepcopy__(self, memo):
+        # Equivalent to the default deep copy, but much faster for events,
+        # whose attributes are almost always immutable numbers
+        copied = self.__class__.__new__(self.__class__)
+        memo[id(self)] = copied
+        for name, value in self.__getstate__().items():
+            if type(value) not in _IMMUTABLE_TYPES:
+                value = copy.deepcopy(value, memo)
+            copied.__dict__[name] = value
+        return copied
+
+
+# Owner of tracked objects which have been added to more than one EventList
+_SHARED = object()
+
+
+def _adopt(event_list, items):
+    """Records ``event_list`` as the owner of the tracked objects in
+    ``items``, or marks them as shared if they are already held by another
+    list."""
+    for item in items:
+        if isinstance(item, _Tracked):
+            owner = item.__dict__.get('_owner')
+            if owner is None:
+                item.__dict__['_owner'] = event_list
+            elif owner is not event_list:
+                item.__dict__['_owner'] = _SHARED
+
+
+def _disown(event_list):
+    """Forgets that ``event_list`` owns its objects, when it is no longer
+    held by any object."""
+    for item in event_list:
+        if (isinstance(item, _Tracked) and
+                item.__dict__.get('_owner') is event_list):
+            del item.__dict__['_owner']
+
+
+class EventList(list):
+    """A list which records a new version stamp in its ``version`` attribute
+    whenever it, or any of the tracked objects it holds, is modified.  Lists
+    of events held by :class:`pretty_midi.PrettyMIDI` and
+    :class:`pretty_midi.Instrument` are stored as ``EventList`` instances so
+    that cached analysis results can be invalidated when the lists change.
+
+    """
+    # Number of list attributes of objects which hold this list
+    _holders = 0
+
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self.version = next(_version_stamps)
+        _adopt(self, self)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Version stamps from another process may collide with those of
+        # results cached in this one
+        self.version = next(_version_stamps)
+
+    def append(self, item):
+        self.version = next(_version_stamps)
+        _adopt(self, (item,))
+        list.append(self, item)
+
+    def insert(self, index, item):
+        self.version = next(_version_stamps)
+        _adopt(self, (item,))
+        list.insert(self, index, item)
+
+    def extend(self, items):
+        self.version = next(_version_stamps)
+        items = list(items)
+        _adopt(self, items)
+        list.extend(self, items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __setitem__(self, index, value):
+        self.version = next(_version_stamps)
+        if isinstance(index, slice):
+            value = list(value)
+            _adopt(self, value)
+        else:
+            _adopt(self, (value,))
+        list.__setitem__(self, index, value)
+
+    if hasattr(list, '__setslice__'):
+        # Python 2 assigns to simple slices with __setslice__
+        def __setslice__(self, start, stop, items):
+            self.__setitem__(slice(start, stop), items)
+
+
+def _record_change(method):
+    """Wraps a ``list`` method so that it updates ``EventList.version``."""
+    def wrapper(self, *args, **kwargs):
+        self.version = next(_version_stamps)
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+# Methods which add items are defined above, so that the items are adopted.
+# Removed items are not disowned, as they may still be in the list; editing
+# them afterwards at worst invalidates results needlessly.
+for _name in ['remove', 'pop', 'clear', 'sort', 'reverse', '__delitem__',
+              '__imul__', '__delslice__']:
+    if hasattr(list, _name):
+        setattr(EventList, _name, _record_change(getattr(list, _name)))
+
+
+def _event_list_property(name):
+    """Creates a property which stores any list assigned to it as an
+    :class:`pretty_midi.EventList` in the attribute ``'_' + name``.
 
-class Note(object):
+    """
+    attribute = '_' + name
+
+    def getter(self):
+        return self.__dict__[attribute]
+
+    def setter(self, value):
+        if not isinstance(value, EventList):
+            value = EventList(value)
+        else:
+            _adopt(value, value)
+        value._holders += 1
+        replaced = self.__dict__.get(attribute)
+        self.__dict__[attribute] = value
+        # The replaced list may still be held by another object (e.g. after
+        # ``b.notes = a.notes``), whose cached results its edits invalidate
+        if replaced is not None:
+            replaced._holders -= 1
+            if replaced._holders <= 0:
+                _disown(replaced)
+
+    return property(getter, setter)
+
+
+def _copy_result(result):
+    """Copies the arrays in a cached result, so that callers may modify what
+    they are given without corrupting the cache."""
+    if isinstance(result, np.ndarray):
+        return result.copy()
+    if isinstance(result, tuple):
+        return tuple(_copy_result(r) for r in result)
+    return result
+
+
+def _memoize(shared=False, large=False):
+    """Creates a decorator which memoizes the results of a method of a
+    :class:`pretty_midi.containers._Memoized` subclass.
+
+    Results are keyed by the method's arguments and are discarded when the
+    object's version changes.  When more than ``cache_size`` results are
+    stored, the least recently used one is evicted.  Calls with unhashable
+    arguments (e.g. a ``times`` array) are not cached.
+
+    Parameters
+    ----------
+    shared : bool
+        If ``True``, the same read-only arrays are returned from every call.
+        Otherwise, a copy of the cached result is returned.
+    large : bool
+        If ``True``, results are only cached when the object's
+        ``cache_large_results`` is ``True``, as they may use a lot of memory.
+
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.cache_size <= 0 or (large and
+                                        not self.cache_large_results):
+                return method(self, *args, **kwargs)
+            key = (method.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                return method(self, *args, **kwargs)
+            version = self._get_version()
+            cache = self.__dict__.get('_cache')
+            if cache is None or self._cache_version != version:
+                cache = self._cache = collections.OrderedDict()
+                self._cache_version = version
+            if key in cache:
+                # Move the result to the end, as the most recently used
+                result = cache.pop(key)
+            else:
+                result = method(self, *args, **kwargs)
+                if shared:
+                    for array in (result if isinstance(result, tuple)
+                                  else (result,)):
+                        if isinstance(array, np.ndarray):
+                            array.flags.writeable = False
+            cache[key] = result
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+            return result if shared else _copy_result(result)
+        return wrapper
+    return decorator
+
+
+# Order of events of different types which occur at the same time, as used
+# when writing MIDI files
+_EVENT_PRIORITIES = {'set_tempo': 1, 'time_signature': 2, 'key_signature': 3,
+                     'lyrics': 4, 'pitchwheel': 6, 'control_change': 7,
+                     'note_off': 8, 'note_on': 9}
+
+
+def _iter_sorted_events(events, times, order, start, end, kind, stream,
+                        get_values):
+    """Generates the events of one type whose time is in ``[start, end)``, in
+    time order, as tuples which can be merged with ``heapq.merge``.
+
+    Parameters
+    ----------
+    events : list
+        The events.
+    times : np.ndarray
+        Sorted event times.
+    order : np.ndarray
+        Index in ``events`` of the event with each of the sorted times.
+    start, end : float or None
+        Time range, unbounded if ``None``.
+    kind : str
+        Event type, one of the keys of ``_EVENT_PRIORITIES``.
+    stream : int
+        Number which is unique among the merged streams.
+    get_values : function
+        Maps an event to a tuple of its two values.
+
+    Yields
+    ------
+    event : tuple
+        ``(time, priority, stream, index, kind, value1, value2)``.  The
+        ``(stream, index)`` pair is unique, so events are never compared past
+        it.
+
+    """
+    first = 0 if start is None else np.searchsorted(times, start)
+    last = times.shape[0] if end is None else np.searchsorted(times, end)
+    priority = _EVENT_PRIORITIES[kind]
+    for index, time in enumerate(times[first:last].tolist(), first):
+        yield (time, priority, stream, index, kind) + \
+            get_values(events[order[index]])
+
+
+def _window(events, order, times, start, end, carry=True):
+    """Returns the event in effect at ``start`` (or ``None``) and the list of
+    the other events in ``[start, end)``, given their sorted order and times.
+
+    The event in effect is the last one at or before ``start``, so the
+    events exactly at ``start`` are not also returned in the list, where
+    they would conflict with it.  If ``carry`` is ``False``, no event is in
+    effect and all the events in ``[start, end)`` are returned.
+
+    """
+    first = np.searchsorted(times, start, side='right' if carry else 'left')
+    last = np.searchsorted(times, end)
+    active = events[order[first - 1]] if carry and first > 0 else None
+    return active, [events[n] for n in order[first:last]]
+
+
+def _moved(event, time):
+    """Returns ``event``, or a copy of it moved to ``time`` if it needs to
+    be."""
+    if time == event.time:
+        return event
+    event = copy.copy(event)
+    event.__dict__['time'] = time
+    return event
+
+
+class _Memoized(_Tracked):
+    """Base class for objects with memoized analysis methods.  Subclasses
+    implement ``_get_version``, which returns a value which changes whenever
+    any data the memoized methods depend on changes.
+
+    """
+    #: Maximum number of memoized results stored per object.  Set to 0 to
+    #: disable memoization.
+    cache_size = 16
+    #: Whether to also memoize results which may use a lot of memory, such as
+    #: piano rolls
+    cache_large_results = False
+
+    def _get_version(self):
+        raise NotImplementedError
+
+    def clear_cache(self):
+        """Discard all memoized analysis results."""
+        self.__dict__.pop('_cache', None)
+
+    @_memoize(shared=True)
+    def _get_event_order(self, name):
+        """Sorts the timed events in a list attribute by time.
+
+        Parameters
+        ----------
+        name : str
+            Name of the attribute, e.g. ``'pitch_bends'``.
+
+        Returns
+        -------
+        order : np.ndarray
+            Indices which (stably) sort the events by time.
+        times : np.ndarray
+            Sorted event times.
+
+        """
+        times = np.array([e.time for e in getattr(self, name)],
+                         dtype=np.float64)
+        order = np.argsort(times, kind='mergesort')
+        return order, times[order]
+
+    def __getstate__(self):
+        state = super(_Memoized, self).__getstate__()
+        # Cached results are only valid for the version stamps of this process
+        state.pop('_cache', None)
+        state.pop('_cache_version', None)
+        return state
+
+
+class Note(_Tracked):
     """A note event.
 
     Parameters
@@ -23,10 +401,10 @@ class Note(object):
     """
 
     def __init__(self, velocity, pitch, start, end):
-        self.velocity = velocity
-        self.pitch = pitch
-        self.start = start
-        self.end = end
+        # Notes are created in bulk when loading files, so set the initial
+        # values directly rather than going through _Tracked.__setattr__
+        self.__dict__.update(
+            velocity=velocity, pitch=pitch, start=start, end=end)
 
     def get_duration(self):
         """Get the duration of the note in seconds."""
@@ -37,7 +415,7 @@ class Note(object):
             self.start, self.end, self.pitch, self.velocity)
 
 
-class PitchBend(object):
+class PitchBend(_Tracked):
     """A pitch bend event.
 
     Parameters
@@ -50,14 +428,14 @@ class PitchBend(object):
     """
 
     def __init__(self, pitch, time):
-        self.pitch = pitch
-        self.time = time
+        # Set the initial values directly, as for Note
+        self.__dict__.update(pitch=pitch, time=time)
 
     def __repr__(self):
         return 'PitchBend(pitch={:d}, time={:f})'.format(self.pitch, self.time)
 
 
-class ControlChange(object):
+class ControlChange(_Tracked):
     """A control change event.
 
     Parameters
@@ -72,16 +450,15 @@ class ControlChange(object):
     """
 
     def __init__(self, number, value, time):
-        self.number = number
-        self.value = value
-        self.time = time
+        # Set the initial values directly, as for Note
+        self.__dict__.update(number=number, value=value, time=time)
 
     def __repr__(self):
         return ('ControlChange(number={:d}, value={:d}, '
                 'time={:f})'.format(self.number, self.value, self.time))
 
 
-class TimeSignature(object):
+class TimeSignature(_Tracked):
     """Container for a Time Signature event, which contains the time signature
     numerator, denominator and the event time in seconds.
 
@@ -130,7 +507,7 @@ class TimeSignature(object):
             self.numerator, self.denominator, self.time)
 
 
-class KeySignature(object):
+class KeySignature(_Tracked):
     """Contains the key signature and the event time in seconds.
     Only supports major and minor keys.
 
@@ -174,7 +551,7 @@ class KeySignature(object):
             key_number_to_key_name(self.key_number), self.time)
 
 
-class Lyric(object):
+class Lyric(_Tracked):
     """Timestamped lyric text.
 
     Attributes
@@ -0,0 +1,578 @@
+"""Utilities for storing the contents of many MIDI files in a form which can be
+memory-mapped, instead of re-parsing the MIDI files.
+
+"""
+import os
+import collections
+import json
+import time
+import hashlib
+import itertools
+import multiprocessing
+
+import numpy as np
+import six
+
+from .pretty_midi import PrettyMIDI
+from .instrument import Instrument
+from .containers import Note
+from .rendering import FluidSynthRenderer
+
+# Columns of the note table and their data types
+_NOTE_TABLE_COLUMNS = [('file_id', np.int64), ('instrument', np.int32),
+                       ('program', np.int16), ('is_drum', np.bool_),
+                       ('pitch', np.int16), ('velocity', np.int16),
+                       ('start', np.float64), ('end', np.float64)]
+
+
+def _column_path(path, column, chunk):
+    """Returns the path of a column file of a note table."""
+    return os.path.join(path, '{}.{:05d}.npy'.format(column, chunk))
+
+
+class NoteTableWriter(object):
+    """Writes the notes of many ``PrettyMIDI`` objects into a columnar note
+    table on disk, which can be read with :class:`pretty_midi.NoteTable`.
+
+    Each row of the table is one note, with the columns ``file_id``,
+    ``instrument`` (index in ``PrettyMIDI.instruments``), ``program``,
+    ``is_drum``, ``pitch``, ``velocity``, ``start`` and ``end``.  Rows are
+    buffered and written as one ``.npy`` file per column per chunk, so only a
+    single chunk is ever held in memory.  The notes of a file are never split
+    between chunks.
+
+    Parameters
+    ----------
+    path : str
+        Directory to write the table into.  It is created if it doesn't
+        exist.
+    chunk_size : int
+        Number of rows after which the buffered rows are written out as a
+        chunk.
+
+    Examples
+    --------
+    >>> with NoteTableWriter('corpus') as writer:
+    ...     for filename in filenames:
+    ...         writer.add(pretty_midi.PrettyMIDI(filename))
+
+    """
+
+    def __init__(self, path, chunk_size=1000000):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._buffered_rows = 0
+        self._n_chunks = 0
+        # Chunk, first row in the chunk and number of rows of each file
+        self._files = []
+
+    def add(self, midi_data):
+        """Adds the notes of a ``PrettyMIDI`` object to the table.
+
+        Parameters
+        ----------
+        midi_data : pretty_midi.PrettyMIDI
+            MIDI data to add.
+
+        Returns
+        -------
+        file_id : int
+            Id of the file in the table, which are assigned consecutively
+            from 0.
+
+        """
+        file_id = len(self._files)
+        columns = dict((name, []) for name, _ in _NOTE_TABLE_COLUMNS)
+        for n, instrument in enumerate(midi_data.instruments):
+            n_notes = len(instrument.notes)
+            columns['instrument'].append(np.full(n_notes, n))
+            columns['program'].append(np.full(n_notes, instrument.program))
+            columns['is_drum'].append(np.full(n_notes, instrument.is_drum))
+            note_data = np.array(
+                [[note.pitch, note.velocity, note.start, note.end]
+                 for note in instrument.notes]).reshape(-1, 4)
+            for m, name in enumerate(['pitch', 'velocity', 'start', 'end']):
+                columns[name].append(note_data[:, m])
+        n_rows = sum(column.shape[0] for column in columns['instrument'])
+        columns['file_id'].append(np.full(n_rows, file_id))
+        self._buffer.append(dict(
+            (name, np.concatenate(columns[name]).astype(dtype)
+             if len(columns[name]) > 0 else np.zeros(0, dtype))
+            for name, dtype in _NOTE_TABLE_COLUMNS))
+        self._files.append((self._n_chunks, self._buffered_rows, n_rows))
+        self._buffered_rows += n_rows
+        if self._buffered_rows >= self.chunk_size:
+            self.flush()
+        return file_id
+
+    def flush(self):
+        """Writes the buffered rows out as a chunk."""
+        if not self._buffer:
+            return
+        for name, _ in _NOTE_TABLE_COLUMNS:
+            np.save(_column_path(self.path, name, self._n_chunks),
+                    np.concatenate([rows[name] for rows in self._buffer]))
+        self._buffer = []
+        self._buffered_rows = 0
+        self._n_chunks += 1
+
+    def close(self):
+        """Writes any buffered rows and the index of the table."""
+        self.flush()
+        np.save(os.path.join(self.path, 'files.npy'),
+                np.array(self._files, dtype=np.int64).reshape(-1, 3))
+        with open(os.path.join(self.path, 'index.json'), 'w') as f:
+            json.dump({'n_chunks': self._n_chunks,
+                       'columns': [name for name, _ in _NOTE_TABLE_COLUMNS]},
+                      f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class NoteTable(object):
+    """Reads a note table written by :class:`pretty_midi.NoteTableWriter`.
+
+    Column files are memory-mapped, so only the rows which are accessed are
+    read from disk.
+
+    Parameters
+    ----------
+    path : str
+        Directory the table was written into.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        self.n_chunks = index['n_chunks']
+        self.columns = index['columns']
+        self._files = np.load(os.path.join(path, 'files.npy'))
+        self._chunks = {}
+
+    def __len__(self):
+        return self._files.shape[0]
+
+    def get_chunk(self, chunk):
+        """Get the columns of a chunk of the table.
+
+        Parameters
+        ----------
+        chunk : int
+            Index of the chunk, from 0 to ``n_chunks - 1``.
+
+        Returns
+        -------
+        columns : dict
+            Maps each column name to a memory-mapped ``np.ndarray``.
+
+        """
+        if chunk not in self._chunks:
+            self._chunks[chunk] = dict(
+                (name, np.load(_column_path(self.path, name, chunk),
+                               mmap_mode='r'))
+                for name in self.columns)
+        return self._chunks[chunk]
+
+    def iter_chunks(self):
+        """Iterates over the columns of each chunk of the table, as returned
+        by :func:`get_chunk`."""
+        for chunk in range(self.n_chunks):
+            yield self.get_chunk(chunk)
+
+    def get_notes(self, file_id):
+        """Get the rows of the table for a single file.
+
+        Parameters
+        ----------
+        file_id : int
+            Id of the file, as returned by
+            :func:`pretty_midi.NoteTableWriter.add`.
+
+        Returns
+        -------
+        columns : dict
+            Maps each column name to a (memory-mapped) ``np.ndarray`` of the
+            file's rows.
+
+        """
+        chunk, first, n_rows = self._files[file_id]
+        if n_rows == 0:
+            return dict((name, np.zeros(0, dtype))
+                        for name, dtype in _NOTE_TABLE_COLUMNS)
+        return dict((name, column[first:first + n_rows])
+                    for name, column in self.get_chunk(chunk).items())
+
+    def get_midi(self, file_id):
+        """Reconstructs a ``PrettyMIDI`` object from a file's rows.
+
+        Only the notes and the program and drum flag of the instruments which
+        have notes are stored in the table, so these are all which are
+        reconstructed.
+
+        Parameters
+        ----------
+        file_id : int
+            Id of the file, as returned by
+            :func:`pretty_midi.NoteTableWriter.add`.
+
+        Returns
+        -------
+        midi_data : pretty_midi.PrettyMIDI
+            The file's notes, in instruments ordered as in the original file.
+
+        """
+        notes = self.get_notes(file_id)
+        midi_data = PrettyMIDI()
+        # Rows are grouped by instrument, in order
+        _, firsts = np.unique(notes['instrument'], return_index=True)
+        bounds = np.append(firsts, notes['instrument'].shape[0])
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            instrument = Instrument(int(notes['program'][first]),
+                                    bool(notes['is_drum'][first]))
+            instrument.notes.extend(
+                Note(velocity, pitch, start, end)
+                for velocity, pitch, start, end in zip(
+                    *[notes[name][first:last].tolist()
+                      for name in ['velocity', 'pitch', 'start', 'end']]))
+            midi_data.instruments.append(instrument)
+        return midi_data
+
+
+def _compute_piano_roll(args):
+    """Computes the piano roll stored for one file by
+    :func:`build_piano_roll_store`, as a (frames, pitches) array."""
+    midi_data, fs, dtype, pitch_range = args
+    if isinstance(midi_data, six.string_types):
+        midi_data = PrettyMIDI(midi_data)
+    roll = midi_data.get_piano_roll(fs=fs)[pitch_range[0]:pitch_range[1]].T
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        roll = np.clip(roll, info.min, info.max)
+    return np.ascontiguousarray(roll, dtype=dtype)
+
+
+def _imap_bounded(pool, function, tasks, max_pending):
+    """Like ``pool.imap``, but only submits another task once fewer than
+    ``max_pending`` results are waiting to be consumed, so that results do
+    not pile up in memory when they are consumed slower than they are
+    computed."""
+    pending = collections.deque()
+    for task in tasks:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (task,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def _stop_pool(pool, failed=False):
+    """Waits for the workers of a pool (if any) to exit, or stops them
+    straight away if ``failed``, rather than waiting for the tasks still
+    queued."""
+    if pool is None:
+        return
+    if failed:
+        pool.terminate()
+    else:
+        pool.close()
+        pool.join()
+
+
+def build_piano_roll_store(path, midis, fs=100, dtype=np.uint8,
+                           pitch_range=(0, 128), n_jobs=None):
+    """Computes the piano rolls of many files and writes them all into one
+    file, which can be memory-mapped with :class:`pretty_midi.PianoRollStore`.
+
+    Parameters
+    ----------
+    path : str
+        Directory to write the store into.  It is created if it doesn't
+        exist.
+    midis : iterable
+        Filenames of MIDI files or ``PrettyMIDI`` objects.
+    fs : int
+        Sampling frequency of the piano roll columns, see
+        :func:`pretty_midi.PrettyMIDI.get_piano_roll`.
+    dtype : np.dtype
+        Data type to store the piano rolls as.  Values which don't fit in an
+        integer type are clipped.
+    pitch_range : tuple
+        Range ``(lowest, highest + 1)`` of the pitches to store.
+    n_jobs : int
+        Number of processes to compute piano rolls in.  Default ``None``,
+        which uses one per CPU.  If 1, everything is computed in this
+        process.
+
+    Returns
+    -------
+    store : pretty_midi.PianoRollStore
+        The written store.
+
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    dtype = np.dtype(dtype)
+    tasks = ((midi_data, fs, dtype, pitch_range) for midi_data in midis)
+    if n_jobs == 1:
+        pool = None
+        rolls = six.moves.map(_compute_piano_roll, tasks)
+    else:
+        pool = multiprocessing.Pool(n_jobs)
+        # Rolls are written in order as they are computed.  Files are only
+        # submitted as rolls are written, so that at most a few rolls per
+        # process are held in memory at once.
+        rolls = _imap_bounded(pool, _compute_piano_roll, tasks,
+                              4*(n_jobs or multiprocessing.cpu_count()))
+    offsets = [0]
+    try:
+        with open(os.path.join(path, 'rolls.dat'), 'wb') as f:
+            for roll in rolls:
+                roll.tofile(f)
+                offsets.append(offsets[-1] + roll.shape[0])
+    except BaseException:
+        _stop_pool(pool, failed=True)
+        raise
+    _stop_pool(pool)
+    np.save(os.path.join(path, 'offsets.npy'),
+            np.array(offsets, dtype=np.int64))
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump({'fs': fs, 'dtype': dtype.str,
+                   'pitch_range': list(pitch_range)}, f)
+    return PianoRollStore(path)
+
+
+class PianoRollStore(object):
+    """Reads piano rolls written by :func:`build_piano_roll_store`.
+
+    All piano rolls are stored one after the other in a single
+    memory-mapped file, with time as the slowest-varying axis, so getting a
+    file's piano roll or a time window of it takes constant time and only
+    reads the requested frames from disk.
+
+    Parameters
+    ----------
+    path : str
+        Directory the store was written into.
+
+    Attributes
+    ----------
+    fs : int
+        Sampling frequency of the piano roll columns.
+    pitch_range : tuple
+        Range ``(lowest, highest + 1)`` of the stored pitches.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        self.fs = index['fs']
+        self.pitch_range = tuple(index['pitch_range'])
+        self._offsets = np.load(os.path.join(path, 'offsets.npy'))
+        n_pitches = self.pitch_range[1] - self.pitch_range[0]
+        if self._offsets[-1] > 0:
+            self._rolls = np.memmap(
+                os.path.join(path, 'rolls.dat'), dtype=index['dtype'],
+                mode='r', shape=(self._offsets[-1], n_pitches))
+        else:
+            # Empty files can't be memory-mapped
+            self._rolls = np.zeros((0, n_pitches), dtype=index['dtype'])
+
+    def __len__(self):
+        return self._offsets.shape[0] - 1
+
+    def get_piano_roll(self, file_id, start=None, end=None):
+        """Get a file's piano roll, or a time window of it.
+
+        Parameters
+        ----------
+        file_id : int
+            Index of the file, in the order the files were given to
+            :func:`build_piano_roll_store`.
+        start : float
+            Start time of the window, in seconds.  Default ``None``, which
+            starts at the beginning of the piano roll.
+        end : float
+            End time of the window, in seconds.  Default ``None``, which
+            ends at the end of the piano roll.
+
+        Returns
+        -------
+        piano_roll : np.ndarray, shape=(n_pitches, n_frames)
+            Read-only view of the (windowed) piano roll, in the same layout
+            as :func:`pretty_midi.PrettyMIDI.get_piano_roll`.
+
+        """
+        first, last = self._offsets[file_id], self._offsets[file_id + 1]
+        if end is not None:
+            last = min(first + max(int(end*self.fs), 0), last)
+        if start is not None:
+            first = min(first + max(int(start*self.fs), 0), last)
+        return self._rolls[first:last].T
+
+
+# Renderer of each render_corpus worker process, whose synthesizers are kept
+# warm between files
+_corpus_renderer = None
+
+
+def _init_render_worker(sf2_path):
+    """Creates the renderer of a :func:`render_corpus` worker."""
+    global _corpus_renderer
+    _corpus_renderer = FluidSynthRenderer(sf2_path)
+
+
+def _render_corpus_file(args):
+    """Renders one file for :func:`render_corpus`, returning its manifest
+    record."""
+    midi_path, output_path, content_hash, settings = args
+    record = {'midi': midi_path, 'output': os.path.basename(output_path),
+              'hash': content_hash, 'time': None, 'error': None}
+    start_time = time.time()
+    try:
+        midi_data = PrettyMIDI(midi_path)
+        # Write to a temporary file first, so that an interrupted render
+        # never leaves a partial output behind
+        midi_data.render_to_wav(
+            output_path + '.tmp', method=settings['method'],
+            fs=settings['fs'], dtype=settings['dtype'],
+            gain=settings['gain'], renderer=_corpus_renderer)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        os.rename(output_path + '.tmp', output_path)
+    except Exception as e:
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+        if os.path.exists(output_path + '.tmp'):
+            os.remove(output_path + '.tmp')
+    record['time'] = time.time() - start_time
+    return record
+
+
+def render_corpus(midi_paths, path, method='fluidsynth', fs=44100,
+                  dtype='int16', gain=None, sf2_path=None, n_jobs=None):
+    """Renders many MIDI files to WAV files with
+    :func:`pretty_midi.PrettyMIDI.render_to_wav`, in parallel.
+
+    Each worker process keeps one :class:`pretty_midi.FluidSynthRenderer`,
+    so its synthesizer and soundfont are loaded once rather than for every
+    file.  Outputs are written as files finish, and a record of each file
+    is appended to ``manifest.jsonl`` in ``path`` with its output filename,
+    a hash of the MIDI file's contents and the render settings, the time
+    it took to render and the error it failed with, if any.  Files which
+    can't be read or rendered don't stop the others from being rendered.
+    Rendering the same files into the same directory again skips those whose
+    output exists and whose hash matches the manifest, so an interrupted
+    render can be resumed.
+
+    Parameters
+    ----------
+    midi_paths : iterable of str
+        Filenames of the MIDI files.  Each file's output is named after it,
+        with the extension ``.wav``, so the names must be unique.
+    path : str
+        Directory to write the WAV files and manifest into.  It is created
+        if it doesn't exist.
+    method : str
+        ``'fluidsynth'`` or ``'sine'``, see
+        :func:`pretty_midi.PrettyMIDI.render_to_wav`.
+    fs : int
+        Sampling rate to render at.
+    dtype : str
+        ``'int16'`` or ``'float32'``, the format of the samples.
+    gain : float
+        Factor to scale the samples by.  Default ``None``, which normalizes
+        each file to a peak of 1.
+    sf2_path : str
+        Path to a .sf2 file.  Default ``None``, which uses the TimGM6mb.sf2
+        file included with ``pretty_midi``.
+    n_jobs : int
+        Number of processes to render in.  Default ``None``, which uses one
+        per CPU.  If 1, everything is rendered in this process.
+
+    Returns
+    -------
+    records : list of dict
+        The manifest records of the files rendered by this call (not of
+        those skipped), with keys ``'midi'``, ``'output'``, ``'hash'``,
+        ``'time'`` and ``'error'``, in the order they finished.
+
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    settings = {'method': method, 'fs': fs, 'dtype': dtype, 'gain': gain,
+                'sf2_path': sf2_path}
+    manifest_path = os.path.join(path, 'manifest.jsonl')
+    # The latest record of each output, from previous renders
+    done = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Skip a record cut off by an interrupted render
+                    continue
+                done[record['output']] = record
+    tasks = []
+    # Records of the files which couldn't be read
+    failed = []
+    outputs = set()
+    for midi_path in midi_paths:
+        output = os.path.splitext(os.path.basename(midi_path))[0] + '.wav'
+        if output in outputs:
+            raise ValueError('More than one MIDI file would be rendered to '
+                             '{}'.format(output))
+        outputs.add(output)
+        content_hash = hashlib.sha1()
+        try:
+            with open(midi_path, 'rb') as f:
+                content_hash.update(f.read())
+        except (IOError, OSError) as e:
+            failed.append({'midi': midi_path, 'output': output, 'hash': None,
+                           'time': 0., 'error': '{}: {}'.format(
+                               type(e).__name__, e)})
+            continue
+        content_hash.update(
+            json.dumps(settings, sort_keys=True).encode('utf-8'))
+        content_hash = content_hash.hexdigest()
+        record = done.get(output)
+        if (record is not None and record['error'] is None and
+                record['hash'] == content_hash and
+                os.path.exists(os.path.join(path, output))):
+            continue
+        tasks.append((midi_path, os.path.join(path, output), content_hash,
+                      settings))
+    if n_jobs == 1:
+        pool = None
+        _init_render_worker(sf2_path)
+        records = six.moves.map(_render_corpus_file, tasks)
+    else:
+        pool = multiprocessing.Pool(n_jobs, _init_render_worker, (sf2_path,))
+        # Files take very different times to render, so hand them out one
+        # at a time and record them in the order they finish
+        records = pool.imap_unordered(_render_corpus_file, tasks)
+    rendered = []
+    try:
+        with open(manifest_path, 'a') as f:
+            for record in itertools.chain(failed, records):
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+                f.flush()
+                rendered.append(record)
+    except BaseException:
+        _stop_pool(pool, failed=True)
+        raise
+    finally:
+        if pool is None:
+            _corpus_renderer.close()
+    _stop_pool(pool)
+    return rendered
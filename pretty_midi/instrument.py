@@ -2,21 +2,77 @@
 functions for extracting information from the events it contains.
 """
 import numpy as np
-try:
-    import fluidsynth
-    _HAS_FLUIDSYNTH = True
-except ImportError:
-    _HAS_FLUIDSYNTH = False
-import os
-import pkg_resources
-
-from .containers import PitchBend
-from .utilities import pitch_bend_to_semitones, note_number_to_hz
+import heapq
 
-DEFAULT_SF2 = 'TimGM6mb.sf2'
+from .containers import (Note, PitchBend, _Tracked, _Memoized, _memoize,
+                         _event_list_property, _iter_sorted_events, _window,
+                         _moved)
+from .note_index import NoteIndex
+from .utilities import pitch_bend_to_semitones, note_number_to_hz
+from .rendering import FluidSynthRenderer
+# These used to be defined here, so they are still importable from here
+from .rendering import DEFAULT_SF2, _HAS_FLUIDSYNTH  # noqa: F401
+
+# Waveforms sampled over one period, note envelopes and fade-outs, which are
+# reused across notes and calls to Instrument.synthesize
+_WAVETABLES = {}
+_ENVELOPES = {}
+_FADES = {}
+# Maximum number of entries in each of the above
+_MAX_CACHED = 16
+# Longest note envelope which is cached, in seconds
+_MAX_CACHED_ENVELOPE = 10
+
+
+def _get_wavetable(wave, size, dtype=np.float64):
+    """Returns ``wave`` sampled at ``size`` points over one period, and the
+    slope from each point to the next (wrapping around at the end of the
+    period), for linear interpolation, as ``dtype``.
 
+    """
+    key = (wave, size, np.dtype(dtype))
+    if key not in _WAVETABLES:
+        if len(_WAVETABLES) >= _MAX_CACHED:
+            _WAVETABLES.clear()
+        table = np.asarray(wave(2*np.pi*np.arange(size + 1)/size),
+                           dtype=np.float64)
+        _WAVETABLES[key] = (table[:-1].astype(dtype),
+                            np.diff(table).astype(dtype))
+    return _WAVETABLES[key]
+
+
+def _get_envelope(fs, offset, length, dtype=np.float64):
+    """Returns samples ``offset`` to ``offset + length`` of the exponential
+    envelope ``exp(-t)`` of a note synthesized at ``fs``, as a new array of
+    ``dtype``.
 
-class Instrument(object):
+    """
+    if offset + length > _MAX_CACHED_ENVELOPE*fs:
+        return np.exp(-np.arange(offset, offset + length)/(1.0*fs)).astype(
+            dtype)
+    key = (fs, np.dtype(dtype))
+    if key not in _ENVELOPES:
+        if len(_ENVELOPES) >= _MAX_CACHED:
+            _ENVELOPES.clear()
+        _ENVELOPES[key] = np.exp(
+            -np.arange(int(_MAX_CACHED_ENVELOPE*fs))/(1.0*fs)).astype(dtype)
+    return _ENVELOPES[key][offset:offset + length].copy()
+
+
+def _get_fade(length, dtype=np.float64):
+    """Returns a read-only linear fade from 1 to 0 over ``length`` samples,
+    as ``dtype``."""
+    key = (length, np.dtype(dtype))
+    if key not in _FADES:
+        if len(_FADES) >= _MAX_CACHED:
+            _FADES.clear()
+        fade = np.linspace(1, 0, length).astype(dtype)
+        fade.flags.writeable = False
+        _FADES[key] = fade
+    return _FADES[key]
+
+
+class Instrument(_Memoized):
     """Object to hold event information for a single instrument.
 
     Parameters
@@ -42,6 +98,10 @@ class Instrument(object):
         List of of :class:`pretty_midi.PitchBend` objects.
     control_changes : list
         List of :class:`pretty_midi.ControlChange` objects.
+    cache_size : int
+        Maximum number of analysis results (e.g. of :func:`get_onsets`) which
+        are memoized until the instrument's events change.
+        Default 16; set to 0 to disable memoization.
 
     """
 
@@ -56,22 +116,225 @@ class Instrument(object):
         self.pitch_bends = []
         self.control_changes = []
 
+    notes = _event_list_property('notes')
+    pitch_bends = _event_list_property('pitch_bends')
+    control_changes = _event_list_property('control_changes')
+
+    def _get_version(self):
+        """Returns a value which changes whenever the events of this
+        instrument, or any of their attributes, change.
+
+        """
+        return (self.notes.version, self.pitch_bends.version,
+                self.control_changes.version, _Tracked.last_edit)
+
+    @_memoize(shared=True)
     def get_onsets(self):
         """Get all onsets of all notes played by this instrument.
         May contain duplicates.
 
+        The onsets are computed once and cached until the notes change, so
+        the returned array is shared between calls and is read-only; copy it
+        before modifying it.
+
         Returns
         -------
         onsets : np.ndarray
                 List of all note onsets.
 
         """
-        onsets = []
         # Get the note-on time of each note played by this instrument
-        for note in self.notes:
-            onsets.append(note.start)
+        onsets = np.array([note.start for note in self.notes],
+                          dtype=np.float64)
         # Return them sorted (because why not?)
-        return np.sort(onsets)
+        onsets.sort()
+        return onsets
+
+    @_memoize(shared=True)
+    def _get_note_index(self):
+        """Returns a :class:`pretty_midi.NoteIndex` over this instrument's
+        notes, built on first use and rebuilt only when the notes change.
+
+        """
+        return NoteIndex([note.start for note in self.notes],
+                         [note.end for note in self.notes])
+
+    @_memoize(shared=True)
+    def _get_control_change_order(self):
+        """Sorts this instrument's control changes by time, separately for
+        each control change number.
+
+        Returns
+        -------
+        orders : dict
+            Maps each control change number to a tuple of the indices (into
+            ``control_changes``) of its events, sorted by time, and their
+            sorted times.
+
+        """
+        order, times = self._get_event_order('control_changes')
+        numbers = np.array([self.control_changes[n].number for n in order],
+                           dtype=int)
+        return dict((number, (order[numbers == number],
+                              times[numbers == number]))
+                    for number in np.unique(numbers))
+
+    @_memoize(shared=True)
+    def _get_note_order(self):
+        """Sorts this instrument's notes by start time and by end time.
+
+        Returns
+        -------
+        start_order, starts, end_order, ends : np.ndarray
+            Indices which (stably) sort the notes by start and end time, and
+            the sorted times.
+
+        """
+        starts = np.array([note.start for note in self.notes],
+                          dtype=np.float64)
+        ends = np.array([note.end for note in self.notes], dtype=np.float64)
+        start_order = np.argsort(starts, kind='mergesort')
+        end_order = np.argsort(ends, kind='mergesort')
+        return start_order, starts[start_order], end_order, ends[end_order]
+
+    def _get_event_streams(self, start, end, stream):
+        """Returns time-ordered streams of this instrument's events, for
+        merging with ``heapq.merge``.  Each stream holds a single type of
+        event, and they are numbered from ``stream``.
+
+        """
+        start_order, starts, end_order, ends = self._get_note_order()
+        bend_order, bend_times = self._get_event_order('pitch_bends')
+        control_order, control_times = self._get_event_order(
+            'control_changes')
+        return [
+            _iter_sorted_events(
+                self.notes, starts, start_order, start, end, 'note_on',
+                stream, lambda note: (note.pitch, note.velocity)),
+            _iter_sorted_events(
+                self.notes, ends, end_order, start, end, 'note_off',
+                stream + 1, lambda note: (note.pitch, note.velocity)),
+            _iter_sorted_events(
+                self.pitch_bends, bend_times, bend_order, start, end,
+                'pitchwheel', stream + 2, lambda bend: (bend.pitch, None)),
+            _iter_sorted_events(
+                self.control_changes, control_times, control_order, start,
+                end, 'control_change', stream + 3,
+                lambda control_change: (control_change.number,
+                                        control_change.value))]
+
+    def iter_events(self, start=None, end=None):
+        """Iterates over this instrument's events in time order.
+
+        The events are merged from per-type streams which are sorted once
+        and cached, so no combined list of events is ever built.  Events at
+        the same time are ordered pitch bends, control changes, note-offs
+        and then note-ons, as when writing a MIDI file.
+
+        Parameters
+        ----------
+        start : float
+            Only events at or after this time are included.  Default
+            ``None``, which includes all events from the beginning.
+        end : float
+            Only events before this time are included.  Default ``None``,
+            which includes all events until the end.
+
+        Yields
+        ------
+        event : tuple
+            ``(time, type, value1, value2)``, where ``type`` and the values
+            are ``'note_on'`` or ``'note_off'`` with the pitch and velocity
+            of the note, ``'pitchwheel'`` with the pitch bend and ``None``,
+            or ``'control_change'`` with the control change number and
+            value.
+
+        """
+        for event in heapq.merge(*self._get_event_streams(start, end, 0)):
+            yield (event[0],) + event[4:]
+
+    def get_notes_at(self, time):
+        """Get the notes of this instrument which are sounding at a given
+        time, i.e. those with ``note.start <= time < note.end``.
+
+        Parameters
+        ----------
+        time : float
+            Time, in seconds.
+
+        Returns
+        -------
+        notes : list
+            List of :class:`pretty_midi.Note` objects, in the order they
+            appear in ``notes``.
+
+        """
+        return [self.notes[n] for n in self._get_note_index().at(time)]
+
+    def get_notes_in_range(self, start, end):
+        """Get the notes of this instrument which overlap a time range, i.e.
+        those with ``note.start < end`` and ``note.end > start``.
+
+        Parameters
+        ----------
+        start : float
+            Start of the time range, in seconds.
+        end : float
+            End of the time range, in seconds.
+
+        Returns
+        -------
+        notes : list
+            List of :class:`pretty_midi.Note` objects, in the order they
+            appear in ``notes``.
+
+        """
+        return [self.notes[n]
+                for n in self._get_note_index().overlapping(start, end)]
+
+    def _slice(self, start, end, rebase=True):
+        """Returns a new instrument holding the events of this instrument
+        between ``start`` and ``end``, as in
+        :func:`pretty_midi.PrettyMIDI.slice`.  The pitch bend and the value
+        of each control change number in effect at ``start`` are placed at
+        ``start``, and notes which overlap the time range are truncated to
+        it.
+
+        """
+        offset = start if rebase else 0.
+        sliced = Instrument(self.program, self.is_drum, self.name)
+        # Carry over the pitch bend in effect at start
+        order, times = self._get_event_order('pitch_bends')
+        active, bends = _window(self.pitch_bends, order, times, start, end)
+        if active is not None:
+            sliced.pitch_bends.append(_moved(active, start - offset))
+        sliced.pitch_bends.extend(
+            _moved(bend, bend.time - offset) for bend in bends)
+        # Carry over the latest value of each control change number, which
+        # keeps e.g. the sustain pedal held across the cut.  Control changes
+        # at start are carried over per number, so they are not in in_range.
+        control_changes = []
+        for order, times in self._get_control_change_order().values():
+            active, _ = _window(self.control_changes, order, times, start,
+                                end)
+            if active is not None:
+                control_changes.append(_moved(active, start - offset))
+        order, times = self._get_event_order('control_changes')
+        _, in_range = _window(self.control_changes, order, times, start, end)
+        control_changes.extend(
+            _moved(control_change, control_change.time - offset)
+            for control_change in in_range)
+        sliced.control_changes = control_changes
+        # Add the notes which overlap the time range, truncated to it
+        for n in self._get_note_index().overlapping(start, end):
+            note = self.notes[n]
+            if not rebase and note.start >= start and note.end <= end:
+                sliced.notes.append(note)
+            else:
+                sliced.notes.append(Note(note.velocity, note.pitch,
+                                         max(note.start, start) - offset,
+                                         min(note.end, end) - offset))
+        return sliced
 
     def get_piano_roll(self, fs=100, times=None,
                        pedal_threshold=64):
@@ -226,6 +489,7 @@ class Instrument(object):
             chroma_matrix[note, :] = np.sum(piano_roll[note::12], axis=0)
         return chroma_matrix
 
+    @_memoize()
     def get_end_time(self):
         """Returns the time of the end of the events in this instrument.
 
@@ -313,17 +577,33 @@ class Instrument(object):
         starts, ends, nodes = np.array(
             [[x.start, x.end, x.pitch % 12] for x in self.notes]).T
 
-        # compute distance matrix for all start and end time pairs
-        dist_mat = np.subtract.outer(ends, starts)
-
-        # find indices of pairs of notes where the end time of one note is
-        # within time_thresh of the start time of the other
-        sources, targets = np.where(abs(dist_mat) < time_thresh)
+        # sort note starts so that, for each note end, the notes starting
+        # within time_thresh of it form a contiguous window
+        start_order = np.argsort(starts, kind='mergesort')
+        sorted_starts = starts[start_order]
+        # search a slightly wider window than needed so that no pair is
+        # missed due to rounding, then apply the exact criterion below
+        margin = time_thresh + 1e-9*(1. + np.abs(ends))
+        window_starts = np.searchsorted(sorted_starts, ends - margin)
+        window_ends = np.searchsorted(sorted_starts, ends + margin,
+                                      side='right')
+        counts = window_ends - window_starts
+
+        # enumerate the candidate (source, target) pairs of notes
+        sources = np.repeat(np.arange(len(self.notes)), counts)
+        targets = start_order[np.repeat(window_starts, counts) +
+                              np.arange(counts.sum()) -
+                              np.repeat(np.cumsum(counts) - counts, counts)]
+
+        # keep the pairs of notes where the end time of one note is within
+        # time_thresh of the start time of the other
+        valid = abs(ends[sources] - starts[targets]) < time_thresh
+        sources, targets = sources[valid], targets[valid]
 
         transition_matrix, _, _ = np.histogram2d(nodes[sources],
                                                  nodes[targets],
                                                  bins=np.arange(13),
-                                                 normed=normalize)
+                                                 density=normalize)
         return transition_matrix
 
     def remove_invalid_notes(self):
@@ -339,7 +619,8 @@ class Instrument(object):
         for note in notes_to_delete:
             self.notes.remove(note)
 
-    def synthesize(self, fs=44100, wave=np.sin):
+    def synthesize(self, fs=44100, wave=np.sin, wavetable_size=None,
+                   start=None, duration=None, dtype=np.float64):
         """Synthesize the instrument's notes using some waveshape.
         For drum instruments, returns zeros.
 
@@ -350,6 +631,26 @@ class Instrument(object):
         wave : function
             Function which returns a periodic waveform,
             e.g. ``np.sin``, ``scipy.signal.square``, etc.
+        wavetable_size : int
+            If not ``None``, ``wave`` is sampled at this many points over one
+            period, once, and notes are synthesized by looking up the samples
+            with linear interpolation rather than by calling ``wave``.  This
+            is faster for waveforms which are expensive to compute, at the
+            cost of a small interpolation error.  The sampled waveform is
+            cached, so ``wave`` should always return the same values.
+        start : float
+            Time to start synthesizing at, in seconds.  Only notes sounding
+            after ``start`` are synthesized, and those already sounding at
+            ``start`` continue exactly as they would have.  Default ``None``,
+            which starts at the beginning.
+        duration : float
+            Maximum length of the synthesized audio, in seconds.  Default
+            ``None``, which synthesizes until 1 second after the end.
+        dtype : np.dtype
+            Floating point type of the synthesized audio, and of the buffers
+            used to synthesize it.  ``np.float32`` halves the memory used.
+            Oscillator phases are always tracked in double precision, so
+            that notes stay in tune.
 
         Returns
         -------
@@ -358,78 +659,240 @@ class Instrument(object):
 
         """
         # Pre-allocate output waveform
-        synthesized = np.zeros(int(fs*(self.get_end_time() + 1)))
+        first, n_samples = self._get_synthesis_range(fs, start, duration)
+        synthesized = np.zeros(max(n_samples - first, 0), dtype=dtype)
 
         # If we're a percussion channel, just return the zeros
         if self.is_drum:
             return synthesized
-        # If the above if statement failed, we need to revert back to default
+        # Render in large blocks, which bounds the memory used for the
+        # samples of all notes in each block
+        first = 0
+        for block in self.synthesize_blocks(fs=fs, wave=wave,
+                                            block_size=2**16,
+                                            wavetable_size=wavetable_size,
+                                            start=start, duration=duration,
+                                            dtype=dtype):
+            synthesized[first:first + block.shape[0]] = block
+            first += block.shape[0]
+        return synthesized
+
+    def _get_synthesis_range(self, fs, start, duration):
+        """Returns the first sample and the end sample of the audio produced
+        by :func:`synthesize` with ``start`` and ``duration``."""
+        first = 0 if start is None else max(int(fs*start), 0)
+        n_samples = int(fs*(self.get_end_time() + 1))
+        if duration is not None:
+            n_samples = min(n_samples, first + int(fs*duration))
+        return first, n_samples
+
+    def synthesize_blocks(self, fs=44100, wave=np.sin, block_size=4096,
+                          wavetable_size=None, start=None, duration=None,
+                          dtype=np.float64):
+        """Synthesize the instrument's notes in fixed-size blocks, in the same
+        way as :func:`synthesize`.
+
+        Only the notes which sound in each block are rendered, and the phase
+        of each note's oscillator is carried from one block to the next, so
+        the memory used doesn't depend on the length of the instrument.
+
+        Parameters
+        ----------
+        fs : int
+            Sampling rate of the synthesized audio signal.
+        wave : function
+            Function which returns a periodic waveform,
+            e.g. ``np.sin``, ``scipy.signal.square``, etc.
+        block_size : int
+            Number of samples in each block.
+        wavetable_size : int
+            If not ``None``, synthesize using a sampled period of ``wave``,
+            as in :func:`synthesize`.
+        start : float
+            Time to start synthesizing at, in seconds, as in
+            :func:`synthesize`.
+        duration : float
+            Maximum length of the synthesized audio, in seconds, as in
+            :func:`synthesize`.
+        dtype : np.dtype
+            Floating point type of the blocks, as in :func:`synthesize`.
+
+        Yields
+        ------
+        block : np.ndarray
+            The next ``block_size`` samples of the waveform of the
+            instrument's notes.  The last block may be shorter.  The blocks
+            concatenated match the output of :func:`synthesize`.
+
+        """
+        first_sample, n_samples = self._get_synthesis_range(fs, start,
+                                                            duration)
+        # Percussion channels are silent
+        if self.is_drum:
+            for first in range(first_sample, n_samples, block_size):
+                yield np.zeros(min(block_size, n_samples - first),
+                               dtype=dtype)
+            return
         if not hasattr(wave, '__call__'):
             raise ValueError('wave should be a callable Python function')
-        # This is a simple way to make the end of the notes fade-out without
-        # clicks
-        fade_out = np.linspace(1, 0, .1*fs)
-        # Create a frequency multiplier array for pitch bend
-        bend_multiplier = np.ones(synthesized.shape)
-        # Need to sort the pitch bend list for the loop below to work
+        # Phases are large, so in lower precision they are wrapped to one
+        # period before being passed to wave
+        wrap_phases = np.dtype(dtype) != np.float64
+        if wavetable_size is not None:
+            wavetable, slopes = _get_wavetable(wave, wavetable_size, dtype)
+            # Converts phases to (fractional) indices into the wavetable
+            phase_to_index = wavetable_size/(2*np.pi)
+        fade_length = int(.1*fs)
+        if fade_length > 1:
+            full_fade = _get_fade(fade_length, dtype)
+        if start is None and duration is None:
+            notes = self.notes
+        else:
+            # Only notes which overlap the synthesized samples are needed (the
+            # range is widened by a sample to allow for rounding)
+            notes = [self.notes[n] for n in self._get_note_index().overlapping(
+                (first_sample - 1.)/fs, (n_samples + 1.)/fs)]
+        # Start and end samples, angular frequencies and velocities of the
+        # notes, which are added to the active notes in order of start
+        starts = np.array([int(fs*note.start) for note in notes], dtype=int)
+        ends = np.array([int(fs*note.end) for note in notes], dtype=int)
+        frequencies = np.array(
+            [2*np.pi*note_number_to_hz(note.pitch)/fs for note in notes])
+        velocities = np.array([note.velocity for note in notes])
+        order = np.argsort(starts, kind='mergesort')
+        # The frequency multiplier of each pitch bend applies from its sample
+        # until the next bend, and after the end time there's no bend
         ordered_bends = sorted(self.pitch_bends, key=lambda bend: bend.time)
-        # Add in a bend of 0 at the end of time
-        end_bend = PitchBend(0, self.get_end_time())
-        for start_bend, end_bend in zip(ordered_bends,
-                                        ordered_bends[1:] + [end_bend]):
-            # Bend start and end time in samples
-            start = int(start_bend.time*fs)
-            end = int(end_bend.time*fs)
-            # The multiplier will be (twelfth root of 2)^(bend semitones)
-            bend_semitones = pitch_bend_to_semitones(start_bend.pitch)
-            bend_amount = (2**(1/12.))**bend_semitones
-            # Sample indices effected by the bend
-            bend_multiplier[start:end] = bend_amount
-        # Add in waveform for each note
-        for note in self.notes:
-            # Indices in samples of this note
-            start = int(fs*note.start)
-            end = int(fs*note.end)
-            # Get frequency of note from MIDI note number
-            frequency = note_number_to_hz(note.pitch)
-            # When a pitch bend gets applied, there will be a sample
-            # discontinuity. So, we also need an array of offsets which get
-            # applied to compensate.
-            offsets = np.zeros(end - start)
-            for bend in ordered_bends:
-                bend_sample = int(bend.time*fs)
-                # Does this pitch bend fall within this note?
-                if bend_sample > start and bend_sample < end:
-                    # Compute the average bend so far
-                    bend_so_far = bend_multiplier[start:bend_sample].mean()
-                    bend_amount = bend_multiplier[bend_sample]
-                    # Compute the offset correction
-                    offset = (bend_so_far - bend_amount)*(bend_sample - start)
-                    # Store this offset for samples effected
-                    offsets[bend_sample - start:] = offset
-            # Compute the angular frequencies, bent, over this interval
-            frequencies = 2*np.pi*frequency*(bend_multiplier[start:end])/fs
-            # Synthesize using wave function at this frequency
-            note_waveform = wave(frequencies*np.arange(end - start) +
-                                 2*np.pi*frequency*offsets/fs)
-            # Apply an exponential envelope
-            envelope = np.exp(-np.arange(end - start)/(1.0*fs))
-            # Make the end of the envelope be a fadeout
-            if envelope.shape[0] > fade_out.shape[0]:
-                envelope[-fade_out.shape[0]:] *= fade_out
+        bend_samples = np.array([int(bend.time*fs) for bend in ordered_bends],
+                                dtype=int)
+        bend_amounts = np.array(
+            [(2**(1/12.))**pitch_bend_to_semitones(bend.pitch)
+             for bend in ordered_bends] + [1.])
+        end_sample = int(self.get_end_time()*fs)
+        sorted_starts = starts[order]
+        # Without a start time, notes starting before 0 start from there
+        next_note = (0 if start is None
+                     else np.searchsorted(sorted_starts, first_sample))
+        # Indices of the notes which are sounding, and the phase of their
+        # oscillators at the start of the block.  Notes already sounding at
+        # the first sample have advanced by their frequency times the
+        # cumulative bend multiplier since they started, which is piecewise
+        # linear between the bends.
+        active = order[:next_note]
+        active = active[ends[active] > first_sample]
+        points = np.unique(np.concatenate(
+            [bend_samples, [end_sample, first_sample], starts[active]]))
+        bend_indices = np.searchsorted(bend_samples, points, side='right') - 1
+        bend_indices[points >= end_sample] = -1
+        cumulative = np.append(0., np.cumsum(
+            np.diff(points)*bend_amounts[bend_indices[:-1]]))
+        phases = frequencies[active]*(
+            cumulative[np.searchsorted(points, first_sample)] -
+            cumulative[np.searchsorted(points, starts[active])])
+        # Without bends, the cumulative multiplier is just the sample count
+        ramp = np.arange(block_size + 1, dtype=np.float64)
+        for first in range(first_sample, n_samples, block_size):
+            last = min(first + block_size, n_samples)
+            # Add the notes starting in this block.  Notes which end before
+            # they start are never heard.
+            n_started = np.searchsorted(sorted_starts, last)
+            started = order[next_note:n_started]
+            started = started[ends[started] > starts[started]]
+            next_note = n_started
+            active = np.append(active, started)
+            phases = np.append(phases, np.zeros(started.shape[0]))
+            if active.shape[0] == 0:
+                yield np.zeros(last - first, dtype=dtype)
+                continue
+            # The phase advances by the bent frequency every sample, so a
+            # note's phase is its frequency times the cumulative multiplier
+            if bend_samples.shape[0] == 0:
+                cumulative = ramp[:last - first + 1]
             else:
-                envelope *= np.linspace(1, 0, envelope.shape[0])
-            # Multiply by velocity (don't think it's linearly scaled but
-            # whatever)
-            envelope *= note.velocity
-            # Add in envelope'd waveform to the synthesized signal
-            synthesized[start:end] += envelope*note_waveform
-
-        return synthesized
-
-    def fluidsynth(self, fs=44100, sf2_path=None):
+                # The multiplier is constant between the block's first
+                # sample, the bends and the end sample (clipping merges those
+                # outside the block into its ends).  Each segment's bend is
+                # the last one at or before it (index -1, i.e. no bend,
+                # before the first one).
+                points = np.unique(np.clip(
+                    np.concatenate([[first, end_sample], bend_samples]),
+                    first, last - 1))
+                bend_indices = np.searchsorted(bend_samples, points,
+                                               side='right') - 1
+                bend_indices[points >= end_sample] = -1
+                cumulative = np.append(0., np.cumsum(np.repeat(
+                    bend_amounts[bend_indices],
+                    np.diff(np.append(points, last)))))
+            # Range of each note's samples within the block
+            los = np.maximum(starts[active], first) - first
+            his = np.minimum(ends[active], last) - first
+            block = np.zeros(last - first, dtype=dtype)
+            # Each note's samples are contiguous, so rendering them with
+            # slices is faster than gathering the samples of all notes
+            for n, phase, lo, hi in zip(active, phases, los, his):
+                note_phases = cumulative[lo:hi] - cumulative[lo]
+                note_phases *= frequencies[n]
+                note_phases += phase
+                # Apply an exponential envelope which fades out linearly
+                # over the last fade_length samples (or the whole note, if
+                # it's shorter), multiplied by velocity
+                offset = first + lo - starts[n]
+                length = ends[n] - starts[n]
+                envelope = _get_envelope(fs, offset, hi - lo, dtype)
+                fade = min(fade_length, length) - 1
+                # The fade applies from offset length - 1 - fade
+                fade_start = max(length - 1 - fade - offset, 0)
+                if fade > 0 and fade_start < hi - lo:
+                    if fade == fade_length - 1:
+                        # Most notes are longer than the fade, so use the
+                        # precomputed one
+                        j = offset + fade_start - (length - 1 - fade)
+                        envelope[fade_start:] *= full_fade[
+                            j:j + hi - lo - fade_start]
+                    else:
+                        envelope[fade_start:] *= (
+                            length - 1 - offset -
+                            np.arange(fade_start, hi - lo))/float(fade)
+                envelope *= velocities[n]
+                if wavetable_size is None:
+                    if wrap_phases:
+                        # Keep the fractional number of periods, which is
+                        # much faster than np.mod
+                        note_phases *= 1/(2*np.pi)
+                        note_phases -= np.floor(note_phases)
+                        note_phases = note_phases.astype(dtype)
+                        note_phases *= 2*np.pi
+                    envelope *= wave(note_phases)
+                else:
+                    # Look up the phases in the wavetable, interpolating
+                    # linearly between its points
+                    note_phases *= phase_to_index
+                    indices = np.floor(note_phases)
+                    note_phases -= indices
+                    indices = indices.astype(np.intp)
+                    indices %= wavetable_size
+                    note_phases *= slopes.take(indices)
+                    note_phases += wavetable.take(indices)
+                    envelope *= note_phases
+                block[lo:hi] += envelope
+            yield block
+            # Carry the phase of the notes which continue into the next
+            # block
+            continuing = ends[active] > last
+            phases = (phases + frequencies[active] *
+                      (cumulative[his] - cumulative[los]))[continuing]
+            active = active[continuing]
+
+    def fluidsynth(self, fs=44100, sf2_path=None, renderer=None, quantum=64,
+                   stereo=False, start=None, duration=None,
+                   dtype=np.float64):
         """Synthesize using fluidsynth.
 
+        Events are sent to the synthesizer in the order of
+        :func:`iter_events`, so events at the same time are sent as pitch
+        bends, control changes, note-offs and then note-ons, and a note
+        starts with the pitch bend and controller values set at its onset.
+
         Parameters
         ----------
         fs : int
@@ -437,93 +900,56 @@ class Instrument(object):
         sf2_path : str
             Path to a .sf2 file.
             Default ``None``, which uses the TimGM6mb.sf2 file included with
-            ``pretty_midi``.
+            ``pretty_midi``, or the soundfont of ``renderer``.
+        renderer : pretty_midi.FluidSynthRenderer
+            Renderer whose synthesizers and loaded soundfonts to reuse.
+            Default ``None``, which creates a synthesizer just for this call.
+        quantum : int
+            Events are sent to the synthesizer at their sample rounded up
+            to the next multiple of this many samples, which is how
+            fluidsynth applies them anyway when this is 64.  Use 1 to send
+            each event at its exact sample.
+        stereo : bool
+            If ``True``, return both channels of the synthesized audio.
+        start : float
+            Time to start synthesizing at, in seconds.  Only the events from
+            ``start`` on are sent to the synthesizer: notes already sounding
+            at ``start`` are played from ``start``, with the pitch bend and
+            control changes in effect then, as in
+            :func:`pretty_midi.PrettyMIDI.slice`.  Default ``None``, which
+            starts at the beginning.
+        duration : float
+            Maximum length of the synthesized audio, in seconds.  Default
+            ``None``, which synthesizes until 1 second after the end.
+        dtype : np.dtype
+            Floating point type of the synthesized audio.
 
         Returns
         -------
         synthesized : np.ndarray
-            Waveform of the MIDI data, synthesized at ``fs``.
+            Waveform of the MIDI data, synthesized at ``fs``, with shape
+            ``(n_samples,)``, or ``(n_samples, 2)`` if ``stereo`` is
+            ``True``.
 
         """
-        # If sf2_path is None, use the included TimGM6mb.sf2 path
-        if sf2_path is None:
-            sf2_path = pkg_resources.resource_filename(__name__, DEFAULT_SF2)
-
-        if not _HAS_FLUIDSYNTH:
-            raise ImportError("fluidsynth() was called but pyfluidsynth "
-                              "is not installed.")
-
-        if not os.path.exists(sf2_path):
-            raise ValueError("No soundfont file found at the supplied path "
-                             "{}".format(sf2_path))
-
-        # If the instrument has no notes, return an empty array
-        if len(self.notes) == 0:
-            return np.array([])
-
-        # Create fluidsynth instance
-        fl = fluidsynth.Synth(samplerate=fs)
-        # Load in the soundfont
-        sfid = fl.sfload(sf2_path)
-        # If this is a drum instrument, use channel 9 and bank 128
-        if self.is_drum:
-            channel = 9
-            # Try to use the supplied program number
-            res = fl.program_select(channel, sfid, 128, self.program)
-            # If the result is -1, there's no preset with this program number
-            if res == -1:
-                # So use preset 0
-                fl.program_select(channel, sfid, 128, 0)
-        # Otherwise just use channel 0
-        else:
-            channel = 0
-            fl.program_select(channel, sfid, 0, self.program)
-        # Collect all notes in one list
-        event_list = []
-        for note in self.notes:
-            event_list += [[note.start, 'note on', note.pitch, note.velocity]]
-            event_list += [[note.end, 'note off', note.pitch]]
-        for bend in self.pitch_bends:
-            event_list += [[bend.time, 'pitch bend', bend.pitch]]
-        for control_change in self.control_changes:
-            event_list += [[control_change.time, 'control change',
-                            control_change.number, control_change.value]]
-        # Sort the event list by time, and secondarily by whether the event
-        # is a note off
-        event_list.sort(key=lambda x: (x[0], x[1] != 'note off'))
-        # Add some silence at the beginning according to the time of the first
-        # event
-        current_time = event_list[0][0]
-        # Convert absolute seconds to relative samples
-        next_event_times = [e[0] for e in event_list[1:]]
-        for event, end in zip(event_list[:-1], next_event_times):
-            event[0] = end - event[0]
-        # Include 1 second of silence at the end
-        event_list[-1][0] = 1.
-        # Pre-allocate output array
-        total_time = current_time + np.sum([e[0] for e in event_list])
-        synthesized = np.zeros(int(np.ceil(fs*total_time)))
-        # Iterate over all events
-        for event in event_list:
-            # Process events based on type
-            if event[1] == 'note on':
-                fl.noteon(channel, event[2], event[3])
-            elif event[1] == 'note off':
-                fl.noteoff(channel, event[2])
-            elif event[1] == 'pitch bend':
-                fl.pitch_bend(channel, event[2])
-            elif event[1] == 'control change':
-                fl.cc(channel, event[2], event[3])
-            # Add in these samples
-            current_sample = int(fs*current_time)
-            end = int(fs*(current_time + event[0]))
-            samples = fl.get_samples(end - current_sample)[::2]
-            synthesized[current_sample:end] += samples
-            # Increment the current sample
-            current_time += event[0]
-        # Close fluidsynth
-        fl.delete()
-
+        if renderer is None:
+            with FluidSynthRenderer() as renderer:
+                return self.fluidsynth(fs=fs, sf2_path=sf2_path,
+                                       renderer=renderer, quantum=quantum,
+                                       stereo=stereo, start=start,
+                                       duration=duration, dtype=dtype)
+        instrument = self
+        if start is not None or duration is not None:
+            if start is None:
+                start = 0.
+            end = (max(self.get_end_time(), start) + 1. if duration is None
+                   else start + duration)
+            instrument = self._slice(start, end)
+        synthesized = renderer.render_instrument(
+            instrument, fs=fs, sf2_path=sf2_path, quantum=quantum,
+            stereo=stereo, dtype=dtype)
+        if duration is not None:
+            synthesized = synthesized[:int(fs*duration)]
         return synthesized
 
     def __repr__(self):
@@ -0,0 +1,167 @@
+"""The NoteIndex class answers "which notes sound at this time" and "which
+notes overlap this time range" queries without scanning every note.
+
+"""
+import numpy as np
+
+
+class NoteIndex(object):
+    """A static centered interval tree over note start and end times.
+
+    Stabbing queries (:func:`at`) and range queries (:func:`overlapping`)
+    take ``O(log n + k)`` time, where ``n`` is the number of notes and ``k``
+    is the number of notes returned.
+
+    Parameters
+    ----------
+    starts : np.ndarray
+        Note on times, in seconds.
+    ends : np.ndarray
+        Note off times, in seconds.
+
+    Examples
+    --------
+    Find the indices of the notes which sound at 1 second:
+
+    >>> index = NoteIndex([0., .5, 2.], [1.5, 1., 3.])
+    >>> index.at(1.)
+    array([0])
+
+    """
+
+    # Maximum number of intervals stored in a leaf node
+    _leaf_size = 32
+
+    def __init__(self, starts, ends):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        # All intervals sorted by start time, for range queries
+        self._start_order = np.argsort(self.starts, kind='mergesort')
+        self._sorted_starts = self.starts[self._start_order]
+        # Nodes of the tree, stored as parallel lists.  Each node holds the
+        # intervals which contain its center, sorted by start (ascending)
+        # and by end (descending, stored negated so it can be searched)
+        self._centers = []
+        self._by_start = []
+        self._node_starts = []
+        self._by_end = []
+        self._node_neg_ends = []
+        self._left = []
+        self._right = []
+        # Notes which don't have a positive duration never sound, so they
+        # are left out of the tree
+        indices = np.flatnonzero(self.ends > self.starts)
+        self._root = self._build(indices)
+
+    def _build(self, indices):
+        """Builds the subtree holding the intervals ``indices`` and returns
+        the index of its root node, or -1 if ``indices`` is empty.
+
+        """
+        if indices.size == 0:
+            return -1
+        # Small subtrees are stored as a single leaf which is scanned, since
+        # that is faster than creating and visiting many tiny nodes
+        if indices.size <= self._leaf_size:
+            node = len(self._centers)
+            self._centers.append(None)
+            self._by_start.append(indices)
+            self._node_starts.append(self.starts[indices])
+            self._by_end.append(indices)
+            self._node_neg_ends.append(-self.ends[indices])
+            self._left.append(-1)
+            self._right.append(-1)
+            return node
+        starts, ends = self.starts[indices], self.ends[indices]
+        # Splitting at the median endpoint always leaves at least one
+        # interval in this node and halves the endpoints on either side
+        center = np.median(np.concatenate([starts, ends]))
+        contains = (starts <= center) & (ends > center)
+        left = ~contains & (ends <= center)
+        right = ~contains & ~left
+        contained = indices[contains]
+        by_start = contained[np.argsort(self.starts[contained],
+                                        kind='mergesort')]
+        by_end = contained[np.argsort(-self.ends[contained],
+                                      kind='mergesort')]
+        node = len(self._centers)
+        self._centers.append(center)
+        self._by_start.append(by_start)
+        self._node_starts.append(self.starts[by_start])
+        self._by_end.append(by_end)
+        self._node_neg_ends.append(-self.ends[by_end])
+        self._left.append(-1)
+        self._right.append(-1)
+        self._left[node] = self._build(indices[left])
+        self._right[node] = self._build(indices[right])
+        return node
+
+    def __len__(self):
+        return self.starts.shape[0]
+
+    def at(self, time):
+        """Finds the notes which are sounding at a given time, i.e. those with
+        ``start <= time < end``.
+
+        Parameters
+        ----------
+        time : float
+            Time, in seconds.
+
+        Returns
+        -------
+        indices : np.ndarray
+            Sorted indices of the notes sounding at ``time``.
+
+        """
+        found = [np.zeros(0, dtype=int)]
+        node = self._root
+        while node != -1:
+            if self._centers[node] is None:
+                # Leaf nodes hold unsorted intervals, so check them all
+                sounding = ((self._node_starts[node] <= time) &
+                            (self._node_neg_ends[node] < -time))
+                found.append(self._by_start[node][sounding])
+                break
+            if time < self._centers[node]:
+                # Every interval here ends after the center, so report those
+                # which have started by the query time
+                n_found = np.searchsorted(self._node_starts[node], time,
+                                          side='right')
+                found.append(self._by_start[node][:n_found])
+                node = self._left[node]
+            else:
+                # Every interval here starts before the center, so report
+                # those which end after the query time
+                n_found = np.searchsorted(self._node_neg_ends[node], -time)
+                found.append(self._by_end[node][:n_found])
+                node = self._right[node]
+        return np.sort(np.concatenate(found))
+
+    def overlapping(self, start, end):
+        """Finds the notes which overlap a time range, i.e. those with
+        ``note.start < end`` and ``note.end > start``.
+
+        Parameters
+        ----------
+        start : float
+            Start of the time range, in seconds.
+        end : float
+            End of the time range, in seconds.
+
+        Returns
+        -------
+        indices : np.ndarray
+            Sorted indices of the notes overlapping ``[start, end)``.
+
+        """
+        if end <= start:
+            return np.zeros(0, dtype=int)
+        # Notes which overlap the range either are sounding at its start...
+        sounding = self.at(start)
+        # ...or start within it
+        first = np.searchsorted(self._sorted_starts, start, side='right')
+        last = np.searchsorted(self._sorted_starts, end)
+        started = self._start_order[first:last]
+        started = started[self.ends[started] > start]
+        return np.sort(np.concatenate([sounding, started]))
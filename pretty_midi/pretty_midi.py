@@ -11,18 +11,27 @@ import warnings
 import collections
 import copy
 import functools
+import heapq
+import multiprocessing
+import multiprocessing.pool
 import six
 
 from .instrument import Instrument
+from .rendering import FluidSynthRenderer, _WavWriter, _get_n_samples
 from .containers import (KeySignature, TimeSignature, Lyric, Note,
-                         PitchBend, ControlChange)
-from .utilities import (key_name_to_key_number, qpm_to_bpm)
+                         PitchBend, ControlChange, _Tracked, _Memoized,
+                         _memoize, _event_list_property, _window, _moved,
+                         _iter_sorted_events)
+from .note_index import NoteIndex
+from .utilities import (key_name_to_key_number, qpm_to_bpm,
+                        _fold_inter_onset_intervals,
+                        _cluster_inter_onset_intervals)
 
 # The largest we'd ever expect a tick to be
 MAX_TICK = 1e7
 
 
-class PrettyMIDI(object):
+class PrettyMIDI(_Memoized):
     """A container for MIDI data in an easily-manipulable format.
 
     Parameters
@@ -46,6 +55,14 @@ class PrettyMIDI(object):
         List of :class:`pretty_midi.TimeSignature` objects.
     lyrics : list
         List of :class:`pretty_midi.Lyric` objects.
+    cache_size : int
+        Maximum number of analysis results (e.g. of :func:`get_beats`) which
+        are memoized until the MIDI data changes.
+        Default 16; set to 0 to disable memoization.
+    cache_large_results : bool
+        Whether to also memoize the results of :func:`get_piano_roll` and
+        :func:`get_chroma`.  Each is copied when it is returned, so this
+        trades memory for speed.  Default ``False``.
     """
 
     def __init__(self, midi_file=None, resolution=220, initial_tempo=120.):
@@ -119,6 +136,24 @@ class PrettyMIDI(object):
             # Empty lyrics list
             self.lyrics = []
 
+    instruments = _event_list_property('instruments')
+    key_signature_changes = _event_list_property('key_signature_changes')
+    time_signature_changes = _event_list_property('time_signature_changes')
+    lyrics = _event_list_property('lyrics')
+    _tick_scales = _event_list_property('_tick_scales')
+
+    def _get_version(self):
+        """Returns a value which changes whenever any of the events, tempo
+        changes or meta-events of this object, or any of their attributes,
+        change.
+
+        """
+        return ((self.instruments.version, self._tick_scales.version,
+                 self.time_signature_changes.version,
+                 self.key_signature_changes.version, self.lyrics.version,
+                 _Tracked.last_edit) +
+                tuple(i._get_version()[:-1] for i in self.instruments))
+
     def _load_tempo_changes(self, midi_data):
         """Populates ``self._tick_scales`` with tuples of
         ``(tick, tick_scale)`` loaded from ``midi_data``.
@@ -223,6 +258,14 @@ class PrettyMIDI(object):
         self.__tick_to_time[start_tick:] = (last_end_time +
                                             tick_scale*ticks)
 
+    def _reset_tick_to_time(self):
+        """Discards ``self.__tick_to_time`` past tick 0, e.g. after
+        ``self._tick_scales`` is changed.  Times are computed from the tick
+        scales past its end, and it is extended again as needed.
+
+        """
+        self.__tick_to_time = [0]
+
     def _load_instruments(self, midi_data):
         """Populates ``self.instruments`` using ``midi_data``.
 
@@ -231,160 +274,13 @@ class PrettyMIDI(object):
         midi_data : midi.FileReader
             MIDI object from which data will be read.
         """
-        # MIDI files can contain a collection of tracks; each track can have
-        # events occuring on one of sixteen channels, and events can correspond
-        # to different instruments according to the most recently occurring
-        # program number.  So, we need a way to keep track of which instrument
-        # is playing on each track on each channel.  This dict will map from
-        # program number, drum/not drum, channel, and track index to instrument
-        # indices, which we will retrieve/populate using the __get_instrument
-        # function below.
-        instrument_map = collections.OrderedDict()
-        # Store a similar mapping to instruments storing "straggler events",
-        # e.g. events which appear before we want to initialize an Instrument
-        stragglers = {}
-        # This dict will map track indices to any track names encountered
-        track_name_map = collections.defaultdict(str)
-
-        def __get_instrument(program, channel, track, create_new):
-            """Gets the Instrument corresponding to the given program number,
-            drum/non-drum type, channel, and track index.  If no such
-            instrument exists, one is created.
-
-            """
-            # If we have already created an instrument for this program
-            # number/track/channel, return it
-            if (program, channel, track) in instrument_map:
-                return instrument_map[(program, channel, track)]
-            # If there's a straggler instrument for this instrument and we
-            # aren't being requested to create a new instrument
-            if not create_new and (channel, track) in stragglers:
-                return stragglers[(channel, track)]
-            # If we are told to, create a new instrument and store it
-            if create_new:
-                is_drum = (channel == 9)
-                instrument = Instrument(
-                    program, is_drum, track_name_map[track_idx])
-                # If any events appeared for this instrument before now,
-                # include them in the new instrument
-                if (channel, track) in stragglers:
-                    straggler = stragglers[(channel, track)]
-                    instrument.control_changes = straggler.control_changes
-                    instrument.pitch_bends = straggler.pitch_bends
-                # Add the instrument to the instrument map
-                instrument_map[(program, channel, track)] = instrument
-            # Otherwise, create a "straggler" instrument which holds events
-            # which appear before we actually want to create a proper new
-            # instrument
-            else:
-                # Create a "straggler" instrument
-                instrument = Instrument(program, track_name_map[track_idx])
-                # Note that stragglers ignores program number, because we want
-                # to store all events on a track which appear before the first
-                # note-on, regardless of program
-                stragglers[(channel, track)] = instrument
-            return instrument
-
+        self.instruments = []
+        loader = _InstrumentLoader(self.instruments, self.__tick_to_time)
         for track_idx, track in enumerate(midi_data.tracks):
-            # Keep track of last note on location:
-            # key = (instrument, note),
-            # value = (note-on tick, velocity)
-            last_note_on = collections.defaultdict(list)
-            # Keep track of which instrument is playing in each channel
-            # initialize to program 0 for all channels
-            current_instrument = np.zeros(16, dtype=np.int)
             for event in track:
-                # Look for track name events
-                if event.type == 'track_name':
-                    # Set the track name for the current track
-                    track_name_map[track_idx] = event.name
-                # Look for program change events
-                if event.type == 'program_change':
-                    # Update the instrument for this channel
-                    current_instrument[event.channel] = event.program
-                # Note ons are note on events with velocity > 0
-                elif event.type == 'note_on' and event.velocity > 0:
-                    # Store this as the last note-on location
-                    note_on_index = (event.channel, event.note)
-                    last_note_on[note_on_index].append((
-                        event.time, event.velocity))
-                # Note offs can also be note on events with 0 velocity
-                elif event.type == 'note_off' or (event.type == 'note_on' and
-                                                  event.velocity == 0):
-                    # Check that a note-on exists (ignore spurious note-offs)
-                    key = (event.channel, event.note)
-                    if key in last_note_on:
-                        # Get the start/stop times and velocity of every note
-                        # which was turned on with this instrument/drum/pitch.
-                        # One note-off may close multiple note-on events from
-                        # previous ticks. In case there's a note-off and then
-                        # note-on at the same tick we keep the open note from
-                        # this tick.
-                        end_tick = event.time
-                        open_notes = last_note_on[key]
-
-                        notes_to_close = [
-                            (start_tick, velocity)
-                            for start_tick, velocity in open_notes
-                            if start_tick != end_tick]
-                        notes_to_keep = [
-                            (start_tick, velocity)
-                            for start_tick, velocity in open_notes
-                            if start_tick == end_tick]
-
-                        for start_tick, velocity in notes_to_close:
-                            start_time = self.__tick_to_time[start_tick]
-                            end_time = self.__tick_to_time[end_tick]
-                            # Create the note event
-                            note = Note(velocity, event.note, start_time,
-                                        end_time)
-                            # Get the program and drum type for the current
-                            # instrument
-                            program = current_instrument[event.channel]
-                            # Retrieve the Instrument instance for the current
-                            # instrument
-                            # Create a new instrument if none exists
-                            instrument = __get_instrument(
-                                program, event.channel, track_idx, 1)
-                            # Add the note event
-                            instrument.notes.append(note)
-
-                        if len(notes_to_close) > 0 and len(notes_to_keep) > 0:
-                            # Note-on on the same tick but we already closed
-                            # some previous notes -> it will continue, keep it.
-                            last_note_on[key] = notes_to_keep
-                        else:
-                            # Remove the last note on for this instrument
-                            del last_note_on[key]
-                # Store pitch bends
-                elif event.type == 'pitchwheel':
-                    # Create pitch bend class instance
-                    bend = PitchBend(event.pitch,
-                                     self.__tick_to_time[event.time])
-                    # Get the program for the current inst
-                    program = current_instrument[event.channel]
-                    # Retrieve the Instrument instance for the current inst
-                    # Don't create a new instrument if none exists
-                    instrument = __get_instrument(
-                        program, event.channel, track_idx, 0)
-                    # Add the pitch bend event
-                    instrument.pitch_bends.append(bend)
-                # Store control changes
-                elif event.type == 'control_change':
-                    control_change = ControlChange(
-                        event.control, event.value,
-                        self.__tick_to_time[event.time])
-                    # Get the program for the current inst
-                    program = current_instrument[event.channel]
-                    # Retrieve the Instrument instance for the current inst
-                    # Don't create a new instrument if none exists
-                    instrument = __get_instrument(
-                        program, event.channel, track_idx, 0)
-                    # Add the control change event
-                    instrument.control_changes.append(control_change)
-        # Initialize list of instruments from instrument_map
-        self.instruments = [i for i in instrument_map.values()]
+                loader.add(event, track_idx, event.time)
 
+    @_memoize()
     def get_tempo_changes(self):
         """Return arrays of tempo changes in quarter notes-per-minute and their
         times.
@@ -400,15 +296,33 @@ class PrettyMIDI(object):
         """
 
         # Pre-allocate return arrays
-        tempo_change_times = np.zeros(len(self._tick_scales))
+        tempo_change_times = self._get_tick_scale_times().copy()
         tempi = np.zeros(len(self._tick_scales))
         for n, (tick, tick_scale) in enumerate(self._tick_scales):
-            # Convert tick of this tempo change to time in seconds
-            tempo_change_times[n] = self.tick_to_time(tick)
             # Convert tick scale to a tempo
             tempi[n] = 60.0/(tick_scale*self.resolution)
         return tempo_change_times, tempi
 
+    @_memoize(shared=True)
+    def _get_tick_scale_times(self):
+        """Computes the time of each tempo change in ``self._tick_scales``
+        from the tick scales alone, so that ticks past the end of
+        ``self.__tick_to_time`` can be converted without extending it.
+
+        Returns
+        -------
+        times : np.ndarray
+            Time, in seconds, of each tempo change.
+
+        """
+        times = np.zeros(len(self._tick_scales))
+        for n in range(1, len(self._tick_scales)):
+            start_tick, tick_scale = self._tick_scales[n - 1]
+            times[n] = times[n - 1] + tick_scale*(
+                self._tick_scales[n][0] - start_tick)
+        return times
+
+    @_memoize()
     def get_end_time(self):
         """Returns the time of the end of the MIDI object (time of the last
         event in all instruments/meta-events).
@@ -434,7 +348,8 @@ class PrettyMIDI(object):
     def estimate_tempi(self):
         """Return an empirical estimate of tempos and each tempo's probability.
         Based on "Automatic Extraction of Tempo and Beat from Expressive
-        Performance", Dixon 2001.
+        Performance", Dixon 2001.  To estimate tempi for many MIDI files at
+        once, see :func:`pretty_midi.estimate_tempi_batch`.
 
         Returns
         -------
@@ -446,40 +361,10 @@ class PrettyMIDI(object):
         """
         # Grab the list of onsets
         onsets = self.get_onsets()
-        # Compute inner-onset intervals
-        ioi = np.diff(onsets)
-        # "Rhythmic information is provided by IOIs in the range of
-        # approximately 50ms to 2s (Handel, 1989)"
-        ioi = ioi[ioi > .05]
-        ioi = ioi[ioi < 2]
-        # Normalize all iois into the range 30...300bpm
-        for n in range(ioi.shape[0]):
-            while ioi[n] < .2:
-                ioi[n] *= 2
-        # Array of inner onset interval cluster means
-        clusters = np.array([])
-        # Number of iois in each cluster
-        cluster_counts = np.array([])
-        for interval in ioi:
-            # If this ioi falls within a cluster (threshold is 25ms)
-            if (np.abs(clusters - interval) < .025).any():
-                k = np.argmin(clusters - interval)
-                # Update cluster mean
-                clusters[k] = (cluster_counts[k]*clusters[k] +
-                               interval)/(cluster_counts[k] + 1)
-                # Update number of elements in cluster
-                cluster_counts[k] += 1
-            # No cluster is close, make a new one
-            else:
-                clusters = np.append(clusters, interval)
-                cluster_counts = np.append(cluster_counts, 1.)
-        # Sort the cluster list by count
-        cluster_sort = np.argsort(cluster_counts)[::-1]
-        clusters = clusters[cluster_sort]
-        cluster_counts = cluster_counts[cluster_sort]
-        # Normalize the cluster scores
-        cluster_counts /= cluster_counts.sum()
-        return 60./clusters, cluster_counts
+        # Compute inner-onset intervals and fold them into 30...300bpm
+        ioi = _fold_inter_onset_intervals(np.diff(onsets))
+        # Cluster the intervals to get tempo estimates
+        return _cluster_inter_onset_intervals(ioi)
 
     def estimate_tempo(self):
         """Returns the best tempo estimate from
@@ -497,6 +382,7 @@ class PrettyMIDI(object):
                              " are fewer than two notes.")
         return tempi[0]
 
+    @_memoize()
     def get_beats(self, start_time=0.):
         """Returns a list of beat locations, according to MIDI tempo changes.
         For compound meters (any whose numerator is a multiple of 3 greater
@@ -527,8 +413,13 @@ class PrettyMIDI(object):
         while (tempo_idx < tempo_change_times.shape[0] - 1 and
                 beats[-1] > tempo_change_times[tempo_idx + 1]):
             tempo_idx += 1
-        # Logic requires that time signature changes are sorted by time
-        self.time_signature_changes.sort(key=lambda ts: ts.time)
+        # Logic requires that time signature changes are sorted by time.
+        # Only sort when needed, since sorting counts as a modification which
+        # would discard memoized results.
+        if any(ts1.time > ts2.time for ts1, ts2 in zip(
+                self.time_signature_changes[:-1],
+                self.time_signature_changes[1:])):
+            self.time_signature_changes.sort(key=lambda ts: ts.time)
         # Index of the time signature change we're using
         ts_idx = 0
         # Move past all time signature changes up to the supplied start time
@@ -651,29 +542,44 @@ class PrettyMIDI(object):
             onset_index += 1
         # Compute onset scores
         onset_scores = np.zeros(len(beat_candidates))
-        # Synthesize note onset signal, with velocity-valued spikes at onsets
+        # Rather than synthesizing dense onset and beat signals, keep the
+        # onset spike train as sorted sample indices with a running sum of
+        # their velocities, so that the total velocity in any window of
+        # samples can be found with a pair of binary searches
         fs = 1000
-        onset_signal = np.zeros(int(fs*(self.get_end_time() + 1)))
-        for note in note_list:
-            onset_signal[int(note.start*fs)] += note.velocity
+        onset_samples = np.array([int(note.start*fs) for note in note_list])
+        onset_velocities = np.array([note.velocity for note in note_list])
+        sort_idx = np.argsort(onset_samples, kind='mergesort')
+        onset_samples = onset_samples[sort_idx]
+        cumulative_velocity = np.append(
+            0, np.cumsum(onset_velocities[sort_idx]))
         for n, beats in enumerate(beat_candidates):
-            # Create a synthetic beat signal with 25ms windows
-            beat_signal = np.zeros(int(fs*(self.get_end_time() + 1)))
-            for beat in np.append(0, beats):
-                if beat - tolerance < 0:
-                    beat_window = np.ones(
-                        int(fs*2*tolerance + (beat - tolerance)*fs))
-                    beat_signal[:int((beat + tolerance)*fs)] = beat_window
-                else:
-                    beat_start = int((beat - tolerance)*fs)
-                    beat_end = beat_start + int(fs*tolerance*2)
-                    beat_window = np.ones(int(fs*tolerance*2))
-                    beat_signal[beat_start:beat_end] = beat_window
-            # Compute their dot product and normalize to get score
-            onset_scores[n] = np.dot(beat_signal, onset_signal)/beats.shape[0]
+            # Compute the [start, end) sample range of each 25ms beat window
+            windows = np.append(0, beats)
+            window_starts = ((windows - tolerance)*fs).astype(int)
+            window_ends = window_starts + int(fs*tolerance*2)
+            # Windows which would start before time 0 are truncated
+            truncated = windows - tolerance < 0
+            window_starts[truncated] = 0
+            window_ends[truncated] = (
+                (windows[truncated] + tolerance)*fs).astype(int)
+            # Windows may overlap, so only count the part of each window which
+            # was not covered by any previous window
+            covered = np.maximum.accumulate(window_ends)
+            window_starts[1:] = np.maximum(window_starts[1:], covered[:-1])
+            window_ends = np.maximum(window_starts, window_ends)
+            # Sum the velocities of the onsets which fall in each window
+            score = (
+                cumulative_velocity[np.searchsorted(onset_samples,
+                                                    window_ends)] -
+                cumulative_velocity[np.searchsorted(onset_samples,
+                                                    window_starts)]).sum()
+            # Normalize by the number of beats to get the score
+            onset_scores[n] = np.float64(score)/beats.shape[0]
         # Return the best-scoring beat start
         return start_times[np.argmax(onset_scores)]
 
+    @_memoize()
     def get_downbeats(self, start_time=0.):
         """Return a list of downbeat locations, according to MIDI tempo changes
         and time signature change events.
@@ -691,68 +597,201 @@ class PrettyMIDI(object):
         """
         # Get beat locations
         beats = self.get_beats(start_time)
-        # Make a copy of time signatures as we will be manipulating it
-        time_signatures = copy.deepcopy(self.time_signature_changes)
-
-        # If there are no time signatures or they start after 0s, add a 4/4
+        # get_beats sorts the time signatures, so read their times and
+        # numerators in order
+        ts_times = np.array([ts.time for ts in self.time_signature_changes],
+                            dtype=np.float64)
+        numerators = np.array(
+            [ts.numerator for ts in self.time_signature_changes], dtype=int)
+        # If there are no time signatures or they start after 0s, use a 4/4
         # signature at time 0
-        if not time_signatures or time_signatures[0].time > start_time:
-            time_signatures.insert(0, TimeSignature(4, 4, start_time))
-
-        def index(array, value, default):
-            """ Returns the first index of a value in an array, or `default` if
-            the value doesn't appear in the array."""
-            idx = np.flatnonzero(np.isclose(array, value))
-            if idx.size > 0:
-                return idx[0]
-            else:
-                return default
-
-        downbeats = []
-        end_beat_idx = 0
-        # Iterate over spans of time signatures
-        for start_ts, end_ts in zip(time_signatures[:-1], time_signatures[1:]):
-            # Get index of first beat at start_ts.time, or else use first beat
-            start_beat_idx = index(beats, start_ts.time, 0)
-            # Get index of first beat at end_ts.time, or else use last beat
-            end_beat_idx = index(beats, end_ts.time, start_beat_idx)
-            # Add beats within this time signature range, skipping beats
-            # according to the current time signature
-            if start_ts.numerator % 3 == 0 and start_ts.numerator != 3:
-                downbeats.append(beats[
-                    start_beat_idx:end_beat_idx:(start_ts.numerator // 3)])
-            else:
-                downbeats.append(beats[
-                    start_beat_idx:end_beat_idx:start_ts.numerator])
-        # Add in beats from the second-to-last to last time signature
-        final_ts = time_signatures[-1]
-        start_beat_idx = index(beats, final_ts.time, end_beat_idx)
-        if final_ts.numerator % 3 == 0 and final_ts.numerator != 3:
-            downbeats.append(beats[start_beat_idx::(final_ts.numerator // 3)])
-        else:
-            downbeats.append(beats[start_beat_idx::final_ts.numerator])
-        # Convert from list to array
-        downbeats = np.concatenate(downbeats)
+        if ts_times.size == 0 or ts_times[0] > start_time:
+            ts_times = np.append(start_time, ts_times)
+            numerators = np.append(4, numerators)
+        # Number of beats per downbeat, where compound meters are counted in
+        # groups of three beats
+        compound = (numerators % 3 == 0) & (numerators != 3)
+        steps = np.where(compound, numerators // 3, numerators)
+        # Find the first beat which is close (in the np.isclose sense) to each
+        # time signature change time, using one binary search over all times
+        tolerance = 1e-8 + 1e-5*np.abs(ts_times)
+        ts_beat_idx = np.searchsorted(beats, ts_times - tolerance)
+        found = np.zeros(ts_times.shape[0], dtype=bool)
+        if beats.size > 0:
+            candidates = beats[np.minimum(ts_beat_idx, beats.shape[0] - 1)]
+            found = np.abs(candidates - ts_times) <= tolerance
+        # Each time signature spans the beats from its own beat (or the first
+        # beat, when it does not fall on a beat) up to the next time
+        # signature's beat (or else its own start beat).  The final time
+        # signature spans until the last beat, starting from the previous
+        # span's end when its time does not fall on a beat.
+        span_starts = np.where(found, ts_beat_idx, 0)
+        span_ends = np.append(
+            np.where(found[1:], ts_beat_idx[1:], span_starts[:-1]),
+            beats.shape[0])
+        if ts_times.shape[0] > 1 and not found[-1]:
+            span_starts[-1] = span_ends[-2]
+        # Gather every step-th beat within each span, in order
+        counts = np.maximum(
+            0, (span_ends - span_starts + steps - 1) // steps)
+        offsets = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        downbeats = beats[np.repeat(span_starts, counts) +
+                          offsets*np.repeat(steps, counts)]
         # Return all downbeats after start_time
         return downbeats[downbeats >= start_time]
 
+    @_memoize(shared=True)
     def get_onsets(self):
         """Return a sorted list of the times of all onsets of all notes from
         all instruments.  May have duplicate entries.
 
+        The onsets are computed once and cached until the notes change, so
+        the returned array is shared between calls and is read-only; copy it
+        before modifying it.
+
         Returns
         -------
         onsets : np.ndarray
             Onset locations, in seconds.
 
         """
-        onsets = np.array([])
-        # Just concatenate onsets from all the instruments
-        for instrument in self.instruments:
-            onsets = np.append(onsets, instrument.get_onsets())
-        # Return them sorted (because why not?)
-        return np.sort(onsets)
+        # Each instrument's onsets are cached and already sorted, so they
+        # just need to be merged.  A stable sort of the concatenated arrays
+        # is a timsort, which merges the sorted runs directly.
+        onsets = np.concatenate(
+            [np.zeros(0)] + [i.get_onsets() for i in self.instruments])
+        onsets.sort(kind='mergesort')
+        return onsets
+
+    @_memoize(shared=True)
+    def _get_note_index(self):
+        """Returns a :class:`pretty_midi.NoteIndex` over the notes of all
+        instruments, along with the instrument index and note index (within
+        the instrument) of each indexed note.
+
+        """
+        instrument_indices = np.array(
+            [n for n, i in enumerate(self.instruments) for _ in i.notes],
+            dtype=int)
+        note_indices = np.array(
+            [n for i in self.instruments for n in range(len(i.notes))],
+            dtype=int)
+        index = NoteIndex(
+            [note.start for i in self.instruments for note in i.notes],
+            [note.end for i in self.instruments for note in i.notes])
+        return index, instrument_indices, note_indices
+
+    def _get_indexed_notes(self, indices):
+        """Converts indices into the note index to instrument/note pairs."""
+        _, instrument_indices, note_indices = self._get_note_index()
+        return [(self.instruments[instrument_indices[n]],
+                 self.instruments[instrument_indices[n]].notes[
+                     note_indices[n]])
+                for n in indices]
+
+    def get_notes_at(self, time):
+        """Get the notes of all instruments which are sounding at a given
+        time, i.e. those with ``note.start <= time < note.end``.
+
+        Parameters
+        ----------
+        time : float
+            Time, in seconds.
+
+        Returns
+        -------
+        notes : list
+            List of ``(instrument, note)`` tuples of each sounding
+            :class:`pretty_midi.Note` and the :class:`pretty_midi.Instrument`
+            it belongs to.
+
+        """
+        return self._get_indexed_notes(self._get_note_index()[0].at(time))
+
+    def get_notes_in_range(self, start, end):
+        """Get the notes of all instruments which overlap a time range, i.e.
+        those with ``note.start < end`` and ``note.end > start``.
+
+        Parameters
+        ----------
+        start : float
+            Start of the time range, in seconds.
+        end : float
+            End of the time range, in seconds.
+
+        Returns
+        -------
+        notes : list
+            List of ``(instrument, note)`` tuples of each overlapping
+            :class:`pretty_midi.Note` and the :class:`pretty_midi.Instrument`
+            it belongs to.
+
+        """
+        return self._get_indexed_notes(
+            self._get_note_index()[0].overlapping(start, end))
 
+    def iter_events(self, start=None, end=None):
+        """Iterates over the events of all instruments, and the tempo changes,
+        time signature changes, key signature changes and lyrics, in time
+        order.
+
+        The events are merged from per-instrument, per-type streams which are
+        sorted once and cached, so no combined list of events is ever built.
+        Events at the same time are ordered as when writing a MIDI file:
+        tempo changes, time signature changes, key signature changes, lyrics,
+        pitch bends, control changes, note-offs and then note-ons.
+
+        Parameters
+        ----------
+        start : float
+            Only events at or after this time are included.  Default
+            ``None``, which includes all events from the beginning.
+        end : float
+            Only events before this time are included.  Default ``None``,
+            which includes all events until the end.
+
+        Yields
+        ------
+        event : tuple
+            ``(time, type, instrument, value1, value2)``, where
+            ``instrument`` is the index of the event's instrument in
+            ``instruments`` (``None`` for tempo changes, time signatures, key
+            signatures and lyrics) and ``type`` and the values are
+
+            - ``'note_on'`` or ``'note_off'``: pitch and velocity of the note
+            - ``'pitchwheel'``: pitch bend and ``None``
+            - ``'control_change'``: control change number and value
+            - ``'set_tempo'``: tempo in quarter notes per minute and ``None``
+            - ``'time_signature'``: numerator and denominator
+            - ``'key_signature'``: key number and ``None``
+            - ``'lyrics'``: text and ``None``
+
+        """
+        tempo_change_times, tempi = self.get_tempo_changes()
+        streams = [_iter_sorted_events(
+            tempi, tempo_change_times, np.arange(tempi.shape[0]), start, end,
+            'set_tempo', 0, lambda qpm: (qpm, None))]
+        for stream, (name, kind, get_values) in enumerate([
+                ('time_signature_changes', 'time_signature',
+                 lambda ts: (ts.numerator, ts.denominator)),
+                ('key_signature_changes', 'key_signature',
+                 lambda ks: (ks.key_number, None)),
+                ('lyrics', 'lyrics', lambda lyric: (lyric.text, None))], 1):
+            order, times = self._get_event_order(name)
+            streams.append(_iter_sorted_events(
+                getattr(self, name), times, order, start, end, kind, stream,
+                get_values))
+        # Each instrument has four streams, numbered after the above
+        for n, instrument in enumerate(self.instruments):
+            streams.extend(instrument._get_event_streams(start, end,
+                                                         4*(n + 1)))
+        for event in heapq.merge(*streams):
+            instrument = event[2]//4 - 1
+            yield (event[0], event[4],
+                   instrument if instrument >= 0 else None) + event[5:]
+
+    @_memoize(large=True)
     def get_piano_roll(self, fs=100, times=None, pedal_threshold=64):
         """Compute a piano roll matrix of the MIDI data.
 
@@ -854,6 +893,7 @@ class PrettyMIDI(object):
 
         return pc_trans_mat
 
+    @_memoize(large=True)
     def get_chroma(self, fs=100, times=None, pedal_threshold=64):
         """Get the MIDI data as a sequence of chroma vectors.
 
@@ -887,7 +927,104 @@ class PrettyMIDI(object):
             chroma_matrix[note, :] = np.sum(piano_roll[note::12], axis=0)
         return chroma_matrix
 
-    def synthesize(self, fs=44100, wave=np.sin):
+    def iter_segments(self, length, hop=None, unit='seconds', fs=100,
+                      pedal_threshold=64):
+        """Iterate over fixed-length, possibly overlapping, windows of the
+        MIDI data, e.g. for cutting a file into training examples.
+
+        The piano roll and chroma of the whole file are computed once, the
+        first time a window is requested, and each window's matrices are
+        taken from them, so overlapping windows don't repeat any work.
+
+        Parameters
+        ----------
+        length : float or int
+            Length of each window, in seconds when ``unit='seconds'`` or as
+            a number of beats or bars otherwise.
+        hop : float or int
+            Distance between the starts of consecutive windows, in the same
+            unit as ``length``.  Default ``None``, which uses ``length``
+            (i.e. non-overlapping windows).
+        unit : str
+            ``'seconds'`` for windows of fixed duration, or ``'beats'`` or
+            ``'downbeats'`` for windows which start and end on the times
+            from :func:`get_beats` or :func:`get_downbeats`.
+        fs : int
+            Sampling frequency of the piano roll and chroma columns.
+        pedal_threshold : int
+            Threshold for sustain pedal handling, see
+            :func:`get_piano_roll`.
+
+        Yields
+        ------
+        segment : dict
+            With keys ``'start'`` and ``'end'``, the window's time range in
+            seconds; ``'notes'``, the ``(instrument, note)`` tuples which
+            overlap it, as returned by :func:`get_notes_in_range`; and
+            ``'piano_roll'`` and ``'chroma'``, the columns of
+            :func:`get_piano_roll` and :func:`get_chroma` covering it.
+            Windows in seconds always have ``int(round(length*fs))``
+            columns, zero-padded past the end of the file.  Windows in beats
+            or bars which run past the last beat or bar are truncated to
+            :func:`get_end_time`.
+
+        """
+        if hop is None:
+            hop = length
+        if length <= 0 or hop <= 0:
+            raise ValueError('length and hop must be positive.')
+        end_time = self.get_end_time()
+        if unit == 'seconds':
+            starts = np.arange(0, end_time, hop)
+            ends = starts + length
+        elif unit in ['beats', 'downbeats']:
+            if int(length) != length or int(hop) != hop:
+                raise ValueError('length and hop must be a whole number of '
+                                 '{}.'.format(unit))
+            if unit == 'beats':
+                boundaries = self.get_beats()
+            else:
+                boundaries = self.get_downbeats()
+            boundaries = np.append(boundaries[boundaries < end_time],
+                                   end_time)
+            first = np.arange(0, boundaries.shape[0] - 1, int(hop))
+            starts = boundaries[first]
+            ends = boundaries[np.minimum(first + int(length),
+                                         boundaries.shape[0] - 1)]
+        else:
+            raise ValueError('unit must be one of "seconds", "beats" or '
+                             '"downbeats", not {}.'.format(unit))
+        if starts.shape[0] == 0:
+            return
+
+        piano_roll = self.get_piano_roll(fs=fs,
+                                         pedal_threshold=pedal_threshold)
+        chroma = np.zeros((12, piano_roll.shape[1]))
+        for note in range(12):
+            chroma[note, :] = np.sum(piano_roll[note::12], axis=0)
+
+        def columns(matrix, first, last):
+            """ Copies columns [first, last) of matrix, with zeros for those
+            past its end."""
+            window = np.zeros((matrix.shape[0], last - first))
+            available = matrix[:, first:last]
+            window[:, :available.shape[1]] = available
+            return window
+
+        for start, end in zip(starts, ends):
+            first = int(start*fs)
+            if unit == 'seconds':
+                last = first + int(round(length*fs))
+            else:
+                last = int(end*fs)
+            yield {'start': start,
+                   'end': end,
+                   'notes': self.get_notes_in_range(start, end),
+                   'piano_roll': columns(piano_roll, first, last),
+                   'chroma': columns(chroma, first, last)}
+
+    def synthesize(self, fs=44100, wave=np.sin, wavetable_size=None,
+                   workers=None, start=None, duration=None, dtype=np.float64):
         """Synthesize the pattern using some waveshape.  Ignores drum track.
 
         Parameters
@@ -897,6 +1034,27 @@ class PrettyMIDI(object):
         wave : function
             Function which returns a periodic waveform,
             e.g. ``np.sin``, ``scipy.signal.square``, etc.
+        wavetable_size : int
+            If not ``None``, synthesize by looking up a sampled period of
+            ``wave``, as in :func:`pretty_midi.Instrument.synthesize`.
+        workers : int
+            Number of processes to synthesize instruments in.  Default
+            ``None``, which synthesizes them one after another in this
+            process.  The output is the same either way.  ``wave`` must be
+            picklable (e.g. a module-level function) to use processes.
+        start : float
+            Time to start synthesizing at, in seconds, e.g. for a quick
+            preview.  Only notes sounding after ``start`` are synthesized,
+            and those already sounding at ``start`` continue exactly as they
+            would have.  Default ``None``, which starts at the beginning.
+        duration : float
+            Maximum length of the synthesized audio, in seconds.  Default
+            ``None``, which synthesizes until 1 second after the end.  The
+            audio is normalized within the synthesized time range.
+        dtype : np.dtype
+            Floating point type of the synthesized audio, and of the buffers
+            used to synthesize it, as in
+            :func:`pretty_midi.Instrument.synthesize`.
 
         Returns
         -------
@@ -906,20 +1064,83 @@ class PrettyMIDI(object):
         """
         # If there are no instruments, return an empty array
         if len(self.instruments) == 0:
-            return np.array([])
-        # Get synthesized waveform for each instrument
-        waveforms = [i.synthesize(fs=fs, wave=wave) for i in self.instruments]
+            return np.array([], dtype=dtype)
         # Allocate output waveform, with #sample = max length of all waveforms
-        synthesized = np.zeros(np.max([w.shape[0] for w in waveforms]))
-        # Sum all waveforms in
-        for waveform in waveforms:
-            synthesized[:waveform.shape[0]] += waveform
-        # Normalize
-        synthesized /= np.abs(synthesized).max()
-        return synthesized
+        n_samples = 0
+        for instrument in self.instruments:
+            first, last = instrument._get_synthesis_range(fs, start, duration)
+            n_samples = max(n_samples, last - first)
+        synthesized = np.zeros(n_samples, dtype=dtype)
+        # Sum in the synthesized waveform of each instrument
+        _mix_instruments(
+            synthesized, self.instruments, 'synthesize',
+            {'fs': fs, 'wave': wave, 'wavetable_size': wavetable_size,
+             'start': start, 'duration': duration, 'dtype': dtype},
+            workers, multiprocessing.Pool)
+        return _normalize(synthesized)
+
+    def synthesize_blocks(self, fs=44100, wave=np.sin, block_size=4096,
+                          wavetable_size=None, start=None, duration=None,
+                          dtype=np.float64):
+        """Synthesize the pattern in fixed-size blocks, using some waveshape.
+        Ignores drum track.
+
+        Each instrument is synthesized block by block with
+        :func:`pretty_midi.Instrument.synthesize_blocks`, so the memory used
+        doesn't depend on the length of the MIDI data.
+
+        Parameters
+        ----------
+        fs : int
+            Sampling rate of the synthesized audio signal.
+        wave : function
+            Function which returns a periodic waveform,
+            e.g. ``np.sin``, ``scipy.signal.square``, etc.
+        block_size : int
+            Number of samples in each block.
+        wavetable_size : int
+            If not ``None``, synthesize by looking up a sampled period of
+            ``wave``, as in :func:`pretty_midi.Instrument.synthesize`.
+        start : float
+            Time to start synthesizing at, in seconds, as in
+            :func:`synthesize`.
+        duration : float
+            Maximum length of the synthesized audio, in seconds, as in
+            :func:`synthesize`.
+        dtype : np.dtype
+            Floating point type of the blocks, as in :func:`synthesize`.
+
+        Yields
+        ------
+        block : np.ndarray
+            The next ``block_size`` samples of the waveform of the MIDI data.
+            The last block may be shorter.  Unlike :func:`synthesize`, the
+            waveform is not normalized, because its peak isn't known until
+            all blocks have been synthesized.
 
-    def fluidsynth(self, fs=44100, sf2_path=None):
-        """Synthesize using fluidsynth.
+        """
+        generators = [i.synthesize_blocks(fs=fs, wave=wave,
+                                          block_size=block_size,
+                                          wavetable_size=wavetable_size,
+                                          start=start, duration=duration,
+                                          dtype=dtype)
+                      for i in self.instruments]
+        # Instruments which end earlier run out of blocks earlier
+        for blocks in six.moves.zip_longest(*generators):
+            blocks = [block for block in blocks if block is not None]
+            synthesized = np.zeros(max(block.shape[0] for block in blocks),
+                                   dtype=dtype)
+            for block in blocks:
+                synthesized[:block.shape[0]] += block
+            yield synthesized
+
+    def fluidsynth(self, fs=44100, sf2_path=None, workers=None,
+                   renderer=None, multichannel=False, quantum=64,
+                   stereo=False, start=None, duration=None,
+                   dtype=np.float64):
+        """Synthesize using fluidsynth.  Events at the same time are sent to
+        the synthesizer in the order of :func:`iter_events`, as in
+        :func:`pretty_midi.Instrument.fluidsynth`.
 
         Parameters
         ----------
@@ -929,29 +1150,172 @@ class PrettyMIDI(object):
             Path to a .sf2 file.
             Default ``None``, which uses the TimGM6mb.sf2 file included with
             ``pretty_midi``.
+        workers : int
+            Number of threads to synthesize instruments in, each with its own
+            synthesizer.  Default ``None``, which synthesizes them one after
+            another.  The output is the same either way.
+        renderer : pretty_midi.FluidSynthRenderer
+            Renderer whose synthesizers and loaded soundfonts to reuse.
+            Default ``None``, which creates synthesizers just for this call,
+            reusing them for all instruments.
+        multichannel : bool
+            If ``True``, play all instruments on one synthesizer, each on the
+            channel it would be written to by :func:`write`, instead of
+            synthesizing each instrument separately and summing them.  This
+            is faster for files with many instruments, but instruments which
+            share a channel (when there are more than 15 non-drum
+            instruments, or several drum instruments) also share its program
+            and controllers.  ``workers`` is ignored.
+        quantum : int
+            Events are sent to the synthesizer at their sample rounded up
+            to the next multiple of this many samples, as in
+            :func:`pretty_midi.Instrument.fluidsynth`.
+        stereo : bool
+            If ``True``, return both channels of the synthesized audio.
+        start : float
+            Time to start synthesizing at, in seconds, e.g. for a quick
+            preview.  Only the time range starting at ``start`` is sent to
+            the synthesizer, as by :func:`slice`: notes already sounding at
+            ``start`` are played from ``start``, with the pitch bends and
+            control changes in effect then.  Default ``None``, which starts
+            at the beginning.
+        duration : float
+            Maximum length of the synthesized audio, in seconds.  Default
+            ``None``, which synthesizes until 1 second after the end.  The
+            audio is normalized within the synthesized time range.
+        dtype : np.dtype
+            Floating point type of the synthesized audio, and of the buffers
+            it is mixed in.
 
         Returns
         -------
         synthesized : np.ndarray
-            Waveform of the MIDI data, synthesized at ``fs``.
+            Waveform of the MIDI data, synthesized at ``fs``, with shape
+            ``(n_samples,)``, or ``(n_samples, 2)`` if ``stereo`` is
+            ``True``.
 
         """
+        if renderer is None:
+            with FluidSynthRenderer() as renderer:
+                return self.fluidsynth(fs=fs, sf2_path=sf2_path,
+                                       workers=workers, renderer=renderer,
+                                       multichannel=multichannel,
+                                       quantum=quantum, stereo=stereo,
+                                       start=start, duration=duration,
+                                       dtype=dtype)
+        midi_data = self
+        if start is not None or duration is not None:
+            if start is None:
+                start = 0.
+            end = (max(self.get_end_time(), start) + 1. if duration is None
+                   else start + duration)
+            midi_data = self.slice(start, end)
         # If there are no instruments, or all instruments have no notes, return
         # an empty array
-        if len(self.instruments) == 0 or all(len(i.notes) == 0
-                                             for i in self.instruments):
-            return np.array([])
+        if len(midi_data.instruments) == 0 or all(
+                len(i.notes) == 0 for i in midi_data.instruments):
+            return np.array([], dtype=dtype)
         # Get synthesized waveform for each instrument
-        waveforms = [i.fluidsynth(fs=fs,
-                                  sf2_path=sf2_path) for i in self.instruments]
-        # Allocate output waveform, with #sample = max length of all waveforms
-        synthesized = np.zeros(np.max([w.shape[0] for w in waveforms]))
-        # Sum all waveforms in
-        for waveform in waveforms:
-            synthesized[:waveform.shape[0]] += waveform
-        # Normalize
-        synthesized /= np.abs(synthesized).max()
-        return synthesized
+        if multichannel:
+            synthesized = renderer.render_channels(
+                midi_data, fs=fs, sf2_path=sf2_path, quantum=quantum,
+                stereo=stereo, dtype=dtype)
+        else:
+            # Allocate output waveform, with #sample = max length of all
+            # waveforms
+            n_samples = max(_get_n_samples(instrument, fs)
+                            for instrument in midi_data.instruments)
+            synthesized = np.zeros((n_samples, 2) if stereo else n_samples,
+                                   dtype=dtype)
+            # fluidsynth renders without holding the GIL, so threads suffice
+            _mix_instruments(
+                synthesized, midi_data.instruments, 'fluidsynth',
+                {'fs': fs, 'sf2_path': sf2_path, 'renderer': renderer,
+                 'quantum': quantum, 'stereo': stereo, 'dtype': dtype},
+                workers, multiprocessing.pool.ThreadPool)
+        if duration is not None:
+            synthesized = synthesized[:int(fs*duration)]
+        return _normalize(synthesized)
+
+    def render_to_wav(self, path, method='sine', fs=44100,
+                      dtype='int16', gain=None, block_size=4096, wave=np.sin,
+                      sf2_path=None, renderer=None, stereo=False):
+        """Synthesize the MIDI data and write it to a WAV file, block by block,
+        so that the memory used doesn't depend on the length of the MIDI
+        data.
+
+        Parameters
+        ----------
+        path : str
+            Path of the WAV file to write.
+        method : str
+            ``'sine'`` to synthesize with ``wave`` (a sine wave by default)
+            as in :func:`synthesize_blocks`, or ``'fluidsynth'`` to
+            synthesize with one fluidsynth synthesizer as in
+            :func:`pretty_midi.FluidSynthRenderer.render_blocks`.
+        fs : int
+            Sampling rate to synthesize at.
+        dtype : str
+            ``'int16'`` or ``'float32'``, the format of the samples in the
+            file.
+        gain : float
+            Factor to scale the synthesized samples by, leaving headroom for
+            the loudest passages.  16-bit samples are clipped to [-1, 1].
+            Default ``None``, which synthesizes the MIDI data twice: once to
+            find its peak, and once to write it normalized to a peak of 1, as
+            returned by :func:`synthesize` and :func:`fluidsynth`.
+        block_size : int
+            Number of samples to synthesize and write at once.
+        wave : function
+            Function which returns a periodic waveform, used when ``method``
+            is ``'sine'``.
+        sf2_path : str
+            Path to a .sf2 file, used when ``method`` is ``'fluidsynth'``.
+            Default ``None``, which uses the TimGM6mb.sf2 file included with
+            ``pretty_midi``, or the soundfont of ``renderer``.
+        renderer : pretty_midi.FluidSynthRenderer
+            Renderer to synthesize with when ``method`` is ``'fluidsynth'``.
+            Default ``None``, which creates one just for this call.
+        stereo : bool
+            If ``True`` and ``method`` is ``'fluidsynth'``, write both
+            channels of the synthesized audio.
+
+        Returns
+        -------
+        gain : float
+            The factor the synthesized samples were scaled by, which can be
+            passed to later calls to write at the same level.
+
+        """
+        if method not in ('sine', 'fluidsynth'):
+            raise ValueError("method should be 'sine' or 'fluidsynth', not "
+                             "{}".format(method))
+        if method == 'fluidsynth' and renderer is None:
+            with FluidSynthRenderer() as renderer:
+                return self.render_to_wav(
+                    path, method=method, fs=fs, dtype=dtype, gain=gain,
+                    block_size=block_size, sf2_path=sf2_path,
+                    renderer=renderer, stereo=stereo)
+
+        # Both sample formats hold at most single precision, so there is
+        # nothing to gain from synthesizing in double precision
+        def blocks():
+            if method == 'sine':
+                return self.synthesize_blocks(fs=fs, wave=wave,
+                                              block_size=block_size,
+                                              dtype=np.float32)
+            return renderer.render_blocks(self, fs=fs, sf2_path=sf2_path,
+                                          block_size=block_size,
+                                          stereo=stereo, dtype=np.float32)
+
+        n_channels = 2 if stereo and method == 'fluidsynth' else 1
+        with _WavWriter(path, fs, n_channels, dtype) as writer:
+            if gain is None:
+                peak = max([np.abs(block).max() for block in blocks()] + [0])
+                gain = 1./float(peak) if peak > 0 else 1.
+            for block in blocks():
+                writer.write(block*gain)
+        return gain
 
     def tick_to_time(self, tick):
         """Converts from an absolute tick to time in seconds using
@@ -1001,9 +1365,16 @@ class PrettyMIDI(object):
         if tick == len(self.__tick_to_time):
             # start from time at end of __tick_to_time
             tick -= 1
-            # Add on ticks assuming the final tick_scale amount
-            _, final_tick_scale = self._tick_scales[-1]
-            tick += (time - self.__tick_to_time[tick])/final_tick_scale
+            start_time = self.__tick_to_time[tick]
+            # or from the last tempo change before time, if it is past the
+            # end of __tick_to_time
+            change_times = self._get_tick_scale_times()
+            n = max(np.searchsorted(change_times, time, side='right') - 1, 0)
+            change_tick, tick_scale = self._tick_scales[n]
+            if change_tick > tick:
+                tick, start_time = change_tick, change_times[n]
+            # Add on ticks assuming the tick_scale in effect from there
+            tick += (time - start_time)/tick_scale
             # Re-round/quantize
             return int(round(tick))
         # If the tick is not 0 and the previous ticktime in a is closer to time
@@ -1061,11 +1432,13 @@ class PrettyMIDI(object):
         note_offs = np.array([note.end for instrument in self.instruments
                               for note in instrument.notes])
         adjusted_note_offs = np.interp(note_offs, original_times, new_times)
-        # Correct notes
+        # Correct notes.  They are copies which only the new note lists hold,
+        # so set the times directly rather than recording each edit.
         for n, note in enumerate([note for instrument in self.instruments
                                   for note in instrument.notes]):
-            note.start = (adjusted_note_ons[n] > 0)*adjusted_note_ons[n]
-            note.end = (adjusted_note_offs[n] > 0)*adjusted_note_offs[n]
+            note.__dict__.update(
+                start=(adjusted_note_ons[n] > 0)*adjusted_note_ons[n],
+                end=(adjusted_note_offs[n] > 0)*adjusted_note_offs[n])
         # After performing alignment, some notes may have an end time which is
         # on or before the start time.  Remove these!
         self.remove_invalid_notes()
@@ -1234,6 +1607,88 @@ class PrettyMIDI(object):
         # Update the tick-to-time mapping
         self._update_tick_to_time(self._tick_scales[-1][0] + 1)
 
+    def slice(self, start, end, rebase=True):
+        """Get the MIDI data between two times as a new ``PrettyMIDI`` object.
+
+        Notes which overlap ``[start, end)`` are included, truncated to the
+        time range.  The state at ``start`` is carried into the slice: the
+        tempo, time signature and key signature in effect, and the most
+        recent pitch bend and value of each control change number (e.g. the
+        sustain pedal) of each instrument are placed at the start of the
+        slice.  Every instrument is included, even if it has no notes in the
+        time range, so instrument indices match those of this object.
+
+        Finding the events in the time range uses cached indices, so cutting
+        a file into many slices only costs a binary search per slice plus the
+        number of events in each slice.
+
+        Parameters
+        ----------
+        start : float
+            Start of the time range, in seconds.
+        end : float
+            End of the time range, in seconds.
+        rebase : bool
+            If ``True`` (the default), shift all event times so that the
+            slice starts at time 0.  If ``False``, keep the original times and
+            tempo map, and share the event objects which lie entirely within
+            the time range with this object, rather than copying them.
+            Modifying a shared event then modifies it in both objects.
+
+        Returns
+        -------
+        sliced : pretty_midi.PrettyMIDI
+            The MIDI data between ``start`` and ``end``.
+
+        """
+        offset = start if rebase else 0.
+        sliced = PrettyMIDI(resolution=self.resolution)
+
+        # Carry over the tempo in effect at start and any tempo changes before
+        # end.  Without rebasing, the tempo map can just be copied.
+        if rebase:
+            tempo_change_times, _ = self.get_tempo_changes()
+            active = max(np.searchsorted(tempo_change_times, start,
+                                         side='right') - 1, 0)
+            last_tick, last_tick_scale = 0, self._tick_scales[active][1]
+            sliced._tick_scales = [(last_tick, last_tick_scale)]
+            previous_time = start
+            for n in range(active + 1, len(self._tick_scales)):
+                time, tick_scale = tempo_change_times[n], \
+                    self._tick_scales[n][1]
+                if time >= end:
+                    break
+                # Convert the tempo change time to a tick, as in adjust_times
+                tick = int(round(
+                    last_tick + (time - previous_time)/last_tick_scale))
+                if tick_scale != last_tick_scale:
+                    sliced._tick_scales.append((tick, tick_scale))
+                    previous_time = time
+                    last_tick, last_tick_scale = tick, tick_scale
+        else:
+            sliced._tick_scales = list(self._tick_scales)
+        sliced._update_tick_to_time(sliced._tick_scales[-1][0] + 1)
+
+        # Carry over the meta-events in effect at start, then add those in
+        # the time range
+        for name in ['time_signature_changes', 'key_signature_changes']:
+            order, times = self._get_event_order(name)
+            active, events = _window(getattr(self, name), order, times,
+                                     start, end)
+            if active is not None:
+                getattr(sliced, name).append(_moved(active, start - offset))
+            getattr(sliced, name).extend(
+                _moved(event, event.time - offset) for event in events)
+        order, times = self._get_event_order('lyrics')
+        _, lyrics = _window(self.lyrics, order, times, start, end,
+                            carry=False)
+        sliced.lyrics = [_moved(lyric, lyric.time - offset)
+                         for lyric in lyrics]
+
+        for instrument in self.instruments:
+            sliced.instruments.append(instrument._slice(start, end, rebase))
+        return sliced
+
     def remove_invalid_notes(self):
         """Removes any notes whose end time is before or at their start time.
 
@@ -1242,6 +1697,19 @@ class PrettyMIDI(object):
         for instrument in self.instruments:
             instrument.remove_invalid_notes()
 
+    def _get_channels(self):
+        """Returns the MIDI channel of each instrument, as used when writing
+        and rendering with a single synthesizer."""
+        # Create a list of possible channels to assign - this seems to matter
+        # for some synths.
+        channels = list(range(16))
+        # Don't assign the drum channel by mistake!
+        channels.remove(9)
+        # If it's a drum instrument, we need to set channel to 9, otherwise
+        # choose a channel from the possible channel list
+        return [9 if instrument.is_drum else channels[n % len(channels)]
+                for n, instrument in enumerate(self.instruments)]
+
     def write(self, filename):
         """Write the MIDI data out to a .mid file.
 
@@ -1341,24 +1809,14 @@ class PrettyMIDI(object):
         timing_track.append(mido.MetaMessage(
             'end_of_track', time=timing_track[-1].time + 1))
         mid.tracks.append(timing_track)
-        # Create a list of possible channels to assign - this seems to matter
-        # for some synths.
-        channels = list(range(16))
-        # Don't assign the drum channel by mistake!
-        channels.remove(9)
-        for n, instrument in enumerate(self.instruments):
+        for instrument, channel in zip(self.instruments,
+                                       self._get_channels()):
             # Initialize track for this instrument
             track = mido.MidiTrack()
             # Add track name event if instrument has a name
             if instrument.name:
                 track.append(mido.MetaMessage(
                     'track_name', time=0, name=instrument.name))
-            # If it's a drum event, we need to set channel to 9
-            if instrument.is_drum:
-                channel = 9
-            # Otherwise, choose a channel from the possible channel list
-            else:
-                channel = channels[n % len(channels)]
             # Set the program number
             track.append(mido.Message(
                 'program_change', time=0, program=instrument.program,
@@ -1417,3 +1875,236 @@ class PrettyMIDI(object):
         else:
             # Otherwise, try passing it in as a file pointer
             mid.save(file=filename)
+
+
+class _InstrumentLoader(object):
+    """Sorts note, pitch bend and control change events into instruments,
+    pairing note-ons with note-offs, one event at a time.
+
+    MIDI files can contain a collection of tracks; each track can have events
+    occuring on one of sixteen channels, and events can correspond to
+    different instruments according to the most recently occurring program
+    number.  So, we need to keep track of which instrument is playing on each
+    track on each channel.
+
+    Parameters
+    ----------
+    instruments : list
+        List which each new ``Instrument`` is appended to when it is created.
+    tick_to_time : np.ndarray
+        Maps ticks to times in seconds, for events whose time isn't given.
+
+    """
+
+    def __init__(self, instruments, tick_to_time=None):
+        self.instruments = instruments
+        self.tick_to_time = tick_to_time
+        # Maps from program number, drum/not drum, channel, and track index
+        # to instruments
+        self.instrument_map = {}
+        # Store a similar mapping to instruments storing "straggler events",
+        # e.g. events which appear before we want to initialize an Instrument
+        self.stragglers = {}
+        # Maps track indices to any track names encountered
+        self.track_name_map = collections.defaultdict(str)
+        # For each track, keep track of last note on location:
+        # key = (instrument, note),
+        # value = list of (note-on tick, note-on time, velocity)
+        self.last_note_on = collections.defaultdict(
+            lambda: collections.defaultdict(list))
+        # For each track, keep track of which instrument is playing in each
+        # channel, initialized to program 0 for all channels
+        self.current_instrument = collections.defaultdict(
+            lambda: np.zeros(16, dtype=int))
+
+    def _get_instrument(self, program, channel, track, create_new):
+        """Gets the Instrument corresponding to the given program number,
+        drum/non-drum type, channel, and track index.  If no such instrument
+        exists, one is created.
+
+        """
+        # If we have already created an instrument for this program
+        # number/track/channel, return it
+        if (program, channel, track) in self.instrument_map:
+            return self.instrument_map[(program, channel, track)]
+        # If there's a straggler instrument for this instrument and we
+        # aren't being requested to create a new instrument
+        if not create_new and (channel, track) in self.stragglers:
+            return self.stragglers[(channel, track)]
+        # If we are told to, create a new instrument and store it
+        if create_new:
+            is_drum = (channel == 9)
+            instrument = Instrument(
+                program, is_drum, self.track_name_map[track])
+            # If any events appeared for this instrument before now,
+            # include them in the new instrument
+            if (channel, track) in self.stragglers:
+                straggler = self.stragglers[(channel, track)]
+                instrument.control_changes = straggler.control_changes
+                instrument.pitch_bends = straggler.pitch_bends
+            # Add the instrument to the instrument map
+            self.instrument_map[(program, channel, track)] = instrument
+            self.instruments.append(instrument)
+        # Otherwise, create a "straggler" instrument which holds events
+        # which appear before we actually want to create a proper new
+        # instrument
+        else:
+            # Create a "straggler" instrument
+            instrument = Instrument(program, self.track_name_map[track])
+            # Note that stragglers ignores program number, because we want
+            # to store all events on a track which appear before the first
+            # note-on, regardless of program
+            self.stragglers[(channel, track)] = instrument
+        return instrument
+
+    def add(self, event, track, tick, time=None):
+        """Processes a single event.
+
+        Parameters
+        ----------
+        event : mido.Message or mido.MetaMessage
+            The event.
+        track : int
+            Index of the track the event is on.
+        tick : int
+            Absolute time of the event, in ticks.
+        time : float
+            Absolute time of the event, in seconds.  Default ``None``, which
+            looks it up in ``tick_to_time``.
+
+        """
+        # Look for track name events
+        if event.type == 'track_name':
+            # Set the track name for the current track
+            self.track_name_map[track] = event.name
+        # Look for program change events
+        if event.type == 'program_change':
+            # Update the instrument for this channel
+            self.current_instrument[track][event.channel] = event.program
+        # Note ons are note on events with velocity > 0
+        elif event.type == 'note_on' and event.velocity > 0:
+            # Store this as the last note-on location
+            note_on_index = (event.channel, event.note)
+            if time is None:
+                time = self.tick_to_time[tick]
+            self.last_note_on[track][note_on_index].append((
+                tick, time, event.velocity))
+        # Note offs can also be note on events with 0 velocity
+        elif event.type == 'note_off' or (event.type == 'note_on' and
+                                          event.velocity == 0):
+            last_note_on = self.last_note_on[track]
+            # Check that a note-on exists (ignore spurious note-offs)
+            key = (event.channel, event.note)
+            if key in last_note_on:
+                # Get the start/stop times and velocity of every note
+                # which was turned on with this instrument/drum/pitch.
+                # One note-off may close multiple note-on events from
+                # previous ticks. In case there's a note-off and then
+                # note-on at the same tick we keep the open note from
+                # this tick.
+                end_tick = tick
+                if time is None:
+                    time = self.tick_to_time[tick]
+                open_notes = last_note_on[key]
+
+                notes_to_close = [
+                    (start_tick, start_time, velocity)
+                    for start_tick, start_time, velocity in open_notes
+                    if start_tick != end_tick]
+                notes_to_keep = [
+                    (start_tick, start_time, velocity)
+                    for start_tick, start_time, velocity in open_notes
+                    if start_tick == end_tick]
+
+                for start_tick, start_time, velocity in notes_to_close:
+                    # Create the note event
+                    note = Note(velocity, event.note, start_time, time)
+                    # Get the program and drum type for the current
+                    # instrument
+                    program = self.current_instrument[track][event.channel]
+                    # Retrieve the Instrument instance for the current
+                    # instrument
+                    # Create a new instrument if none exists
+                    instrument = self._get_instrument(
+                        program, event.channel, track, 1)
+                    # Add the note event
+                    instrument.notes.append(note)
+
+                if len(notes_to_close) > 0 and len(notes_to_keep) > 0:
+                    # Note-on on the same tick but we already closed
+                    # some previous notes -> it will continue, keep it.
+                    last_note_on[key] = notes_to_keep
+                else:
+                    # Remove the last note on for this instrument
+                    del last_note_on[key]
+        # Store pitch bends
+        elif event.type == 'pitchwheel':
+            if time is None:
+                time = self.tick_to_time[tick]
+            # Create pitch bend class instance
+            bend = PitchBend(event.pitch, time)
+            # Get the program for the current inst
+            program = self.current_instrument[track][event.channel]
+            # Retrieve the Instrument instance for the current inst
+            # Don't create a new instrument if none exists
+            instrument = self._get_instrument(
+                program, event.channel, track, 0)
+            # Add the pitch bend event
+            instrument.pitch_bends.append(bend)
+        # Store control changes
+        elif event.type == 'control_change':
+            if time is None:
+                time = self.tick_to_time[tick]
+            control_change = ControlChange(
+                event.control, event.value, time)
+            # Get the program for the current inst
+            program = self.current_instrument[track][event.channel]
+            # Retrieve the Instrument instance for the current inst
+            # Don't create a new instrument if none exists
+            instrument = self._get_instrument(
+                program, event.channel, track, 0)
+            # Add the control change event
+            instrument.control_changes.append(control_change)
+
+
+def _normalize(synthesized):
+    """Scales synthesized audio in place to a peak of 1, unless it is silent,
+    and returns it."""
+    peak = np.abs(synthesized).max() if synthesized.size > 0 else 0.
+    if peak > 0:
+        synthesized /= peak
+    return synthesized
+
+
+def _render_instrument(args):
+    """Calls the rendering method named ``method`` of an instrument."""
+    instrument, method, kwargs = args
+    return getattr(instrument, method)(**kwargs)
+
+
+def _mix_instruments(synthesized, instruments, method, kwargs, workers,
+                     pool_class):
+    """Renders each instrument with its method named ``method``, in a pool of
+    ``workers`` workers of ``pool_class`` unless ``workers`` is ``None``, and
+    adds each waveform into the start of ``synthesized`` as it arrives.  The
+    waveforms are added in the order of the instruments, so that they are
+    always mixed in the same order, and only those not yet added are held in
+    memory.
+
+    """
+    tasks = [(instrument, method, kwargs) for instrument in instruments]
+    if workers is None or len(tasks) < 2:
+        for task in tasks:
+            waveform = _render_instrument(task)
+            synthesized[:waveform.shape[0]] += waveform
+        return
+    pool = pool_class(min(workers, len(tasks)))
+    try:
+        for waveform in pool.imap(_render_instrument, tasks, chunksize=1):
+            synthesized[:waveform.shape[0]] += waveform
+    except BaseException:
+        # Don't wait for the remaining instruments
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
@@ -0,0 +1,554 @@
+"""The FluidSynthRenderer class renders MIDI data with fluidsynth, keeping
+synthesizers and the soundfonts loaded into them alive between renders.
+
+"""
+import os
+import struct
+import threading
+
+import numpy as np
+try:
+    import fluidsynth
+    _HAS_FLUIDSYNTH = True
+except ImportError:
+    _HAS_FLUIDSYNTH = False
+import pkg_resources
+
+DEFAULT_SF2 = 'TimGM6mb.sf2'
+
+# Controllers sent to every channel after a render by synthesizers which
+# can't be reset, so that nothing carries over to the next one: all notes
+# off, all sound off, reset all controllers
+_RESET_CONTROLLERS = [123, 120, 121]
+# Power-up values of the controllers which resetting all controllers leaves
+# alone, which are then restored explicitly: bank select, volume, pan,
+# expression, and reverb and chorus send
+_DEFAULT_CONTROLLERS = [(0, 0), (32, 0), (7, 100), (10, 64), (11, 127),
+                        (91, 40), (93, 0)]
+# Largest number of samples pulled from a synthesizer at once
+_MAX_PULL = 2**16
+
+
+def _select_program(fl, channel, sfid, instrument):
+    """Selects the program of an instrument on a channel of a synthesizer.
+    Drum instruments use bank 128."""
+    if instrument.is_drum:
+        # Try to use the supplied program number
+        res = fl.program_select(channel, sfid, 128, instrument.program)
+        # If the result is -1, there's no preset with this program number, so
+        # use preset 0
+        if res == -1:
+            fl.program_select(channel, sfid, 128, 0)
+    else:
+        fl.program_select(channel, sfid, 0, instrument.program)
+
+
+def _get_end_time(instrument):
+    """Returns the time that rendering an instrument stops at, before 1 second
+    of silence is added.  Notes can end before they start, so this is also at
+    least the last note's start."""
+    return max(instrument.get_end_time(),
+               instrument._get_note_order()[1][-1])
+
+
+def _get_n_samples(instrument, fs):
+    """Returns the number of samples of an instrument rendered by
+    :func:`FluidSynthRenderer.render_instrument`."""
+    if len(instrument.notes) == 0:
+        return 0
+    return int(np.ceil(fs*(_get_end_time(instrument) + 1.)))
+
+
+def _send_event(fl, channel, event_type, value1, value2):
+    """Sends an event from ``iter_events`` to a synthesizer."""
+    if event_type == 'note_on':
+        fl.noteon(channel, value1, value2)
+    elif event_type == 'note_off':
+        fl.noteoff(channel, value1)
+    elif event_type == 'pitchwheel':
+        fl.pitch_bend(channel, value1)
+    elif event_type == 'control_change':
+        fl.cc(channel, value1, value2)
+
+
+def _allocate(n_samples, stereo, dtype):
+    """Returns a buffer of zeros for ``n_samples`` mono or stereo samples."""
+    return np.zeros((n_samples, 2) if stereo else n_samples, dtype=dtype)
+
+
+def _iter_samples(fl, events, end, fs, quantum):
+    """Sends events, as ``(time, channel, type, value1, value2)``, to a
+    synthesizer, and yields the samples it renders up to sample ``end``, as
+    ``(first_sample, frames)`` where ``frames`` is a (n, 2) array.
+
+    Each event's sample is rounded up to the next multiple of ``quantum``
+    (i.e. the start of the following quantum, unless it is already on a
+    boundary), and the event is sent once the samples before it have been
+    pulled, so the samples for all events in a quantum are pulled from the
+    synthesizer at once.  Samples are always pulled in whole quanta,
+    so when ``quantum`` is a multiple of fluidsynth's internal block size of
+    64 samples, events take effect at the same samples they would if sent at
+    their exact sample, and the synthesizer stays aligned to its blocks
+    between renders.
+
+    """
+    # Long gaps between events are pulled in pieces of at most this many
+    # samples, so that memory use is bounded
+    max_pull = max(_MAX_PULL//quantum, 1)*quantum
+
+    def pull(first, last):
+        while first < last:
+            # Pull whole quanta, discarding any samples after last
+            n_samples = min(-(-(last - first)//quantum)*quantum, max_pull)
+            frames = fl.get_samples(n_samples).reshape(-1, 2)
+            yield first, frames[:last - first]
+            first += n_samples
+
+    current_sample = None
+    for time, channel, event_type, value1, value2 in events:
+        # Round the event's sample up to the next multiple of quantum
+        sample = -(-int(fs*time)//quantum)*quantum
+        if current_sample is not None and sample > current_sample:
+            for chunk in pull(current_sample, sample):
+                yield chunk
+        current_sample = sample
+        _send_event(fl, channel, event_type, value1, value2)
+    for chunk in pull(current_sample, end):
+        yield chunk
+
+
+def _play(fl, events, synthesized, end, fs, quantum):
+    """Sends events to a synthesizer as in :func:`_iter_samples`, and writes
+    the samples it renders into ``synthesized``, keeping only the left
+    channel if it is 1-dimensional."""
+    for first, frames in _iter_samples(fl, events, end, fs, quantum):
+        if synthesized.ndim == 1:
+            frames = frames[:, 0]
+        synthesized[first:first + frames.shape[0]] = frames
+
+
+def _get_channel_plan(midi_data):
+    """Returns the channel each instrument of ``midi_data`` is played on by a
+    single synthesizer (``None`` for instruments without notes, which aren't
+    rendered), and the time rendering stops at before 1 second of silence is
+    added (``None`` if no instrument has notes)."""
+    channels = [channel if len(instrument.notes) > 0 else None
+                for instrument, channel in zip(midi_data.instruments,
+                                               midi_data._get_channels())]
+    if all(channel is None for channel in channels):
+        return channels, None
+    end_time = max(_get_end_time(instrument) for instrument, channel
+                   in zip(midi_data.instruments, channels)
+                   if channel is not None)
+    return channels, end_time
+
+
+def _start_channels(fl, sfid, midi_data, channels):
+    """Selects the program of each instrument on its channel, and returns
+    the events to send to the synthesizer, for :func:`_iter_samples`."""
+    for instrument, channel in zip(midi_data.instruments, channels):
+        if channel is not None:
+            _select_program(fl, channel, sfid, instrument)
+    return ((time, channels[instrument], event_type, value1, value2)
+            for time, event_type, instrument, value1, value2
+            in midi_data.iter_events()
+            if instrument is not None and channels[instrument] is not None)
+
+
+class FluidSynthRenderer(object):
+    """Renders instruments and ``PrettyMIDI`` objects with fluidsynth.
+
+    Creating a synthesizer and loading a soundfont into it usually takes
+    longer than rendering a short clip, so a renderer keeps its synthesizers,
+    with the soundfonts loaded into them, for later renders.  After each
+    render, the synthesizer is reset to its power-up state, so that no
+    notes, controller values (such as volume, pan or effect sends),
+    programs or reverb and chorus tails carry over to the next render.
+
+    A renderer can be shared by threads; each concurrent render uses its own
+    synthesizer.
+
+    Parameters
+    ----------
+    sf2_path : str
+        Path to the .sf2 file to use when a render doesn't specify one.
+        Default ``None``, which uses the TimGM6mb.sf2 file included with
+        ``pretty_midi``.
+
+    Examples
+    --------
+    Render many files without reloading the soundfont for each one:
+
+    >>> with FluidSynthRenderer() as renderer:
+    ...     for filename in filenames:
+    ...         audio = renderer.render(PrettyMIDI(filename))
+
+    """
+
+    def __init__(self, sf2_path=None):
+        self.sf2_path = sf2_path
+        self._lock = threading.Lock()
+        # Idle synthesizers for each sampling rate, each paired with a dict
+        # mapping soundfont paths to the IDs they were loaded with
+        self._idle = {}
+        self._synths = []
+
+    def _get_sf2_path(self, sf2_path):
+        """Returns the soundfont path to use for a render, checking that
+        fluidsynth is available and the soundfont exists."""
+        if sf2_path is None:
+            sf2_path = self.sf2_path
+        # If sf2_path is None, use the included TimGM6mb.sf2 path
+        if sf2_path is None:
+            sf2_path = pkg_resources.resource_filename(__name__, DEFAULT_SF2)
+        if not _HAS_FLUIDSYNTH:
+            raise ImportError("fluidsynth() was called but pyfluidsynth "
+                              "is not installed.")
+        if not os.path.exists(sf2_path):
+            raise ValueError("No soundfont file found at the supplied path "
+                             "{}".format(sf2_path))
+        return sf2_path
+
+    def _acquire(self, fs, sf2_path):
+        """Returns an idle synthesizer at ``fs`` (creating one if there are
+        none), its soundfonts and the ID of the soundfont ``sf2_path``."""
+        with self._lock:
+            idle = self._idle.setdefault(fs, [])
+            synth = idle.pop() if idle else None
+        if synth is None:
+            synth = (fluidsynth.Synth(samplerate=fs), {})
+            with self._lock:
+                self._synths.append(synth[0])
+        fl, soundfonts = synth
+        if sf2_path not in soundfonts:
+            soundfonts[sf2_path] = fl.sfload(sf2_path)
+        return fl, soundfonts, soundfonts[sf2_path]
+
+    def _release(self, fs, fl, soundfonts):
+        """Resets a synthesizer to its power-up state and makes it idle."""
+        if hasattr(fl, 'system_reset'):
+            # Stops all voices, resets the controllers, program and pitch
+            # bend of every channel, and clears the reverb and chorus
+            fl.system_reset()
+        else:
+            # Older versions of pyfluidsynth can't reset the synthesizer, so
+            # restore the channels' state (but not the effects) by hand
+            for channel in range(16):
+                for number in _RESET_CONTROLLERS:
+                    fl.cc(channel, number, 0)
+                for number, value in _DEFAULT_CONTROLLERS:
+                    fl.cc(channel, number, value)
+                fl.program_change(channel, 0)
+                fl.pitch_bend(channel, 0)
+        with self._lock:
+            self._idle[fs].append((fl, soundfonts))
+
+    def render_instrument(self, instrument, fs=44100, sf2_path=None,
+                          quantum=64, stereo=False, dtype=np.float64):
+        """Synthesizes an instrument, as in
+        :func:`pretty_midi.Instrument.fluidsynth`.
+
+        Parameters
+        ----------
+        instrument : pretty_midi.Instrument
+            The instrument to synthesize.
+        fs : int
+            Sampling rate to synthesize at.
+        sf2_path : str
+            Path to a .sf2 file.  Default ``None``, which uses the
+            renderer's soundfont.
+        quantum : int
+            Events are sent to the synthesizer at their sample rounded up
+            to the next multiple of this many samples.  fluidsynth renders
+            in blocks of 64 samples, so events only ever take effect at the
+            next multiple of 64 samples anyway.  Use 1 to send each event at
+            its exact sample.
+        stereo : bool
+            If ``True``, return both channels of the synthesizer's output.
+        dtype : np.dtype
+            Floating point type of the synthesized audio.
+
+        Returns
+        -------
+        synthesized : np.ndarray
+            Waveform of the instrument, synthesized at ``fs``, with shape
+            ``(n_samples,)``, or ``(n_samples, 2)`` if ``stereo`` is
+            ``True``.
+
+        """
+        sf2_path = self._get_sf2_path(sf2_path)
+        # If the instrument has no notes, return an empty array
+        if len(instrument.notes) == 0:
+            return _allocate(0, stereo, dtype)
+        fl, soundfonts, sfid = self._acquire(fs, sf2_path)
+        try:
+            # If this is a drum instrument, use channel 9, otherwise just use
+            # channel 0
+            channel = 9 if instrument.is_drum else 0
+            _select_program(fl, channel, sfid, instrument)
+            # Add in the samples between consecutive events, starting with
+            # some silence according to the time of the first event, and
+            # including 1 second of silence at the end
+            end_time = _get_end_time(instrument)
+            synthesized = _allocate(_get_n_samples(instrument, fs), stereo,
+                                    dtype)
+            events = ((time, channel, event_type, value1, value2)
+                      for time, event_type, value1, value2
+                      in instrument.iter_events())
+            _play(fl, events, synthesized, int(fs*(end_time + 1.)), fs,
+                  quantum)
+        finally:
+            self._release(fs, fl, soundfonts)
+        return synthesized
+
+    def render_channels(self, midi_data, fs=44100, sf2_path=None,
+                        quantum=64, stereo=False, dtype=np.float64):
+        """Synthesizes all instruments of a ``PrettyMIDI`` object with one
+        synthesizer, playing each on its own channel.
+
+        Instruments are assigned to channels as in
+        :func:`pretty_midi.PrettyMIDI.write`: drum instruments use channel
+        9, and the others take turns using the remaining 15 channels.
+        Instruments which share a channel also share its program and
+        controllers, as when the written file is played.
+
+        Parameters
+        ----------
+        midi_data : pretty_midi.PrettyMIDI
+            The MIDI data to synthesize.
+        fs : int
+            Sampling rate to synthesize at.
+        sf2_path : str
+            Path to a .sf2 file.  Default ``None``, which uses the
+            renderer's soundfont.
+        quantum : int
+            Multiple of samples which event times are rounded up to,
+            see :func:`render_instrument`.
+        stereo : bool
+            If ``True``, return both channels of the synthesizer's output.
+        dtype : np.dtype
+            Floating point type of the synthesized audio.
+
+        Returns
+        -------
+        synthesized : np.ndarray
+            Waveform of the MIDI data, synthesized at ``fs``, not normalized,
+            with shape ``(n_samples,)``, or ``(n_samples, 2)`` if ``stereo``
+            is ``True``.
+
+        """
+        sf2_path = self._get_sf2_path(sf2_path)
+        channels, end_time = _get_channel_plan(midi_data)
+        if end_time is None:
+            return _allocate(0, stereo, dtype)
+        fl, soundfonts, sfid = self._acquire(fs, sf2_path)
+        try:
+            events = _start_channels(fl, sfid, midi_data, channels)
+            synthesized = _allocate(int(np.ceil(fs*(end_time + 1.))), stereo,
+                                    dtype)
+            # Include 1 second of silence at the end
+            _play(fl, events, synthesized, int(fs*(end_time + 1.)), fs,
+                  quantum)
+        finally:
+            self._release(fs, fl, soundfonts)
+        return synthesized
+
+    def render_blocks(self, midi_data, fs=44100, sf2_path=None,
+                      block_size=4096, quantum=64, stereo=False,
+                      dtype=np.float64):
+        """Synthesizes all instruments of a ``PrettyMIDI`` object with one
+        synthesizer, as in :func:`render_channels`, in fixed-size blocks, so
+        that the memory used doesn't depend on the length of the MIDI data.
+
+        The synthesizer is in use until the generator is exhausted or
+        closed.
+
+        Parameters
+        ----------
+        midi_data : pretty_midi.PrettyMIDI
+            The MIDI data to synthesize.
+        fs : int
+            Sampling rate to synthesize at.
+        sf2_path : str
+            Path to a .sf2 file.  Default ``None``, which uses the
+            renderer's soundfont.
+        block_size : int
+            Number of samples in each block.
+        quantum : int
+            Multiple of samples which event times are rounded up to,
+            see :func:`render_instrument`.
+        stereo : bool
+            If ``True``, yield both channels of the synthesizer's output.
+        dtype : np.dtype
+            Floating point type of the blocks.
+
+        Yields
+        ------
+        block : np.ndarray
+            The next ``block_size`` samples of the output of
+            :func:`render_channels`, with shape ``(block_size,)``, or
+            ``(block_size, 2)`` if ``stereo`` is ``True``.  The last block
+            may be shorter.
+
+        """
+        sf2_path = self._get_sf2_path(sf2_path)
+        channels, end_time = _get_channel_plan(midi_data)
+        if end_time is None:
+            return
+        n_samples = int(np.ceil(fs*(end_time + 1.)))
+        fl, soundfonts, sfid = self._acquire(fs, sf2_path)
+        try:
+            events = _start_channels(fl, sfid, midi_data, channels)
+            # Sample the current block starts at
+            block_first = 0
+            block = _allocate(min(block_size, n_samples), stereo, dtype)
+            for first, frames in _iter_samples(
+                    fl, events, int(fs*(end_time + 1.)), fs, quantum):
+                if not stereo:
+                    frames = frames[:, 0]
+                while frames.shape[0] > 0:
+                    # Yield the blocks which end before these samples
+                    # start (the samples are only discontiguous before the
+                    # first event)
+                    while first >= block_first + block.shape[0]:
+                        yield block
+                        block_first += block.shape[0]
+                        block = _allocate(
+                            min(block_size, n_samples - block_first), stereo,
+                            dtype)
+                    n = min(frames.shape[0],
+                            block_first + block.shape[0] - first)
+                    block[first - block_first:first - block_first + n] = \
+                        frames[:n]
+                    first += n
+                    frames = frames[n:]
+            # Yield the rest of the blocks
+            while block_first < n_samples:
+                yield block
+                block_first += block.shape[0]
+                block = _allocate(min(block_size, n_samples - block_first),
+                                  stereo, dtype)
+        finally:
+            self._release(fs, fl, soundfonts)
+
+    def render(self, midi_data, fs=44100, sf2_path=None, workers=None,
+               multichannel=False, quantum=64, stereo=False, start=None,
+               duration=None, dtype=np.float64):
+        """Synthesizes a ``PrettyMIDI`` object, as in
+        :func:`pretty_midi.PrettyMIDI.fluidsynth`.
+
+        Parameters
+        ----------
+        midi_data : pretty_midi.PrettyMIDI
+            The MIDI data to synthesize.
+        fs : int
+            Sampling rate to synthesize at.
+        sf2_path : str
+            Path to a .sf2 file.  Default ``None``, which uses the
+            renderer's soundfont.
+        workers : int
+            Number of threads to synthesize instruments in.  Default
+            ``None``, which synthesizes them one after another.
+        multichannel : bool
+            If ``True``, synthesize all instruments with one synthesizer, as
+            in :func:`render_channels`.
+        quantum : int
+            Multiple of samples which event times are rounded up to,
+            see :func:`render_instrument`.
+        stereo : bool
+            If ``True``, return both channels of the synthesizer's output.
+        dtype : np.dtype
+            Floating point type of the synthesized audio.
+        start : float
+            Time to start synthesizing at, in seconds.  Default ``None``,
+            which starts at the beginning.
+        duration : float
+            Maximum length of the synthesized audio, in seconds.  Default
+            ``None``, which synthesizes until 1 second after the end.
+
+        Returns
+        -------
+        synthesized : np.ndarray
+            Waveform of the MIDI data, synthesized at ``fs``, with shape
+            ``(n_samples,)``, or ``(n_samples, 2)`` if ``stereo`` is
+            ``True``.
+
+        """
+        return midi_data.fluidsynth(fs=fs, sf2_path=sf2_path,
+                                    workers=workers, renderer=self,
+                                    multichannel=multichannel,
+                                    quantum=quantum, stereo=stereo,
+                                    start=start, duration=duration,
+                                    dtype=dtype)
+
+    def close(self):
+        """Deletes all of the renderer's synthesizers."""
+        with self._lock:
+            for fl in self._synths:
+                fl.delete()
+            self._synths = []
+            self._idle = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _WavWriter(object):
+    """Writes audio to a WAV file block by block, with samples in [-1, 1]
+    stored as 16-bit integers (clipped) or 32-bit floats.  The sizes in the
+    header are filled in on closing, so the length needn't be known up front.
+
+    """
+
+    def __init__(self, path, fs, n_channels, dtype):
+        if dtype not in ('int16', 'float32'):
+            raise ValueError("dtype should be 'int16' or 'float32', not "
+                             "{}".format(dtype))
+        self.dtype = dtype
+        self.n_channels = n_channels
+        self.n_bytes = 0
+        sample_width = 2 if dtype == 'int16' else 4
+        # WAVE_FORMAT_PCM or WAVE_FORMAT_IEEE_FLOAT
+        format_tag = 1 if dtype == 'int16' else 3
+        self.file = open(path, 'wb')
+        self.file.write(b'RIFF\x00\x00\x00\x00WAVE')
+        self.file.write(b'fmt ' + struct.pack(
+            '<IHHIIHHH', 18, format_tag, n_channels, fs,
+            fs*n_channels*sample_width, n_channels*sample_width,
+            8*sample_width, 0))
+        if dtype == 'float32':
+            # Non-PCM formats have a fact chunk with the number of frames
+            self.file.write(b'fact' + struct.pack('<II', 4, 0))
+        self.file.write(b'data\x00\x00\x00\x00')
+
+    def write(self, block):
+        """Writes a block of samples, with shape (n_samples,) or
+        (n_samples, n_channels)."""
+        if self.dtype == 'int16':
+            block = np.round(np.clip(block, -1, 1)*32767).astype('<i2')
+        else:
+            block = block.astype('<f4')
+        block.tofile(self.file)
+        self.n_bytes += block.nbytes
+
+    def close(self):
+        """Fills in the sizes in the header and closes the file."""
+        header_size = self.file.tell() - self.n_bytes
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', header_size - 8 + self.n_bytes))
+        if self.dtype == 'float32':
+            self.file.seek(header_size - 12)
+            self.file.write(struct.pack(
+                '<I', self.n_bytes//(4*self.n_channels)))
+        self.file.seek(header_size - 4)
+        self.file.write(struct.pack('<I', self.n_bytes))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,354 @@
+"""The EventTokenizer class converts MIDI data to and from sequences of integer
+event tokens, for use with sequence models.
+
+"""
+import numpy as np
+
+from .pretty_midi import PrettyMIDI
+from .instrument import Instrument
+from .containers import Note
+
+# Kinds of events, in the order they are emitted when they occur at the same
+# time step
+_BAR, _NOTE_OFF, _NOTE_ON = 0, 1, 2
+
+
+class EventTokenizer(object):
+    """Converts MIDI data to and from sequences of event tokens.
+
+    Notes are represented by note-on and note-off tokens for each pitch,
+    separated by time-shift tokens, with a velocity token before each note-on
+    whose velocity bin differs from that of the previous note-on.  Optionally,
+    a bar token is placed at each downbeat (from
+    :func:`pretty_midi.PrettyMIDI.get_downbeats`) and a position token, giving
+    the position within the bar, before the first note event at each time.
+    Bar and position tokens only annotate the sequence; timing is always
+    given by the time-shift tokens.
+
+    The tokens are laid out as follows:
+
+    ======================  ==================================================
+    Tokens                  Meaning
+    ======================  ==================================================
+    ``[0, 128)``            Note-on for each pitch
+    ``[128, 256)``          Note-off for each pitch
+    ``[256, 256 + m)``      Time shift of ``1, ..., m`` steps, where ``m`` is
+                            ``max_time_shift``
+    next ``n_velocities``   Velocity bin
+    next 1                  Bar (if ``bars``)
+    next ``n_positions``    Position within the bar (if ``bars``)
+    ======================  ==================================================
+
+    Parameters
+    ----------
+    fs : int
+        Number of time steps per second.
+    max_time_shift : int
+        Largest number of time steps in a single time-shift token.  Longer
+        shifts are encoded as several tokens.
+    n_velocities : int
+        Number of velocity bins.
+    bars : bool
+        Whether to include bar and position tokens.
+    n_positions : int
+        Number of positions in each bar, when ``bars`` is ``True``.
+    include_drums : bool
+        Whether to include the notes of drum instruments.
+
+    Attributes
+    ----------
+    vocab_size : int
+        Total number of distinct tokens.
+
+    Examples
+    --------
+    >>> tokenizer = EventTokenizer()
+    >>> tokens = tokenizer.encode(pretty_midi.PrettyMIDI('example.mid'))
+    >>> midi_data = tokenizer.decode(tokens)
+
+    """
+
+    def __init__(self, fs=100, max_time_shift=100, n_velocities=32,
+                 bars=False, n_positions=16, include_drums=False):
+        if n_velocities < 1 or n_velocities > 128:
+            raise ValueError('n_velocities must be between 1 and 128.')
+        self.fs = fs
+        self.max_time_shift = max_time_shift
+        self.n_velocities = n_velocities
+        self.bars = bars
+        self.n_positions = n_positions
+        self.include_drums = include_drums
+        self.note_on_offset = 0
+        self.note_off_offset = 128
+        self.time_shift_offset = 256
+        self.velocity_offset = self.time_shift_offset + max_time_shift
+        self.bar_token = self.velocity_offset + n_velocities
+        self.position_offset = self.bar_token + 1
+        if bars:
+            self.vocab_size = self.position_offset + n_positions
+        else:
+            self.vocab_size = self.bar_token
+
+    def _get_events(self, midi_data):
+        """Collects the quantized events of a ``PrettyMIDI`` object.
+
+        Returns
+        -------
+        steps, kinds, pitches, velocities : np.ndarray
+            Time step, kind, pitch and velocity of each event, unsorted.
+        bar_starts, bar_lengths : np.ndarray
+            Start times and durations of the bars, in seconds.
+
+        """
+        notes = [note for instrument in midi_data.instruments
+                 if self.include_drums or not instrument.is_drum
+                 for note in instrument.notes]
+        note_data = np.array([[note.pitch, note.velocity, note.start,
+                               note.end] for note in notes],
+                             dtype=np.float64).reshape(-1, 4)
+        pitches = note_data[:, 0].astype(int)
+        velocities = note_data[:, 1].astype(int)
+        on_steps = np.round(note_data[:, 2]*self.fs).astype(int)
+        # Notes always last at least one step, so they survive quantization
+        off_steps = np.maximum(np.round(note_data[:, 3]*self.fs).astype(int),
+                               on_steps + 1)
+        steps = [off_steps, on_steps]
+        kinds = [np.full(len(notes), _NOTE_OFF), np.full(len(notes), _NOTE_ON)]
+        bar_starts = bar_lengths = np.zeros(0)
+        if self.bars and len(notes) > 0:
+            bar_starts = midi_data.get_downbeats()
+            # The last bar is assumed to be as long as the one before it
+            bar_lengths = np.diff(bar_starts)
+            if bar_lengths.size > 0:
+                last_length = bar_lengths[-1]
+            else:
+                last_length = midi_data.get_end_time() - bar_starts[0]
+            bar_lengths = np.maximum(np.append(bar_lengths, last_length),
+                                     1./self.fs)
+            steps.append(np.round(bar_starts*self.fs).astype(int))
+            kinds.append(np.full(bar_starts.shape[0], _BAR))
+        n_bars = bar_starts.shape[0]
+        return (np.concatenate(steps), np.concatenate(kinds),
+                np.concatenate([pitches, pitches, np.zeros(n_bars, int)]),
+                np.concatenate([velocities, velocities,
+                                np.zeros(n_bars, int)]),
+                bar_starts, bar_lengths)
+
+    def _encode(self, n_files, file_ids, steps, kinds, pitches, velocities,
+                bar_file_ids, bar_starts, bar_lengths):
+        """Encodes the events of one or more files, which are told apart by
+        ``file_ids``, all at once.
+
+        Returns
+        -------
+        tokens : list of np.ndarray
+            Tokens of each file.
+
+        """
+        order = np.lexsort((pitches, kinds, steps, file_ids))
+        file_ids, steps, kinds, pitches, velocities = (
+            file_ids[order], steps[order], kinds[order], pitches[order],
+            velocities[order])
+        # Time steps since the previous event, which is measured from 0 at
+        # the start of each file
+        new_file = np.ones(steps.shape[0], dtype=bool)
+        new_file[1:] = file_ids[1:] != file_ids[:-1]
+        deltas = np.diff(np.append(0, steps))
+        deltas[new_file] = steps[new_file]
+        n_shifts = (deltas + self.max_time_shift - 1)//self.max_time_shift
+        is_bar = kinds == _BAR
+        is_note = ~is_bar
+        is_on = kinds == _NOTE_ON
+        # A velocity token is needed when a note-on's bin differs from that
+        # of the previous note-on in the same file
+        bins = velocities*self.n_velocities//128
+        on_indices = np.flatnonzero(is_on)
+        needs_velocity = np.zeros(steps.shape[0], dtype=bool)
+        needs_velocity[on_indices] = True
+        needs_velocity[on_indices[1:]] = (
+            (bins[on_indices[1:]] != bins[on_indices[:-1]]) |
+            (file_ids[on_indices[1:]] != file_ids[on_indices[:-1]]))
+        # A position token is needed before the first note event at each
+        # time step
+        needs_position = np.zeros(steps.shape[0], dtype=bool)
+        if self.bars:
+            note_indices = np.flatnonzero(is_note)
+            needs_position[note_indices] = True
+            needs_position[note_indices[1:]] = (
+                (steps[note_indices[1:]] != steps[note_indices[:-1]]) |
+                (file_ids[note_indices[1:]] != file_ids[note_indices[:-1]]))
+        n_tokens = (n_shifts + is_bar + needs_position + needs_velocity +
+                    is_note)
+        ends = np.cumsum(n_tokens)
+        starts = ends - n_tokens
+        tokens = np.empty(ends[-1] if ends.size else 0, dtype=int)
+        # Time shifts are split into full-length shifts and a remainder
+        shift_starts = np.repeat(starts, n_shifts)
+        shift_ends = np.cumsum(n_shifts)
+        shift_indices = (shift_starts + np.arange(shift_starts.shape[0]) -
+                         np.repeat(shift_ends - n_shifts, n_shifts))
+        tokens[shift_indices] = (self.time_shift_offset +
+                                 self.max_time_shift - 1)
+        has_shift = n_shifts > 0
+        tokens[starts[has_shift] + n_shifts[has_shift] - 1] = (
+            self.time_shift_offset - 1 + deltas[has_shift] -
+            (n_shifts[has_shift] - 1)*self.max_time_shift)
+        # The remaining tokens of each event follow its time shifts
+        positions = starts + n_shifts
+        tokens[positions[is_bar]] = self.bar_token
+        positions += is_bar
+        if self.bars:
+            # Find the bar each position token falls in, by sorting the
+            # positions together with the bar starts
+            times = steps[needs_position]/float(self.fs)
+            position_files = file_ids[needs_position]
+            n_bars = bar_starts.shape[0]
+            is_position = np.append(np.zeros(n_bars, dtype=bool),
+                                    np.ones(times.shape[0], dtype=bool))
+            order = np.lexsort((is_position, np.append(bar_starts, times),
+                                np.append(bar_file_ids, position_files)))
+            latest = np.maximum.accumulate(
+                np.where(is_position[order], -1, order))
+            bars = np.empty(times.shape[0], dtype=int)
+            bars[order[is_position[order]] - n_bars] = \
+                latest[is_position[order]]
+            # Positions before the first bar of their file are at 0
+            in_bar = bars >= 0
+            in_bar[in_bar] = bar_file_ids[bars[in_bar]] == \
+                position_files[in_bar]
+            bar_positions = np.zeros(times.shape[0])
+            bar_positions[in_bar] = np.floor(
+                (times[in_bar] - bar_starts[bars[in_bar]]) /
+                bar_lengths[bars[in_bar]]*self.n_positions)
+            tokens[positions[needs_position]] = (
+                self.position_offset +
+                np.clip(bar_positions, 0, self.n_positions - 1).astype(int))
+        positions += needs_position
+        tokens[positions[needs_velocity]] = (self.velocity_offset +
+                                             bins[needs_velocity])
+        positions += needs_velocity
+        tokens[positions[is_on]] = self.note_on_offset + pitches[is_on]
+        is_off = kinds == _NOTE_OFF
+        tokens[positions[is_off]] = self.note_off_offset + pitches[is_off]
+        # Split the tokens between files
+        file_ends = np.cumsum(np.bincount(file_ids, weights=n_tokens,
+                                          minlength=n_files)).astype(int)
+        return np.split(tokens, file_ends[:-1])
+
+    def encode(self, midi_data):
+        """Converts MIDI data to a sequence of tokens.
+
+        All (non-drum, unless ``include_drums``) instruments are merged.
+
+        Parameters
+        ----------
+        midi_data : pretty_midi.PrettyMIDI
+            MIDI data to encode.
+
+        Returns
+        -------
+        tokens : np.ndarray
+            Integer token sequence.
+
+        """
+        return self.encode_batch([midi_data])[0]
+
+    def encode_batch(self, midis):
+        """Converts the MIDI data of several files to token sequences.
+
+        The events of all files are sorted and converted together, which is
+        much faster than encoding each file separately when the files are
+        small.
+
+        Parameters
+        ----------
+        midis : list of pretty_midi.PrettyMIDI
+            MIDI data to encode.
+
+        Returns
+        -------
+        tokens : list of np.ndarray
+            Integer token sequence of each file.
+
+        """
+        events = [self._get_events(midi_data) for midi_data in midis]
+        if len(events) == 0:
+            return []
+        file_ids = np.concatenate(
+            [np.full(e[0].shape[0], n, dtype=int)
+             for n, e in enumerate(events)])
+        bar_file_ids = np.concatenate(
+            [np.full(e[4].shape[0], n, dtype=int)
+             for n, e in enumerate(events)])
+        steps, kinds, pitches, velocities, bar_starts, bar_lengths = [
+            np.concatenate([e[n] for e in events]) for n in range(6)]
+        return self._encode(len(midis), file_ids, steps, kinds, pitches,
+                            velocities, bar_file_ids, bar_starts, bar_lengths)
+
+    def decode(self, tokens, program=0):
+        """Converts a sequence of tokens back to MIDI data.
+
+        Each note-on is ended by the next note-off of the same pitch, or at
+        the time of the last token if there is none.  Bar and position tokens
+        are ignored.
+
+        Parameters
+        ----------
+        tokens : np.ndarray
+            Integer token sequence, as returned by :func:`encode`.
+        program : int
+            Program number of the single instrument holding the notes.
+
+        Returns
+        -------
+        midi_data : pretty_midi.PrettyMIDI
+            The decoded MIDI data.
+
+        """
+        tokens = np.asarray(tokens, dtype=int)
+        is_shift = ((tokens >= self.time_shift_offset) &
+                    (tokens < self.velocity_offset))
+        shifts = np.where(is_shift, tokens - self.time_shift_offset + 1, 0)
+        steps = np.cumsum(shifts)
+        # The velocity of each note-on is given by the latest velocity token
+        is_velocity = ((tokens >= self.velocity_offset) &
+                       (tokens < self.bar_token))
+        latest = np.maximum.accumulate(
+            np.where(is_velocity, np.arange(tokens.shape[0]), -1))
+        # Velocities are decoded to the middle of their bin
+        bin_velocities = np.clip(
+            ((np.arange(self.n_velocities) + .5)*128/self.n_velocities
+             ).astype(int), 1, 127)
+        ons = np.flatnonzero((tokens >= self.note_on_offset) &
+                             (tokens < self.note_on_offset + 128))
+        offs = np.flatnonzero((tokens >= self.note_off_offset) &
+                              (tokens < self.note_off_offset + 128))
+        on_pitches = tokens[ons] - self.note_on_offset
+        off_pitches = tokens[offs] - self.note_off_offset
+        velocities = np.where(
+            latest[ons] >= 0,
+            bin_velocities[np.clip(tokens[latest[ons]] - self.velocity_offset,
+                                   0, self.n_velocities - 1)], 64)
+        # Match each note-on to the next note-off of the same pitch by
+        # searching keys ordered by pitch then token index
+        n_tokens = tokens.shape[0]
+        off_keys = np.sort(off_pitches*n_tokens + offs)
+        matches = np.searchsorted(off_keys, on_pitches*n_tokens + ons)
+        matched = np.zeros(ons.shape[0], dtype=bool)
+        in_bounds = matches < off_keys.shape[0]
+        matched[in_bounds] = (off_keys[matches[in_bounds]]//n_tokens ==
+                              on_pitches[in_bounds])
+        end_steps = np.full(ons.shape[0], steps[-1] if n_tokens else 0)
+        end_steps[matched] = steps[off_keys[matches[matched]] % n_tokens]
+        start_steps = steps[ons]
+        end_steps = np.maximum(end_steps, start_steps + 1)
+
+        midi_data = PrettyMIDI()
+        instrument = Instrument(program)
+        instrument.notes.extend(
+            Note(int(velocity), int(pitch), start/float(self.fs),
+                 end/float(self.fs))
+            for velocity, pitch, start, end in zip(
+                velocities, on_pitches, start_steps, end_steps))
+        midi_data.instruments.append(instrument)
+        return midi_data
@@ -581,3 +581,118 @@ def semitones_to_pitch_bend(semitones, semitone_range=2.):
 
     """
     return int(8192*(semitones/semitone_range))
+
+
+def _fold_inter_onset_intervals(ioi):
+    """Keep the inter-onset intervals which carry rhythmic information and
+    fold them by octaves into the range of .2s to 2s (30 to 300 bpm).
+
+    Parameters
+    ----------
+    ioi : np.ndarray
+        Inter-onset intervals, in seconds.
+
+    Returns
+    -------
+    ioi : np.ndarray
+        Intervals in ``(.05, 2)``, doubled until they are at least ``.2``.
+
+    """
+    # "Rhythmic information is provided by IOIs in the range of
+    # approximately 50ms to 2s (Handel, 1989)"
+    ioi = ioi[(ioi > .05) & (ioi < 2)]
+    # Normalize all iois into the range 30...300bpm.  Every interval is
+    # larger than .05, so this takes at most two passes.
+    short = ioi < .2
+    while short.any():
+        ioi[short] *= 2
+        short = ioi < .2
+    return ioi
+
+
+def _cluster_inter_onset_intervals(ioi):
+    """Cluster inter-onset intervals online, as described in "Automatic
+    Extraction of Tempo and Beat from Expressive Performance", Dixon 2001.
+
+    Parameters
+    ----------
+    ioi : np.ndarray
+        Folded inter-onset intervals, in the order they occur.
+
+    Returns
+    -------
+    tempos : np.ndarray
+        Array of estimated tempos, in beats per minute.
+    probabilities : np.ndarray
+        Array of the probabilities of each tempo estimate.
+
+    """
+    # There can never be more clusters than intervals, so allocate storage
+    # for cluster means and counts once and only use the first n_clusters
+    clusters = np.zeros(ioi.shape[0])
+    cluster_counts = np.zeros(ioi.shape[0])
+    n_clusters = 0
+    for interval in ioi:
+        current_clusters = clusters[:n_clusters]
+        # If this ioi falls within a cluster (threshold is 25ms)
+        if (np.abs(current_clusters - interval) < .025).any():
+            k = np.argmin(current_clusters - interval)
+            # Update cluster mean
+            clusters[k] = (cluster_counts[k]*clusters[k] +
+                           interval)/(cluster_counts[k] + 1)
+            # Update number of elements in cluster
+            cluster_counts[k] += 1
+        # No cluster is close, make a new one
+        else:
+            clusters[n_clusters] = interval
+            cluster_counts[n_clusters] = 1.
+            n_clusters += 1
+    clusters = clusters[:n_clusters]
+    cluster_counts = cluster_counts[:n_clusters]
+    # Sort the cluster list by count
+    cluster_sort = np.argsort(cluster_counts)[::-1]
+    clusters = clusters[cluster_sort]
+    cluster_counts = cluster_counts[cluster_sort]
+    # Normalize the cluster scores
+    cluster_counts /= cluster_counts.sum()
+    return 60./clusters, cluster_counts
+
+
+def estimate_tempi_batch(onsets):
+    """Estimate tempos and their probabilities for many onset arrays at once,
+    as in :func:`pretty_midi.PrettyMIDI.estimate_tempi`.
+
+    Parameters
+    ----------
+    onsets : list of np.ndarray
+        Sorted onset times, in seconds, of each MIDI file (e.g. as returned by
+        :func:`pretty_midi.PrettyMIDI.get_onsets`).
+
+    Returns
+    -------
+    tempi : list of tuple
+        For each onset array, a tuple ``(tempos, probabilities)`` of estimated
+        tempos in beats per minute and the probability of each tempo.
+
+    """
+    onsets = [np.asarray(o, dtype=np.float64).ravel() for o in onsets]
+    if len(onsets) == 0:
+        return []
+    # Compute inter-onset intervals of all files in one pass, then discard
+    # the intervals which span the boundary between two files
+    ioi = np.diff(np.concatenate(onsets))
+    lengths = np.array([o.shape[0] for o in onsets])
+    boundaries = np.cumsum(lengths)[:-1] - 1
+    file_ids = np.repeat(np.arange(len(onsets)), lengths)[:-1]
+    keep = np.ones(ioi.shape[0], dtype=bool)
+    keep[boundaries[(boundaries >= 0) &
+                    (boundaries < ioi.shape[0])]] = False
+    ioi, file_ids = ioi[keep], file_ids[keep]
+    # Filter and fold every file's intervals together
+    in_range = (ioi > .05) & (ioi < 2)
+    ioi = _fold_inter_onset_intervals(ioi)
+    file_ids = file_ids[in_range]
+    # Clustering is sequential, so it is done separately for each file
+    splits = np.searchsorted(file_ids, np.arange(1, len(onsets)))
+    return [_cluster_inter_onset_intervals(file_ioi)
+            for file_ioi in np.split(ioi, splits)]
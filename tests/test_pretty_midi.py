@@ -1,6 +1,9 @@
+import copy
+import pickle
 import pretty_midi
 import numpy as np
 import mido
+import pytest
 from tempfile import NamedTemporaryFile
 
 
@@ -397,6 +400,23 @@ def test_estimate_tempi():
     assert tempi[0] == pm.estimate_tempo()
 
 
+def test_estimate_beat_start():
+    pm = pretty_midi.PrettyMIDI()
+    inst = pretty_midi.Instrument(0)
+    pm.instruments.append(inst)
+    # A quiet pickup note which is off the beat grid
+    inst.notes.append(pretty_midi.Note(pitch=40, velocity=20, start=.1,
+                                       end=.2))
+    # Notes on a 120 bpm grid, starting at .25 seconds
+    for start in np.arange(.25, 10., .5):
+        inst.notes.append(pretty_midi.Note(pitch=40, velocity=100, start=start,
+                                           end=start + .1))
+    assert np.allclose(pm.estimate_beat_start(), .25)
+    # Without any notes, the beat start can't be estimated
+    with pytest.raises(ValueError):
+        pretty_midi.PrettyMIDI().estimate_beat_start()
+
+
 def test_get_onsets():
     pm = pretty_midi.PrettyMIDI()
     inst = pretty_midi.Instrument(0)
@@ -406,6 +426,47 @@ def test_get_onsets():
         inst.notes.append(pretty_midi.Note(pitch=40, velocity=100, start=start,
                                            end=start + .1))
     assert np.allclose(pm.get_onsets(), onsets)
+    # Onsets are cached until the notes change
+    assert pm.get_onsets() is pm.get_onsets()
+    assert inst.get_onsets() is inst.get_onsets()
+    inst.notes.append(pretty_midi.Note(pitch=40, velocity=100, start=.1,
+                                       end=.2))
+    assert np.allclose(pm.get_onsets(), np.append(.1, onsets))
+    # In-place edits of notes also invalidate the cache
+    inst.notes[-1].start = 10.
+    assert np.allclose(inst.get_onsets(), np.append(onsets, 10.))
+    # Onsets of all instruments are merged
+    other = pretty_midi.Instrument(0)
+    other.notes = [pretty_midi.Note(pitch=40, velocity=100, start=1.,
+                                    end=1.1)]
+    pm.instruments.append(other)
+    assert np.allclose(pm.get_onsets(), np.sort(np.append(onsets, [1., 10.])))
+    del pm.instruments[0]
+    assert np.allclose(pm.get_onsets(), [1.])
+
+
+def test_get_pitch_class_transition_matrix():
+    inst = pretty_midi.Instrument(0)
+    # C, E, G played in sequence, then a chord of D and F far away in time
+    for pitch, start in [(60, 0.), (64, 1.), (67, 2.), (62, 10.), (65, 10.)]:
+        inst.notes.append(pretty_midi.Note(100, pitch, start, start + 1.))
+    transitions = inst.get_pitch_class_transition_matrix()
+    expected = np.zeros((12, 12))
+    expected[0, 4] = 1
+    expected[4, 7] = 1
+    assert np.array_equal(transitions, expected)
+    # A larger threshold also relates notes which end after the next starts
+    inst.notes.append(pretty_midi.Note(100, 69, 1.9, 2.1))
+    transitions = inst.get_pitch_class_transition_matrix(time_thresh=.15)
+    expected[4, 9] = 1
+    expected[9, 7] = 1
+    assert np.array_equal(transitions, expected)
+    # The result should not depend on the order of the notes
+    inst.notes.reverse()
+    assert np.array_equal(
+        inst.get_pitch_class_transition_matrix(time_thresh=.15), expected)
+    assert np.allclose(inst.get_pitch_class_transition_matrix(
+        normalize=True, time_thresh=.15).sum(), 1.)
 
 
 def test_get_piano_roll_and_get_chroma():
@@ -496,3 +557,717 @@ def test_synthesize():
     # Should be normalied
     assert (np.allclose(synthesized.max(), 1) or
             np.allclose(synthesized.min(), -1))
+    # Synthesizing instruments in parallel gives the same mix
+    assert np.array_equal(pm.synthesize(fs=fs, workers=2), synthesized)
+    # A pitch bend changes the frequency without a phase discontinuity
+    inst = pretty_midi.Instrument(0)
+    inst.notes.append(pretty_midi.Note(pitch=69, velocity=100, start=0.,
+                                       end=1.))
+    inst.pitch_bends.append(pretty_midi.PitchBend(4096, .5))
+    multiplier = np.where(np.arange(fs) < fs/2, 1., 2**(1/12.))
+    phase = 2*np.pi*440./fs*np.append(0, np.cumsum(multiplier)[:-1])
+    envelope = 100*np.exp(-np.arange(fs)/float(fs))
+    envelope[-fs//10:] *= np.linspace(1, 0, fs//10)
+    assert np.allclose(inst.synthesize(fs=fs)[:fs], envelope*np.sin(phase))
+
+
+def test_synthesize_blocks():
+    pm = pretty_midi.PrettyMIDI()
+    assert list(pm.synthesize_blocks()) == []
+    for pitch, start, end in [(40, .1, 1.1), (60, .5, 1.3), (64, .2, .21)]:
+        inst = pretty_midi.Instrument(0)
+        inst.notes.append(pretty_midi.Note(100, pitch, start, end))
+        pm.instruments.append(inst)
+    pm.instruments[0].pitch_bends.append(pretty_midi.PitchBend(2000, .6))
+    pm.instruments[0].pitch_bends.append(pretty_midi.PitchBend(-500, .8))
+    pm.instruments.append(pretty_midi.Instrument(0, is_drum=True))
+    fs = 10000
+    for inst in pm.instruments:
+        blocks = list(inst.synthesize_blocks(fs=fs, block_size=1000))
+        assert all(block.shape[0] == 1000 for block in blocks[:-1])
+        synthesized = inst.synthesize(fs=fs)
+        assert np.allclose(np.concatenate(blocks), synthesized,
+                           atol=1e-6*np.abs(synthesized).max())
+    synthesized = np.concatenate(list(pm.synthesize_blocks(fs=fs)))
+    assert np.allclose(synthesized/np.abs(synthesized).max(),
+                       pm.synthesize(fs=fs))
+    # Synthesizing a time range gives the same samples as synthesizing
+    # everything, including notes which started before it
+    for inst in pm.instruments:
+        synthesized = inst.synthesize(fs=fs)
+        window = inst.synthesize(fs=fs, start=.65, duration=.3)
+        assert np.allclose(window, synthesized[6500:9500],
+                           atol=1e-6*np.abs(synthesized).max())
+    synthesized = np.concatenate(list(pm.synthesize_blocks(fs=fs)))
+    window = pm.synthesize(fs=fs, start=1.2)
+    assert np.allclose(window, synthesized[12000:] /
+                       np.abs(synthesized[12000:]).max())
+    assert pm.synthesize(fs=fs, start=10.).size == 0
+    # Wavetable synthesis only differs by the interpolation error
+    assert np.allclose(pm.synthesize(fs=fs, wavetable_size=4096),
+                       pm.synthesize(fs=fs), atol=1e-5)
+    # Single precision synthesis only differs by rounding error
+    for wavetable_size in [None, 4096]:
+        single = pm.synthesize(fs=fs, wavetable_size=wavetable_size,
+                               dtype=np.float32)
+        assert single.dtype == np.float32
+        assert np.allclose(single, pm.synthesize(fs=fs), atol=1e-4)
+    blocks = list(pm.synthesize_blocks(fs=fs, start=.65, dtype=np.float32))
+    assert all(block.dtype == np.float32 for block in blocks)
+
+
+def test_memoization():
+    pm = pretty_midi.PrettyMIDI()
+    inst = pretty_midi.Instrument(0)
+    inst.notes.append(pretty_midi.Note(100, 60, 0., 1.))
+    pm.instruments.append(inst)
+    # Piano rolls are only memoized when large results are cached
+    assert pm.get_piano_roll() is not pm.get_piano_roll()
+    assert not hasattr(pm, '_cache')
+    pm.cache_large_results = True
+    roll = pm.get_piano_roll()
+    assert pm.get_end_time() == 1.
+    # Results are memoized per argument, but callers get their own copy
+    roll[:] = 0
+    assert pm.get_piano_roll().sum() == 100*100
+    assert pm.get_piano_roll(fs=10).shape == (128, 10)
+    # Adding events, editing events and editing instruments are all seen
+    inst.notes.append(pretty_midi.Note(100, 62, 1., 2.))
+    assert pm.get_end_time() == 2.
+    inst.notes[-1].end = 3.
+    assert pm.get_end_time() == 3.
+    assert inst.get_end_time() == 3.
+    inst.is_drum = True
+    assert pm.get_piano_roll().sum() == 0
+    pm.instruments = []
+    assert pm.get_piano_roll().shape == (128, 0)
+    # Meta-events and tempo changes invalidate beats
+    pm.instruments.append(pretty_midi.Instrument(0))
+    pm.instruments[0].notes.append(pretty_midi.Note(100, 60, 0., 4.))
+    assert np.allclose(pm.get_downbeats(), [0., 2.])
+    pm.time_signature_changes.append(pretty_midi.TimeSignature(2, 4, 0.))
+    assert np.allclose(pm.get_downbeats(), [0., 1., 2., 3.])
+    pm.time_signature_changes[0].numerator = 1
+    assert np.allclose(pm.get_downbeats(), np.arange(0., 4., .5))
+    pm._tick_scales.append((pm.time_to_tick(2.), 60./(60.*pm.resolution)))
+    pm._update_tick_to_time(pm.time_to_tick(pm.get_end_time()))
+    assert np.allclose(pm.get_beats(), [0., .5, 1., 1.5, 2., 3.])
+    # The cache size bounds the number of stored results
+    pm.cache_size = 2
+    for fs in [10, 20, 30]:
+        pm.get_piano_roll(fs=fs)
+    assert len(pm._cache) == 2
+    pm.clear_cache()
+    assert not hasattr(pm, '_cache')
+    # Edits only invalidate the results of the object holding the edited
+    # event, unless it is held by several objects
+    other = pretty_midi.Instrument(0)
+    other.notes.append(pretty_midi.Note(100, 60, 0., 1.))
+    inst = pm.instruments[0]
+    version = inst._get_version()
+    other.notes[0].end = 2.
+    assert inst._get_version() == version
+    inst.notes.append(other.notes[0])
+    version = inst._get_version()
+    other.notes[0].end = 5.
+    assert inst._get_version() != version
+    assert inst.get_end_time() == 5.
+    # Copies are held by the lists they are copied with
+    copied = copy.deepcopy(pm)
+    version = pm._get_version()
+    copied.instruments[0].notes[0].end = 6.
+    assert pm._get_version() == version
+    assert copied.get_end_time() == 6.
+    # A list replaced on one object still invalidates another holding it
+    first, second = pretty_midi.Instrument(0), pretty_midi.Instrument(0)
+    first.notes.append(pretty_midi.Note(100, 60, 0., 1.))
+    second.notes = first.notes
+    first.notes = []
+    assert second.get_end_time() == 1.
+    second.notes[0].end = 100.
+    assert second.get_end_time() == 100.
+    # Unpickled lists get new version stamps
+    unpickled = pickle.loads(pickle.dumps(second))
+    assert unpickled.notes.version != second.notes.version
+    assert unpickled.get_end_time() == 100.
+
+
+def test_get_notes_at_and_in_range():
+    pm = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(0)
+    bass = pretty_midi.Instrument(33)
+    pm.instruments.extend([piano, bass])
+    # Enough notes that the index has internal nodes as well as leaves
+    for n in range(100):
+        piano.notes.append(pretty_midi.Note(100, 60 + n % 12, n*.5, n*.5 + 1))
+    bass.notes.append(pretty_midi.Note(100, 36, 0., 50.))
+    bass.notes.append(pretty_midi.Note(100, 38, 10., 10.))
+    # Notes sound from their start up to, but not including, their end
+    assert piano.get_notes_at(10.) == [piano.notes[19], piano.notes[20]]
+    assert pm.get_notes_at(10.) == [(piano, piano.notes[19]),
+                                    (piano, piano.notes[20]),
+                                    (bass, bass.notes[0])]
+    assert pm.get_notes_at(50.) == [(piano, piano.notes[99])]
+    assert pm.get_notes_at(-1.) == []
+    assert piano.get_notes_in_range(10., 11.) == piano.notes[19:22]
+    # Zero-length notes only overlap ranges which strictly contain them
+    assert bass.get_notes_in_range(9., 11.) == bass.notes
+    assert bass.get_notes_in_range(10., 11.) == bass.notes[:1]
+    assert pm.get_notes_in_range(60., 70.) == []
+    # The index is rebuilt when notes change
+    piano.notes[0].end = 20.
+    assert piano.get_notes_at(10.) == [piano.notes[0], piano.notes[19],
+                                       piano.notes[20]]
+    del bass.notes[0]
+    assert len(pm.get_notes_at(10.)) == 3
+
+
+def test_slice():
+    pm = pretty_midi.PrettyMIDI()
+    # Switch from 120 to 60 bpm at 5 seconds
+    pm._tick_scales.append((pm.time_to_tick(5.), 60./(60.*pm.resolution)))
+    pm._update_tick_to_time(pm.time_to_tick(20.))
+    pm.time_signature_changes.append(pretty_midi.TimeSignature(3, 4, 0.))
+    pm.key_signature_changes.append(pretty_midi.KeySignature(2, 1.))
+    pm.lyrics.append(pretty_midi.Lyric('la', 7.))
+    piano = pretty_midi.Instrument(0, name='piano')
+    pm.instruments.extend([piano, pretty_midi.Instrument(33)])
+    piano.notes.append(pretty_midi.Note(100, 60, 1., 3.))
+    piano.notes.append(pretty_midi.Note(100, 62, 4., 7.))
+    piano.notes.append(pretty_midi.Note(100, 64, 6.5, 7.5))
+    piano.pitch_bends.append(pretty_midi.PitchBend(1000, 2.))
+    piano.control_changes.append(pretty_midi.ControlChange(64, 127, 3.))
+    piano.control_changes.append(pretty_midi.ControlChange(7, 90, 6.))
+    sliced = pm.slice(4.5, 8.)
+    # All instruments are kept, even if they have no notes in the range
+    assert [i.program for i in sliced.instruments] == [0, 33]
+    assert sliced.instruments[0].name == 'piano'
+    # Notes are truncated to the range and shifted to start at 0
+    assert [(n.pitch, n.start, n.end) for n in sliced.instruments[0].notes] \
+        == [(62, 0., 2.5), (64, 2., 3.)]
+    # The state at the start of the range is carried over
+    assert [(b.pitch, b.time) for b in sliced.instruments[0].pitch_bends] \
+        == [(1000, 0.)]
+    assert sorted((c.number, c.value, c.time)
+                  for c in sliced.instruments[0].control_changes) == \
+        [(7, 90, 1.5), (64, 127, 0.)]
+    assert [(t.numerator, t.time) for t in sliced.time_signature_changes] \
+        == [(3, 0.)]
+    assert [(k.key_number, k.time) for k in sliced.key_signature_changes] \
+        == [(2, 0.)]
+    assert [(lyric.text, lyric.time) for lyric in sliced.lyrics] == \
+        [('la', 2.5)]
+    tempo_change_times, tempi = sliced.get_tempo_changes()
+    assert np.allclose(tempo_change_times, [0., .5])
+    assert np.allclose(tempi, [120., 60.])
+    # Without rebasing, times are unchanged and events which lie within the
+    # range are shared
+    sliced = pm.slice(4.5, 8., rebase=False)
+    assert sliced.instruments[0].notes[1] is piano.notes[2]
+    assert sliced.instruments[0].notes[0].start == 4.5
+    assert piano.notes[1].start == 4.
+    assert sliced.lyrics[0] is pm.lyrics[0]
+    assert np.allclose(sliced.get_tempo_changes()[0], [0., 5.])
+    assert pm.slice(30., 40.).get_end_time() == 0.
+
+
+def test_slice_boundary():
+    # Events exactly at the start of the range replace the state carried
+    # over from before it, rather than being added alongside it
+    pm = pretty_midi.PrettyMIDI()
+    pm.time_signature_changes.append(pretty_midi.TimeSignature(4, 4, 0.))
+    pm.time_signature_changes.append(pretty_midi.TimeSignature(3, 4, 2.))
+    pm.lyrics.append(pretty_midi.Lyric('la', 2.))
+    piano = pretty_midi.Instrument(0)
+    pm.instruments.append(piano)
+    piano.notes.append(pretty_midi.Note(100, 60, 1., 3.))
+    piano.pitch_bends.append(pretty_midi.PitchBend(1000, 1.))
+    piano.pitch_bends.append(pretty_midi.PitchBend(0, 2.))
+    piano.control_changes.append(pretty_midi.ControlChange(64, 127, 1.))
+    piano.control_changes.append(pretty_midi.ControlChange(7, 90, 1.))
+    piano.control_changes.append(pretty_midi.ControlChange(64, 0, 2.))
+    sliced = pm.slice(2., 4.)
+    assert [(t.numerator, t.time) for t in sliced.time_signature_changes] \
+        == [(3, 0.)]
+    assert [(b.pitch, b.time) for b in sliced.instruments[0].pitch_bends] \
+        == [(0, 0.)]
+    assert sorted((c.number, c.value, c.time)
+                  for c in sliced.instruments[0].control_changes) == \
+        [(7, 90, 0.), (64, 0, 0.)]
+    # Lyrics are not carried over, so those at the start are kept
+    assert [(lyric.text, lyric.time) for lyric in sliced.lyrics] == \
+        [('la', 0.)]
+    # The pedal is still released after writing and reading the slice
+    with NamedTemporaryFile() as file:
+        sliced.write(file)
+        file.seek(0)
+        reloaded = pretty_midi.PrettyMIDI(file)
+    assert sorted((c.number, c.value, c.time)
+                  for c in reloaded.instruments[0].control_changes) == \
+        [(7, 90, 0.), (64, 0, 0.)]
+
+
+def test_iter_segments():
+    pm = pretty_midi.PrettyMIDI()
+    inst = pretty_midi.Instrument(0)
+    for n in range(10):
+        inst.notes.append(pretty_midi.Note(100, 60 + n, n, n + 1.5))
+    pm.instruments.append(inst)
+    piano_roll = pm.get_piano_roll(fs=10)
+    chroma = pm.get_chroma(fs=10)
+    segments = list(pm.iter_segments(4., 2., fs=10))
+    assert [s['start'] for s in segments] == [0., 2., 4., 6., 8., 10.]
+    for segment in segments:
+        first = int(segment['start']*10)
+        # All windows in seconds have the same number of columns
+        assert segment['piano_roll'].shape == (128, 40)
+        assert segment['chroma'].shape == (12, 40)
+        assert np.all(segment['piano_roll'][:, :piano_roll.shape[1] - first]
+                      == piano_roll[:, first:first + 40])
+        assert np.all(segment['chroma'][:, :chroma.shape[1] - first]
+                      == chroma[:, first:first + 40])
+        assert segment['notes'] == pm.get_notes_in_range(segment['start'],
+                                                         segment['end'])
+    # The last window is padded with zeros past the end of the file
+    assert not np.any(segments[-1]['piano_roll'][:, 5:])
+    # At 120 bpm in 4/4, bars are 2 seconds long
+    segments = list(pm.iter_segments(2, unit='downbeats', fs=10))
+    assert [(s['start'], s['end']) for s in segments] == \
+        [(0., 4.), (4., 8.), (8., 10.5)]
+    assert segments[-1]['piano_roll'].shape == (128, 25)
+    segments = list(pm.iter_segments(3, 1, unit='beats'))
+    assert len(segments) == 21
+    assert segments[-1]['end'] == pm.get_end_time()
+    with pytest.raises(ValueError):
+        next(pm.iter_segments(1, unit='bars'))
+    with pytest.raises(ValueError):
+        next(pm.iter_segments(1.5, unit='beats'))
+    assert list(pretty_midi.PrettyMIDI().iter_segments(1.)) == []
+
+
+def test_event_tokenizer():
+    pm = pretty_midi.PrettyMIDI()
+    inst = pretty_midi.Instrument(0)
+    inst.notes.append(pretty_midi.Note(100, 60, 0., .5))
+    inst.notes.append(pretty_midi.Note(100, 64, .5, 3.))
+    inst.notes.append(pretty_midi.Note(40, 67, .5, 1.))
+    pm.instruments.append(inst)
+    drums = pretty_midi.Instrument(0, is_drum=True)
+    drums.notes.append(pretty_midi.Note(100, 36, 0., .1))
+    pm.instruments.append(drums)
+    tokenizer = pretty_midi.EventTokenizer(fs=10, max_time_shift=10,
+                                           n_velocities=4)
+    tokens = tokenizer.encode(pm)
+    assert tokens.dtype.kind == 'i'
+    assert tokens.max() < tokenizer.vocab_size
+    # Velocity bin 3, on 60, shift 5, off 60, on 64, velocity bin 1, on 67,
+    # shift 5, off 67, shift 10 + 10, off 64
+    assert list(tokens) == [269, 60, 260, 188, 64, 267, 67, 260, 195, 265,
+                            265, 192]
+    decoded = tokenizer.decode(tokens)
+    assert [(n.pitch, n.velocity, n.start, n.end)
+            for n in decoded.instruments[0].notes] == [
+        (60, 112, 0., .5), (64, 112, .5, 3.), (67, 48, .5, 1.)]
+    # Bars at 0 and 2 seconds, with positions within them
+    tokenizer = pretty_midi.EventTokenizer(fs=10, max_time_shift=10,
+                                           n_velocities=4, bars=True,
+                                           n_positions=4)
+    tokens = tokenizer.encode(pm)
+    assert list(tokens) == [270, 271, 269, 60, 260, 272, 188, 64, 267, 67,
+                            260, 273, 195, 265, 270, 265, 273, 192]
+    # Bar and position tokens don't affect decoding
+    decoded = tokenizer.decode(tokens)
+    assert [(n.start, n.end) for n in decoded.instruments[0].notes] == \
+        [(0., .5), (.5, 3.), (.5, 1.)]
+    # Encoding a batch gives the same tokens as encoding each file
+    batch = [pm, pretty_midi.PrettyMIDI(), decoded]
+    for tokens, midi_data in zip(tokenizer.encode_batch(batch), batch):
+        assert np.array_equal(tokens, tokenizer.encode(midi_data))
+
+
+def test_note_table(tmpdir):
+    midis = []
+    for n in range(5):
+        pm = pretty_midi.PrettyMIDI()
+        for program in range(n % 3):
+            inst = pretty_midi.Instrument(program, is_drum=program == 1)
+            for m in range(10*n):
+                inst.notes.append(pretty_midi.Note(
+                    m + 1, 30 + m, m*.25 + program, m*.25 + program + .5))
+            pm.instruments.append(inst)
+        midis.append(pm)
+    path = str(tmpdir.join('table'))
+    # Use a small chunk size so the table is split between chunks
+    with pretty_midi.NoteTableWriter(path, chunk_size=25) as writer:
+        assert [writer.add(pm) for pm in midis] == [0, 1, 2, 3, 4]
+    table = pretty_midi.NoteTable(path)
+    assert len(table) == 5
+    assert table.n_chunks == 2
+    assert sum(c['pitch'].shape[0] for c in table.iter_chunks()) == 90
+    notes = table.get_notes(2)
+    assert np.all(notes['file_id'] == 2)
+    assert list(np.unique(notes['program'])) == [0, 1]
+    for file_id, pm in enumerate(midis):
+        loaded = table.get_midi(file_id)
+        assert [(i.program, i.is_drum) for i in loaded.instruments] == \
+            [(i.program, i.is_drum) for i in pm.instruments]
+        for i, j in zip(loaded.instruments, pm.instruments):
+            assert [(n.velocity, n.pitch, n.start, n.end) for n in i.notes] \
+                == [(n.velocity, n.pitch, n.start, n.end) for n in j.notes]
+
+
+def test_piano_roll_store(tmpdir):
+    midis = []
+    for n in range(4):
+        pm = pretty_midi.PrettyMIDI()
+        inst = pretty_midi.Instrument(0)
+        for m in range(n*5):
+            inst.notes.append(
+                pretty_midi.Note(100 + m, 60 + m, m*.1, m*.1 + 1))
+        pm.instruments.append(inst)
+        midis.append(pm)
+    # Loud notes at the same time are clipped to the dtype's range
+    midis[3].instruments[0].notes.append(pretty_midi.Note(100, 60, 0., 1.))
+    midi_path = str(tmpdir.join('test.mid'))
+    midis[2].write(midi_path)
+    midis[2] = pretty_midi.PrettyMIDI(midi_path)
+    for n_jobs in [1, 2]:
+        store = pretty_midi.build_piano_roll_store(
+            str(tmpdir.join('store{}'.format(n_jobs))),
+            midis[:2] + [midi_path] + midis[3:], fs=10, pitch_range=(48, 84),
+            n_jobs=n_jobs)
+        assert len(store) == 4
+        for file_id, pm in enumerate(midis):
+            expected = np.clip(pm.get_piano_roll(fs=10)[48:84], 0, 255)
+            roll = store.get_piano_roll(file_id)
+            assert roll.dtype == np.uint8
+            assert roll.shape == expected.shape
+            assert np.all(roll == expected)
+            assert np.all(store.get_piano_roll(file_id, .5, 1.2) ==
+                          expected[:, 5:12])
+            assert np.all(store.get_piano_roll(file_id, start=1.) ==
+                          expected[:, 10:])
+    # The store can be opened again later
+    store = pretty_midi.PianoRollStore(str(tmpdir.join('store1')))
+    assert store.fs == 10
+    assert store.pitch_range == (48, 84)
+    assert store.get_piano_roll(0).shape == (36, 0)
+
+
+def test_iter_events():
+    pm = pretty_midi.PrettyMIDI()
+    pm.time_signature_changes.append(pretty_midi.TimeSignature(3, 4, 0.))
+    pm.lyrics.append(pretty_midi.Lyric('la', 1.))
+    piano = pretty_midi.Instrument(0)
+    piano.notes.append(pretty_midi.Note(90, 62, 1., 2.))
+    piano.notes.append(pretty_midi.Note(80, 60, 0., 1.))
+    piano.control_changes.append(pretty_midi.ControlChange(64, 127, 1.))
+    bass = pretty_midi.Instrument(33)
+    bass.notes.append(pretty_midi.Note(70, 36, .5, 1.5))
+    bass.pitch_bends.append(pretty_midi.PitchBend(100, 1.))
+    pm.instruments.extend([piano, bass])
+    # Events at the same time are ordered as in a written MIDI file
+    assert list(pm.iter_events()) == [
+        (0., 'set_tempo', None, 120., None),
+        (0., 'time_signature', None, 3, 4),
+        (0., 'note_on', 0, 60, 80),
+        (.5, 'note_on', 1, 36, 70),
+        (1., 'lyrics', None, 'la', None),
+        (1., 'pitchwheel', 1, 100, None),
+        (1., 'control_change', 0, 64, 127),
+        (1., 'note_off', 0, 60, 80),
+        (1., 'note_on', 0, 62, 90),
+        (1.5, 'note_off', 1, 36, 70),
+        (2., 'note_off', 0, 62, 90)]
+    assert [e[:2] for e in pm.iter_events(.5, 1.5)] == [
+        (.5, 'note_on'), (1., 'lyrics'), (1., 'pitchwheel'),
+        (1., 'control_change'), (1., 'note_off'), (1., 'note_on')]
+    assert list(piano.iter_events(start=1.)) == [
+        (1., 'control_change', 64, 127), (1., 'note_off', 60, 80),
+        (1., 'note_on', 62, 90), (2., 'note_off', 62, 90)]
+
+
+def test_fluidsynth_event_order():
+    class RecordingSynth(object):
+        """Records the events sent to it in place of a fluidsynth.Synth."""
+        def __init__(self):
+            self.events = []
+
+        def noteon(self, channel, pitch, velocity):
+            self.events.append(('note_on', pitch))
+
+        def noteoff(self, channel, pitch):
+            self.events.append(('note_off', pitch))
+
+        def pitch_bend(self, channel, pitch):
+            self.events.append(('pitchwheel', pitch))
+
+        def cc(self, channel, number, value):
+            self.events.append(('control_change', number))
+
+        def get_samples(self, n_samples):
+            return np.zeros(2*n_samples)
+
+    inst = pretty_midi.Instrument(0)
+    inst.notes.append(pretty_midi.Note(100, 62, 1., 2.))
+    inst.notes.append(pretty_midi.Note(100, 60, 0., 1.))
+    inst.control_changes.append(pretty_midi.ControlChange(7, 100, 1.))
+    inst.pitch_bends.append(pretty_midi.PitchBend(100, 1.))
+    synth = RecordingSynth()
+    events = ((time, 0, event_type, value1, value2)
+              for time, event_type, value1, value2 in inst.iter_events())
+    pretty_midi.rendering._play(synth, events, np.zeros(1500), 1500, 500, 64)
+    # Events at the same time are sent in the order of iter_events, so the
+    # note at 1 second starts with the bend and control change applied
+    assert synth.events == [
+        ('note_on', 60), ('pitchwheel', 100), ('control_change', 7),
+        ('note_off', 60), ('note_on', 62), ('note_off', 62)]
+
+
+def test_fluidsynth_renderer_reset(tmpdir, monkeypatch):
+    class ChannelSynth(object):
+        """Keeps the controller values and program of each channel, in place
+        of a fluidsynth.Synth without system_reset."""
+        def __init__(self, samplerate):
+            self.power_up()
+            # Controller values of channel 0 when each note starts
+            self.note_controllers = []
+
+        def power_up(self):
+            self.controllers = [
+                dict(pretty_midi.rendering._DEFAULT_CONTROLLERS)
+                for channel in range(16)]
+            self.programs = [0]*16
+
+        def sfload(self, path):
+            return 1
+
+        def program_select(self, channel, sfid, bank, program):
+            self.programs[channel] = program
+
+        def program_change(self, channel, program):
+            self.programs[channel] = program
+
+        def noteon(self, channel, pitch, velocity):
+            self.note_controllers.append(dict(self.controllers[channel]))
+
+        def noteoff(self, channel, pitch):
+            pass
+
+        def pitch_bend(self, channel, pitch):
+            pass
+
+        def cc(self, channel, number, value):
+            # Resetting all controllers leaves these alone
+            if number not in (120, 121, 123):
+                self.controllers[channel][number] = value
+
+        def get_samples(self, n_samples):
+            return np.zeros(2*n_samples)
+
+    class ResettableSynth(ChannelSynth):
+        def system_reset(self):
+            self.power_up()
+
+    sf2_path = str(tmpdir.join('test.sf2'))
+    open(sf2_path, 'w').close()
+    monkeypatch.setattr(pretty_midi.rendering, '_HAS_FLUIDSYNTH', True)
+    mixed = pretty_midi.Instrument(40)
+    mixed.notes.append(pretty_midi.Note(100, 60, .5, 1.))
+    for number, value in [(0, 1), (7, 20), (10, 0), (11, 50), (91, 127),
+                          (93, 127)]:
+        mixed.control_changes.append(
+            pretty_midi.ControlChange(number, value, 0.))
+    clean = pretty_midi.Instrument(0)
+    clean.notes.append(pretty_midi.Note(100, 60, .5, 1.))
+    defaults = dict(pretty_midi.rendering._DEFAULT_CONTROLLERS)
+    for synth_class in [ChannelSynth, ResettableSynth]:
+        monkeypatch.setattr(pretty_midi.rendering, 'fluidsynth',
+                            type('fluidsynth', (), {'Synth': synth_class}),
+                            raising=False)
+        renderer = pretty_midi.FluidSynthRenderer(sf2_path)
+        renderer.render_instrument(mixed, fs=1000)
+        renderer.render_instrument(clean, fs=1000)
+        # Both renders used the same synthesizer, and the second one started
+        # from the power-up state
+        synth, = renderer._synths
+        assert synth.note_controllers[0][7] == 20
+        assert synth.note_controllers[1] == defaults
+        assert synth.controllers == [defaults]*16
+        assert synth.programs == [0]*16
+
+
+def test_pretty_midi_builder():
+    pm = pretty_midi.PrettyMIDI(resolution=220)
+    pm._tick_scales.append((440, 60./(90.*220)))
+    pm._tick_scales.append((880, 60./(100.*220)))
+    pm._update_tick_to_time(10000)
+    for program, channel_pitch in [(0, 60), (40, 72)]:
+        inst = pretty_midi.Instrument(program)
+        for n in range(20):
+            inst.notes.append(pretty_midi.Note(
+                100, channel_pitch + n % 5, n*.25, n*.25 + .5))
+        inst.control_changes.append(pretty_midi.ControlChange(64, 127, 1.))
+        pm.instruments.append(inst)
+    with NamedTemporaryFile() as file:
+        pm.write(file.name)
+        midi_file = mido.MidiFile(file.name)
+        expected = pretty_midi.PrettyMIDI(file.name)
+
+    def same_notes(midi_data, expected):
+        assert [(i.program, [n.pitch for n in i.notes])
+                for i in midi_data.instruments] == \
+            [(i.program, [n.pitch for n in i.notes])
+             for i in expected.instruments]
+        for i, j in zip(midi_data.instruments, expected.instruments):
+            assert np.allclose([(n.start, n.end) for n in i.notes],
+                               [(n.start, n.end) for n in j.notes])
+        return True
+
+    # Messages with delta times in ticks, as in a MIDI file
+    builder = pretty_midi.PrettyMIDIBuilder(resolution=220)
+    messages = list(mido.merge_tracks(midi_file.tracks))
+    builder.extend(messages[:len(messages)//2])
+    assert len(builder.midi_data.instruments[0].notes) < 20
+    builder.extend(messages[len(messages)//2:])
+    midi_data = builder.midi_data
+    assert same_notes(midi_data, expected)
+    assert np.allclose(midi_data.get_tempo_changes()[1], [120., 90., 100.])
+    assert np.allclose(midi_data.get_beats(), expected.get_beats())
+    # Times are converted from the tempo changes, not a map of every tick
+    assert ([midi_data.time_to_tick(t) for t in [.5, 1.5, 3.]] ==
+            [expected.time_to_tick(t) for t in [.5, 1.5, 3.]])
+    # Messages with absolute times in seconds
+    builder = pretty_midi.PrettyMIDIBuilder()
+    ticks = np.cumsum([message.time for message in messages])
+    builder.extend(messages, [expected.tick_to_time(t) for t in ticks])
+    assert same_notes(builder.midi_data, expected)
+    with pytest.raises(ValueError):
+        builder.add(messages[-1], 0.)
+    # Only events within the retention window are kept
+    builder = pretty_midi.PrettyMIDIBuilder(retention=1.)
+    builder.extend(messages)
+    for inst in builder.midi_data.instruments:
+        assert np.allclose([n.start for n in inst.notes],
+                           [4., 4.25, 4.5, 4.75], atol=.01)
+        assert inst.control_changes == []
+    # Tempo changes before the window are merged, leaving later ticks as
+    # they were
+    midi_data = builder.midi_data
+    assert len(midi_data._tick_scales) == 2
+    assert midi_data._tick_scales[-1] == expected._tick_scales[-1]
+    assert ([midi_data.time_to_tick(t) for t in [4., 4.5, 5.]] ==
+            [expected.time_to_tick(t) for t in [4., 4.5, 5.]])
+
+
+@pytest.mark.skipif(not pretty_midi.rendering._HAS_FLUIDSYNTH,
+                    reason='pyfluidsynth is not installed')
+def test_fluidsynth_renderer():
+    pm = pretty_midi.PrettyMIDI()
+    for program, pitch in [(0, 60), (40, 67)]:
+        inst = pretty_midi.Instrument(program)
+        inst.notes.append(pretty_midi.Note(100, pitch, .1, .6))
+        inst.control_changes.append(pretty_midi.ControlChange(64, 127, .2))
+        inst.pitch_bends.append(pretty_midi.PitchBend(2000, .3))
+        pm.instruments.append(inst)
+    expected = pm.fluidsynth(fs=8000)
+    with pretty_midi.FluidSynthRenderer() as renderer:
+        # Channel state is reset between renders, so reusing the
+        # synthesizer doesn't change the output
+        for _ in range(2):
+            synthesized = renderer.render(pm, fs=8000)
+            assert np.allclose(synthesized, expected, atol=1e-3)
+        synthesized = pm.instruments[0].fluidsynth(fs=8000,
+                                                   renderer=renderer)
+        assert synthesized.shape[0] == int(np.ceil(8000*1.6))
+        # Synthesizing a time range plays the note already sounding at its
+        # start, as when synthesizing a slice
+        window = pm.instruments[0].fluidsynth(fs=8000, renderer=renderer,
+                                              start=.4, duration=.5)
+        assert window.shape[0] == 4000
+        assert np.abs(window[:1600]).max() > 0
+        assert np.allclose(window, pm.slice(.4, .9).instruments[0].fluidsynth(
+            fs=8000, renderer=renderer)[:4000])
+        # Playing the instruments on separate channels of one synthesizer
+        # is about the same as summing them
+        synthesized = renderer.render(pm, fs=8000, multichannel=True)
+        assert synthesized.shape == expected.shape
+        assert np.allclose(synthesized, expected, atol=1e-2)
+        synthesized = renderer.render(pm, fs=8000, stereo=True)
+        assert synthesized.shape == expected.shape + (2,)
+        assert np.allclose(synthesized[:, 0], expected, atol=1e-3)
+
+
+def test_render_to_wav(tmpdir):
+    scipy_wavfile = pytest.importorskip('scipy.io.wavfile')
+    pm = pretty_midi.PrettyMIDI()
+    inst = pretty_midi.Instrument(0)
+    inst.notes.append(pretty_midi.Note(100, 60, .1, .7))
+    inst.notes.append(pretty_midi.Note(80, 64, .4, 1.2))
+    pm.instruments.append(inst)
+    fs = 8000
+    expected = pm.synthesize(fs=fs)
+    unnormalized = np.concatenate(list(pm.synthesize_blocks(fs=fs)))
+    path = str(tmpdir.join('int16.wav'))
+    # By default, the output is normalized as by synthesize
+    gain = pm.render_to_wav(path, fs=fs, block_size=1000)
+    assert np.allclose(gain, 1/np.abs(unnormalized).max())
+    rate, data = scipy_wavfile.read(path)
+    assert rate == fs
+    assert data.dtype == np.int16
+    assert np.allclose(data/32767., expected, atol=1e-4)
+    path = str(tmpdir.join('float32.wav'))
+    gain = pm.render_to_wav(path, fs=fs, dtype='float32', gain=.01)
+    rate, data = scipy_wavfile.read(path)
+    assert gain == .01
+    assert data.dtype == np.float32
+    assert np.allclose(data, .01*unnormalized, atol=1e-5)
+    for method in ['synthesize', 'square']:
+        with pytest.raises(ValueError):
+            pm.render_to_wav(path, method=method)
+
+
+def test_render_corpus(tmpdir):
+    scipy_wavfile = pytest.importorskip('scipy.io.wavfile')
+    midi_paths = []
+    for n in range(3):
+        pm = pretty_midi.PrettyMIDI()
+        inst = pretty_midi.Instrument(0)
+        inst.notes.append(pretty_midi.Note(100, 60 + n, .1, .5 + n*.1))
+        pm.instruments.append(inst)
+        midi_paths.append(str(tmpdir.join('{}.mid'.format(n))))
+        pm.write(midi_paths[-1])
+    broken_path = str(tmpdir.join('broken.mid'))
+    with open(broken_path, 'wb') as f:
+        f.write(b'not a MIDI file')
+    missing_path = str(tmpdir.join('missing.mid'))
+    path = str(tmpdir.join('audio'))
+    for n_jobs in [1, 2]:
+        records = pretty_midi.render_corpus(
+            midi_paths + [broken_path, missing_path], path, method='sine',
+            fs=8000, n_jobs=n_jobs)
+        records = dict((record['output'], record) for record in records)
+        # Only the broken and missing files are rendered again
+        if n_jobs == 1:
+            assert sorted(records) == ['0.wav', '1.wav', '2.wav',
+                                       'broken.wav', 'missing.wav']
+        else:
+            assert sorted(records) == ['broken.wav', 'missing.wav']
+        assert records['broken.wav']['error'] is not None
+        assert records['missing.wav']['error'] is not None
+        assert all(record['time'] >= 0 for record in records.values())
+    for n, midi_path in enumerate(midi_paths):
+        rate, data = scipy_wavfile.read(
+            str(tmpdir.join('audio', '{}.wav'.format(n))))
+        expected = pretty_midi.PrettyMIDI(midi_path).synthesize(fs=8000)
+        assert rate == 8000
+        assert np.allclose(data/32767., expected, atol=1e-4)
+    # Changing a file or the settings renders it again
+    pm.instruments[0].notes[0].pitch = 72
+    pm.write(midi_paths[2])
+    records = pretty_midi.render_corpus(midi_paths, path,
+                                        method='sine', fs=8000)
+    assert [record['output'] for record in records] == ['2.wav']
+    records = pretty_midi.render_corpus(midi_paths, path,
+                                        method='sine', fs=4000)
+    assert len(records) == 3
@@ -1,4 +1,5 @@
 import pretty_midi
+import numpy as np
 import pytest
 
 
@@ -75,3 +76,24 @@ def test_qpm_to_bpm():
     for den in [-1, 0, 4.3, 'invalid']:
         with pytest.raises(ValueError):
             pretty_midi.qpm_to_bpm(qpm, num, den)
+
+
+def test_estimate_tempi_batch():
+    # Onsets at 120 bpm and at 180 bpm, plus files with too few onsets
+    onsets = [np.arange(0, 10, .5), np.arange(0, 10, 1/3.), np.array([]),
+              np.array([1.])]
+    tempi = pretty_midi.estimate_tempi_batch(onsets)
+    assert len(tempi) == 4
+    assert np.allclose(tempi[0][0][0], 120.)
+    assert np.allclose(tempi[1][0][0], 180.)
+    assert tempi[2][0].size == 0 and tempi[3][0].size == 0
+    # Results should match estimating each file separately
+    for file_onsets, (tempos, probabilities) in zip(onsets, tempi):
+        pm = pretty_midi.PrettyMIDI()
+        inst = pretty_midi.Instrument(0)
+        pm.instruments.append(inst)
+        for onset in file_onsets:
+            inst.notes.append(pretty_midi.Note(100, 40, onset, onset + .1))
+        expected_tempos, expected_probabilities = pm.estimate_tempi()
+        assert np.allclose(tempos, expected_tempos)
+        assert np.allclose(probabilities, expected_probabilities)